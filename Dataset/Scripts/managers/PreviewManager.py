@@ -0,0 +1,115 @@
+import os
+import shutil
+import subprocess
+import cv2
+
+
+class PreviewManager:
+    """
+    Encodes a downscaled preview video of the front camera of each POV while the scenario is simulated. Frames are
+    taken from the camera buffers when the data dumpers save their images, so the videos are ready when the scenario
+    ends, without the saved PNGs being decoded again by generate_video.py. Frames are piped to an ffmpeg process when
+    ffmpeg is available, so encoding runs in parallel with the simulation, and are encoded with cv2.VideoWriter
+    otherwise.
+
+    Parameters
+    ----------
+    video_folder : os.path
+        Folder where the videos are saved.
+    label : str
+        Scenario label, used in the video names.
+    scale : float
+        Scale factor applied to the camera images.
+    fps : int
+        Frame rate of the videos.
+
+    Attributes
+    ----------
+    encoders : dict
+        ffmpeg processes (subprocess.Popen) or cv2.VideoWriters of each POV, keyed by POV id.
+    """
+    def __init__(self, video_folder, label, scale, fps):
+        self.video_folder = video_folder
+        self.label = label
+        self.scale = scale
+        self.fps = fps
+
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.encoders = {}
+
+    def add_dumper(self, data_dumper):
+        """
+        Hooks the preview manager into the data dumper of a POV
+
+        :param data_dumper: RevampedDataDumper
+        """
+        data_dumper.preview_manager = self
+
+    def get_video_path(self, pov_id):
+        """
+        :param pov_id: int
+        :return: os.path
+        """
+        return os.path.join(self.video_folder, f"{self.label}_{pov_id}_preview.mp4")
+
+    def start_encoder(self, pov_id, width, height):
+        """
+        Starts the encoder of a POV
+
+        :param pov_id: int
+        :param width: int
+        :param height: int
+        :return: subprocess.Popen or cv2.VideoWriter
+        """
+        if not os.path.exists(self.video_folder):
+            os.makedirs(self.video_folder)
+
+        if self.ffmpeg is None:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            return cv2.VideoWriter(self.get_video_path(pov_id), fourcc, self.fps, (width, height))
+
+        command = [
+            self.ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", self.get_video_path(pov_id)
+        ]
+        return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def add(self, pov_id, image):
+        """
+        Adds the current image of the front camera of a POV to its video
+
+        :param pov_id: int
+        :param image: np.ndarray
+            BGR image received by the camera
+        """
+        if image is None:
+            return
+
+        # yuv420p requires even dimensions
+        height, width = image.shape[:2]
+        width = max(2, round(width * self.scale / 2) * 2)
+        height = max(2, round(height * self.scale / 2) * 2)
+        frame = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+        if pov_id not in self.encoders:
+            self.encoders[pov_id] = self.start_encoder(pov_id, width, height)
+
+        encoder = self.encoders[pov_id]
+        if self.ffmpeg is None:
+            encoder.write(frame)
+        else:
+            encoder.stdin.write(frame.tobytes())
+
+    def close(self):
+        """
+        Finishes all videos
+        """
+        for pov_id, encoder in self.encoders.items():
+            if self.ffmpeg is None:
+                encoder.release()
+            else:
+                encoder.stdin.close()
+                encoder.wait()
+            print(f"Preview saved to {self.get_video_path(pov_id)}")
+        self.encoders = {}
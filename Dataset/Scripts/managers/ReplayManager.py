@@ -0,0 +1,270 @@
+import math
+import os
+import pickle
+import carla
+
+
+class ReplayManager:
+    """
+    Records the state of every vehicle, walker and traffic light at each tick of a scenario, so that the same traffic
+    can be replayed under other weather conditions. During replay, the traffic manager, the walker controllers and the
+    planning and control of the CAVs are not run: all actors have their physics disabled and are teleported to their
+    recorded transforms, walkers being also animated with their recorded velocities, and traffic lights are
+    frozen in their recorded states. Only the sensors are simulated again, under the new weather.
+
+    The trace only holds Python built-in types, so it can be inspected and replayed without a Carla server.
+
+    Parameters
+    ----------
+    trace_path : os.path
+        Path of the trace file. If it exists, the manager replays it, otherwise it records a new one.
+    world : carla.World
+        The carla world object.
+    client : carla.Client
+        Used to send the replay commands in batches.
+
+    Attributes
+    ----------
+    replaying : boolean
+        True if a trace was found and is being replayed, False if a new trace is being recorded.
+    trace : dict
+        Recorded actor information ("actors") and list of states of each tick ("ticks").
+    actors : dict
+        Maps the recorded actor ids to the carla.Actors used during replay.
+    tick : int
+        Index of the next tick to be replayed.
+    weather_lights : int
+        Light bits set by turn_on_vehicle_lights() that depend on the weather, which replace those of the trace. Brake
+        lights are always turned on there, so the recorded ones are replayed.
+    """
+    def __init__(self, trace_path, world, client):
+        self.trace_path = trace_path
+        self.world = world
+        self.client = client
+        self.weather_lights = int(carla.VehicleLightState.LowBeam | carla.VehicleLightState.Fog)
+
+        self.replaying = os.path.isfile(trace_path)
+        if self.replaying:
+            with open(trace_path, "rb") as infile:
+                self.trace = pickle.load(infile)
+        else:
+            self.trace = {"actors": {}, "ticks": []}
+
+        self.actors = {}
+        self.tick = 0
+
+    @property
+    def finished(self):
+        """
+        :return: boolean
+            True if all recorded ticks have been replayed
+        """
+        return self.tick >= len(self.trace["ticks"])
+
+    @staticmethod
+    def traffic_light_key(traffic_light):
+        """
+        Traffic light ids may change between runs, so lights are identified by their location instead
+
+        :param traffic_light: carla.TrafficLight
+        :return: str
+        """
+        location = traffic_light.get_transform().location
+        return f"{round(location.x, 1)}_{round(location.y, 1)}"
+
+    @staticmethod
+    def speed(state):
+        """
+        Speed of a recorded actor state, calculated in the same way as opencda.core.common.misc.get_speed
+
+        :param state: list
+            Recorded actor state
+        :return: float
+            Speed in km/h
+        """
+        vx, vy, vz = state[6:9]
+        return 3.6 * math.sqrt(vx ** 2 + vy ** 2 + vz ** 2)
+
+    def record_step(self, cav_list):
+        """
+        Records the state of the current tick. Must be called after all POVs have dumped their data for the tick
+
+        :param cav_list: list
+            List of RevampedVehicleManagers
+        """
+        cav_ids = {cav.vehicle.id: i for i, cav in enumerate(cav_list)}
+        actors = {}
+
+        for actor in self.world.get_actors().filter("vehicle.*"):
+            actors[actor.id] = self.actor_state(actor, int(actor.get_light_state()))
+            if actor.id not in self.trace["actors"]:
+                self.trace["actors"][actor.id] = {
+                    "type_id": actor.type_id,
+                    "attributes": dict(actor.attributes),
+                    "walker": False,
+                    "cav_index": cav_ids.get(actor.id)
+                }
+
+        for actor in self.world.get_actors().filter("walker.pedestrian.*"):
+            actors[actor.id] = self.actor_state(actor, -1)
+            if actor.id not in self.trace["actors"]:
+                self.trace["actors"][actor.id] = {
+                    "type_id": actor.type_id,
+                    "attributes": dict(actor.attributes),
+                    "walker": True,
+                    "cav_index": None
+                }
+
+        traffic_lights = {
+            self.traffic_light_key(traffic_light): int(traffic_light.get_state())
+            for traffic_light in self.world.get_actors().filter("traffic.traffic_light*")
+        }
+
+        # data dumped by the CAVs that depends on planning and control, so it cannot be obtained during replay
+        povs = [{"plan_trajectory": cav.data_dumper.plan_trajectory, "gnss_imu": cav.data_dumper.gnss_imu}
+                for cav in cav_list]
+
+        self.trace["ticks"].append({"actors": actors, "traffic_lights": traffic_lights, "povs": povs})
+
+    @staticmethod
+    def actor_state(actor, light_state):
+        """
+        :param actor: carla.Actor
+        :param light_state: int
+            carla.VehicleLightState as an int, or -1 for walkers
+        :return: list
+            [x, y, z, roll, yaw, pitch, vx, vy, vz, light_state]
+        """
+        transform = actor.get_transform()
+        velocity = actor.get_velocity()
+        return [transform.location.x, transform.location.y, transform.location.z,
+                transform.rotation.roll, transform.rotation.yaw, transform.rotation.pitch,
+                velocity.x, velocity.y, velocity.z, light_state]
+
+    def save(self):
+        """
+        Saves the recorded trace. The file is written under a temporary name and then renamed, so that an interrupted
+        run never leaves a partial trace behind
+        """
+        if self.replaying:
+            return
+
+        if not os.path.exists(os.path.dirname(self.trace_path)):
+            os.makedirs(os.path.dirname(self.trace_path))
+
+        with open(self.trace_path + ".part", "wb") as outfile:
+            pickle.dump(self.trace, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.trace_path + ".part", self.trace_path)
+        print(f"Trace with {len(self.trace['ticks'])} ticks saved to {self.trace_path}")
+
+    def start_replay(self, cav_list):
+        """
+        Associates the recorded CAVs with the CAVs of the current run, disabling their physics, and freezes all traffic
+        lights so that their states are only changed by the replay
+
+        :param cav_list: list
+            List of RevampedVehicleManagers
+        """
+        for recorded_id, info in self.trace["actors"].items():
+            if info["cav_index"] is not None:
+                vehicle = cav_list[info["cav_index"]].vehicle
+                vehicle.set_simulate_physics(False)
+                self.actors[recorded_id] = vehicle
+
+        for traffic_light in self.world.get_actors().filter("traffic.traffic_light*"):
+            traffic_light.freeze(True)
+
+    def spawn_actors(self, recorded_ids, states):
+        """
+        Spawns the recorded actors that have not been spawned yet, slightly above their recorded location to avoid
+        collisions with the ground. Actors are spawned with physics disabled
+
+        :param recorded_ids: list
+            Recorded ids of the actors to be spawned
+        :param states: dict
+            Recorded actor states of the current tick
+        """
+        blueprint_library = self.world.get_blueprint_library()
+        batch = []
+        for recorded_id in recorded_ids:
+            info = self.trace["actors"][recorded_id]
+            blueprint = blueprint_library.find(info["type_id"])
+            for key, value in info["attributes"].items():
+                if blueprint.has_attribute(key) and blueprint.get_attribute(key).is_modifiable:
+                    blueprint.set_attribute(key, value)
+
+            state = states[recorded_id]
+            transform = carla.Transform(carla.Location(x=state[0], y=state[1], z=state[2] + 0.5),
+                                        carla.Rotation(roll=state[3], yaw=state[4], pitch=state[5]))
+            batch.append(carla.command.SpawnActor(blueprint, transform).then(
+                carla.command.SetSimulatePhysics(carla.command.FutureActor, False)
+            ))
+
+        responses = self.client.apply_batch_sync(batch, False)
+        spawned_ids = [response.actor_id for response in responses if not response.error]
+        spawned_actors = self.world.get_actors(spawned_ids)
+
+        for recorded_id, response in zip(recorded_ids, responses):
+            if response.error:
+                print(f"### ERROR: Actor {recorded_id} could not be replayed: {response.error} ###")
+                # prevents the actor from being spawned again at every tick
+                self.actors[recorded_id] = None
+            else:
+                self.actors[recorded_id] = spawned_actors.find(response.actor_id)
+
+    def replay_step(self, lights):
+        """
+        Applies the states of the next recorded tick. Must be called before the world is ticked
+
+        :param lights: carla.VehicleLightState
+            Lights turned on for the current weather, which replace the weather-dependent lights of the trace
+        :return: list, dict
+            One dict per CAV with the recorded "plan_trajectory" and "gnss_imu" of the tick, and the recorded
+            "speeds" of all replayed actors, keyed by their current ids. The speeds are also returned on their own, for
+            the RSUs
+        """
+        tick_state = self.trace["ticks"][self.tick]
+        states = tick_state["actors"]
+
+        new_ids = [recorded_id for recorded_id in states if recorded_id not in self.actors]
+        if new_ids:
+            self.spawn_actors(new_ids, states)
+
+        batch = []
+        speeds = {}
+        for recorded_id, state in states.items():
+            actor = self.actors[recorded_id]
+            if actor is None:
+                continue
+
+            speeds[actor.id] = self.speed(state)
+
+            if self.trace["actors"][recorded_id]["walker"]:
+                # walkers are animated according to their speed, so their recorded velocity is applied as control. It
+                # is applied before the transform, which sets their recorded position
+                planar_speed = math.sqrt(state[6] ** 2 + state[7] ** 2)
+                if planar_speed > 0:
+                    direction = carla.Vector3D(x=state[6] / planar_speed, y=state[7] / planar_speed, z=0)
+                else:
+                    direction = carla.Vector3D()
+                batch.append(carla.command.ApplyWalkerControl(
+                    actor.id, carla.WalkerControl(direction=direction, speed=planar_speed)
+                ))
+            else:
+                light_state = (state[9] & ~self.weather_lights) | (int(lights) & self.weather_lights)
+                batch.append(carla.command.SetVehicleLightState(actor.id, carla.VehicleLightState(light_state)))
+
+            transform = carla.Transform(carla.Location(x=state[0], y=state[1], z=state[2]),
+                                        carla.Rotation(roll=state[3], yaw=state[4], pitch=state[5]))
+            batch.append(carla.command.ApplyTransform(actor.id, transform))
+
+        self.client.apply_batch_sync(batch, False)
+
+        for traffic_light in self.world.get_actors().filter("traffic.traffic_light*"):
+            key = self.traffic_light_key(traffic_light)
+            if key in tick_state["traffic_lights"]:
+                traffic_light.set_state(carla.TrafficLightState.values[tick_state["traffic_lights"][key]])
+
+        self.tick += 1
+
+        return [dict(pov, speeds=speeds) for pov in tick_state["povs"]], speeds
@@ -3,18 +3,21 @@ from opencda.core.plan.behavior_agent import BehaviorAgent
 
 class RevampedBehaviorAgent(BehaviorAgent):
     """
-    Revamped version of BehaviorAgent. Modifies the traffic_light_manager method and includes walkers among
-    possible obstacles to be considered by the vehicle
+    Revamped version of BehaviorAgent. Modifies the traffic_light_manager method, includes walkers among
+    possible obstacles to be considered by the vehicle and reuses planned routes from a RouteCache
     """
-    def __init__(self, vehicle, carla_map, config_yaml):
+    def __init__(self, vehicle, carla_map, config_yaml, route_cache=None):
         """
         :param vehicle: carla.Vehicle
         :param carla_map: carla.map
         :param config_yaml: dict
+        :param route_cache: RouteCache
+            Cache of planned routes. If None, routes are always planned
         """
         super().__init__(vehicle, carla_map, config_yaml)
         self.crossed_on_yellow = False
         self.previous_light_state = None
+        self.route_cache = route_cache
 
     def update_information(self, ego_pos, ego_speed, objects):
         """
@@ -35,6 +38,28 @@ class RevampedBehaviorAgent(BehaviorAgent):
         elif self.light_state == "Green":
             self.crossed_on_yellow = False
 
+    def _trace_route(self, start_waypoint, end_waypoint):
+        """
+        Revamped method from BehaviorAgent, reusing the route from the route cache if it has already been planned
+
+        :param start_waypoint: carla.Waypoint
+        :param end_waypoint: carla.Waypoint
+        :return: list
+            List of (carla.Waypoint, RoadOption) tuples
+        """
+        if self.route_cache is None:
+            return super()._trace_route(start_waypoint, end_waypoint)
+
+        start_location = start_waypoint.transform.location
+        end_location = end_waypoint.transform.location
+
+        route = self.route_cache.get(start_location, end_location, self._sampling_resolution)
+        if route is None:
+            route = super()._trace_route(start_waypoint, end_waypoint)
+            self.route_cache.add(start_location, end_location, self._sampling_resolution, route)
+
+        return route
+
     def traffic_light_manager(self, waypoint):
         """
         Revamped method from method because vehicles were often not stopping at red lights
@@ -6,6 +6,10 @@ from opencda.core.common.data_dumper import DataDumper
 from opencda.core.common.misc import get_speed
 from opencda.scenario_testing.utils.yaml_utils import save_yaml
 from opencda.core.sensing.perception import sensor_transformation as st
+from Dataset.Scripts.utils.dataset import FIRST_FRAME
+from Dataset.Scripts.utils.manifest import append_manifest
+from Dataset.Scripts.utils.projection import get_2d_boxes, get_box_corners_3d, get_camera_parameters, \
+    project_to_cameras
 
 
 class RevampedDataDumper(DataDumper):
@@ -28,6 +32,14 @@ class RevampedDataDumper(DataDumper):
         self.save_parent_folder = os.path.join(path, str(self.vehicle_id))
         self.bp_meta = bp_meta
 
+        # last planned trajectory and gnss/imu data dumped, recorded by the ReplayManager
+        self.plan_trajectory = None
+        self.gnss_imu = None
+        # set by SummaryAggregator.add_dumper() to build the scenario summary during the simulation
+        self.summary_aggregator = None
+        # set by PreviewManager.add_dumper() to encode a preview video of the front camera during the simulation
+        self.preview_manager = None
+
     def create_path(self, path):
         """
         Creates folder for the vehicle/rsu if it does not exist
@@ -39,28 +51,59 @@ class RevampedDataDumper(DataDumper):
         if not os.path.exists(save_parent_folder):
             os.makedirs(save_parent_folder)
 
-    def run_step(self, perception_manager, localization_manager, behavior_agent):
+    def run_step(self, perception_manager, localization_manager, behavior_agent, replayed=None):
         """
         Saves data for the current frame of the simulation
 
         :param perception_manager: RevampedPerceptionManager
         :param localization_manager: opencda.LocalizationManager
         :param behavior_agent: RevampedBehaviorAgent
+        :param replayed: dict
+            When replaying a trace, the recorded "plan_trajectory", "gnss_imu" and "speeds" of the current frame, which
+            replace the values that depend on planning, control and physics. None otherwise
         """
         self.count += 1
 
-        # Ignores first 60 frames due to object spawning
-        if self.count < 60:
+        # Ignores the frames before FIRST_FRAME due to object spawning
+        if self.count < FIRST_FRAME:
             return
 
         # Saves at every frame (10 Hz)
         self.save_rgb_image(self.count)
-        self.save_yaml_file(perception_manager, localization_manager, behavior_agent, self.count)
+        if self.preview_manager is not None:
+            self.preview_manager.add(self.vehicle_id, self.rgb_camera[0].image)
+        self.save_yaml_file(perception_manager, localization_manager, behavior_agent, self.count, replayed)
         self.save_lidar_points()
 
         # If it is a CAV
         if behavior_agent is not None:
-            self.save_gnss_imu(localization_manager.gnss, localization_manager.imu, self.save_parent_folder, self.count)
+            self.save_gnss_imu(localization_manager.gnss, localization_manager.imu, self.save_parent_folder, self.count,
+                               replayed)
+
+        frame = "%06d" % self.count
+        file_names = [f"{frame}_camera{i}.png" for i in range(len(self.rgb_camera))]
+        file_names += [f"{frame}.yaml", f"{frame}_lidar.ply"]
+        if behavior_agent is not None:
+            file_names.append(f"{frame}_gnss_imu.yaml")
+        # checksums are calculated in the background, outside of the simulation tick
+        append_manifest(self.save_parent_folder, frame, file_names)
+        # semantic images are saved by CARLA's listen callbacks, those of the previous frame are complete by now
+        if self.count > FIRST_FRAME:
+            self.add_semantic_images_to_manifest(self.count - 1)
+
+    def add_semantic_images_to_manifest(self, count):
+        """
+        Appends the semantic images of a frame to the manifest of the POV
+
+        :param count: int
+            Frame of the images
+        """
+        frame = "%06d" % count
+        file_names = [f"{frame}_semantic{i}.png" for i in range(len(self.rgb_camera))]
+        file_names = [file_name for file_name in file_names
+                      if os.path.exists(os.path.join(self.save_parent_folder, file_name))]
+        if file_names:
+            append_manifest(self.save_parent_folder, frame, file_names)
 
     def save_lidar_points(self):
         """
@@ -80,7 +123,7 @@ class RevampedDataDumper(DataDumper):
         pcd_name = "%06d" % self.count + "_lidar.ply"
         o3d.io.write_point_cloud(os.path.join(self.save_parent_folder, pcd_name), pointcloud=o3d_pcd, write_ascii=True)
 
-    def save_gnss_imu(self, gnss, imu, save_path, frame):
+    def save_gnss_imu(self, gnss, imu, save_path, frame, replayed=None):
         """
         Saves GNSS & IMU data to file
 
@@ -88,6 +131,26 @@ class RevampedDataDumper(DataDumper):
         :param imu: opencda.ImuSensor
         :param save_path: os.path
         :param frame: int
+        :param replayed: dict
+            Recorded data of the current frame when replaying a trace, None otherwise
+        """
+        if replayed is not None:
+            self.gnss_imu = replayed["gnss_imu"]
+        else:
+            self.gnss_imu = self.get_gnss_imu_dictionary(gnss, imu)
+
+        file_name = os.path.join(save_path, "%06d" % frame + "_gnss_imu.yaml")
+
+        with open(file_name, "w") as outfile:
+            yaml.dump(self.gnss_imu, outfile, default_flow_style=False)
+
+    @staticmethod
+    def get_gnss_imu_dictionary(gnss, imu):
+        """
+        :param gnss: opencda.GnssSensor
+        :param imu: opencda.ImuSensor
+        :return: dict
+            GNSS & IMU data in the format saved to file
         """
         localization_dictionary = {
             "gnss": {
@@ -110,12 +173,40 @@ class RevampedDataDumper(DataDumper):
                 "compass": imu.compass
             }
         }
-        file_name = os.path.join(save_path, "%06d" % frame + "_gnss_imu.yaml")
 
-        with open(file_name, "w") as outfile:
-            yaml.dump(localization_dictionary, outfile, default_flow_style=False)
+        return localization_dictionary
+
+    def add_2d_boxes(self, dump_yml, vehicle_dict, walker_dict):
+        """
+        Adds the 2D bounding boxes of all objects in all cameras to their annotations. The 3D boxes of all objects are
+        projected to all cameras at once, from the camera parameters already in the ground truth dictionary
+
+        :param dump_yml: dict
+            Ground truth dictionary of the frame, with the parameters of each camera
+        :param vehicle_dict: dict
+        :param walker_dict: dict
+        """
+        objects = list(vehicle_dict.values()) + list(walker_dict.values())
+        if not objects or not self.rgb_camera:
+            return
+
+        corners = np.concatenate([get_box_corners_3d(vehicle_dict), get_box_corners_3d(walker_dict)])
+        world_to_camera, intrinsics = get_camera_parameters(dump_yml)
+        pixels, depth = project_to_cameras(corners.reshape(-1, 3), world_to_camera, intrinsics)
+
+        num_cameras = len(world_to_camera)
+        boxes, in_frustum, truncation = get_2d_boxes(pixels.reshape(num_cameras, -1, 8, 2),
+                                                     depth.reshape(num_cameras, -1, 8),
+                                                     self.rgb_camera[0].image_width,
+                                                     self.rgb_camera[0].image_height)
 
-    def save_yaml_file(self, perception_manager, localization_manager, behavior_agent, count):
+        # one entry per camera, in the same order as camera0, camera1, ...
+        for j, obj in enumerate(objects):
+            obj.update({"bbx_2d": boxes[:, j].tolist(),
+                        "in_frustum": in_frustum[:, j].tolist(),
+                        "truncation": truncation[:, j].tolist()})
+
+    def save_yaml_file(self, perception_manager, localization_manager, behavior_agent, count, replayed=None):
         """
         Save ground truths about the scene to a yaml file
 
@@ -123,8 +214,12 @@ class RevampedDataDumper(DataDumper):
         :param localization_manager: opencda.LocalizationManager
         :param behavior_agent: RevampedBehaviorAgent
         :param count: int
+        :param replayed: dict
+            Recorded data of the current frame when replaying a trace, None otherwise
         """
         frame = count
+        # during replay, physics is disabled, so speeds are taken from the trace
+        speeds = replayed["speeds"] if replayed is not None else None
 
         dump_yml = {}
         vehicle_dict = {}
@@ -139,7 +234,8 @@ class RevampedDataDumper(DataDumper):
             veh_carla_id = veh.carla_id
             veh_pos = veh.get_transform()
             veh_bbx = veh.bounding_box
-            veh_speed = get_speed(veh)
+            # actors whose replay spawn failed are not in the trace speeds
+            veh_speed = speeds.get(veh_carla_id, get_speed(veh)) if speeds is not None else get_speed(veh)
 
             assert veh_carla_id != -1, "Please turn off perception active mode if you are dumping data"
 
@@ -170,7 +266,7 @@ class RevampedDataDumper(DataDumper):
             walker_carla_id = walker.carla_id
             walker_pos = walker.get_transform()
             walker_bbx = walker.bounding_box
-            walker_speed = get_speed(walker)
+            walker_speed = speeds.get(walker_carla_id, get_speed(walker)) if speeds is not None else get_speed(walker)
 
             walker_dict.update({walker_carla_id: {
                 "bp_id": walker.type_id,
@@ -212,8 +308,11 @@ class RevampedDataDumper(DataDumper):
             true_ego_pos.rotation.roll,
             true_ego_pos.rotation.yaw,
             true_ego_pos.rotation.pitch]})
-        dump_yml.update({"ego_speed":
-                        float(localization_manager.get_ego_spd())})
+        if speeds is not None and self.vehicle_id in speeds:
+            ego_speed = speeds[self.vehicle_id]
+        else:
+            ego_speed = localization_manager.get_ego_spd()
+        dump_yml.update({"ego_speed": float(ego_speed)})
 
         # dump lidar sensor coordinates under world coordinate system
         lidar_transformation = self.lidar.sensor.get_transform()
@@ -253,20 +352,26 @@ class RevampedDataDumper(DataDumper):
             camera_param.update({"extrinsic": lidar2camera})
             dump_yml.update({"camera%d" % i: camera_param})
 
+        self.add_2d_boxes(dump_yml, vehicle_dict, walker_dict)
+
         dump_yml.update({"RSU": True})
         # dump the planned trajectory if it exists
         if behavior_agent is not None:
-            trajectory_deque = behavior_agent.get_local_planner().get_trajectory()
-            trajectory_list = []
+            if replayed is not None:
+                trajectory_list = replayed["plan_trajectory"]
+            else:
+                trajectory_deque = behavior_agent.get_local_planner().get_trajectory()
+                trajectory_list = []
 
-            for i in range(len(trajectory_deque)):
-                tmp_buffer = trajectory_deque.popleft()
-                x = tmp_buffer[0].location.x
-                y = tmp_buffer[0].location.y
-                spd = float(tmp_buffer[1])
+                for i in range(len(trajectory_deque)):
+                    tmp_buffer = trajectory_deque.popleft()
+                    x = tmp_buffer[0].location.x
+                    y = tmp_buffer[0].location.y
+                    spd = float(tmp_buffer[1])
 
-                trajectory_list.append([x, y, spd])
+                    trajectory_list.append([x, y, spd])
 
+            self.plan_trajectory = trajectory_list
             dump_yml.update({"plan_trajectory": trajectory_list})
             dump_yml.update({"RSU": False})
 
@@ -276,3 +381,6 @@ class RevampedDataDumper(DataDumper):
 
         save_yaml(dump_yml, save_path)
 
+        if self.summary_aggregator is not None:
+            self.summary_aggregator.add(self.vehicle_id, frame, dump_yml)
+
@@ -9,6 +9,7 @@ from opencda.core.sensing.perception.obstacle_vehicle import ObstacleVehicle
 from opencda.core.sensing.perception.perception_manager import PerceptionManager, SemanticLidarSensor, LidarSensor
 from Dataset.Scripts.sensors.CameraSensor import CameraSensor
 from Dataset.Scripts.sensors.SemanticCameraSensor import SemanticCameraSensor
+from Dataset.Scripts.utils.dataset import FIRST_FRAME
 
 
 class RevampedPerceptionManager(PerceptionManager):
@@ -51,6 +52,8 @@ class RevampedPerceptionManager(PerceptionManager):
         if self.activate or self.camera_visualize:
             self.rgb_camera = []
             self.semantic_cameras = []  # Semantic cameras will be added after
+            # set by finish_semantic_images(), which must only run once
+            self.semantic_images_finished = False
             mount_position = self.camera_config["positions"]
             assert len(mount_position) == self.camera_num, \
                 "The camera number has to be the same as the length of the relative positions list"
@@ -245,12 +248,27 @@ class RevampedPerceptionManager(PerceptionManager):
         relative_angle = (((a_yaw - ego_yaw) + 180) % 360) - 180
         return relative_angle
 
+    def finish_semantic_images(self):
+        """
+        Adds the semantic images of the last dumped frame to the manifest, which is only possible once the simulation
+        stops, and deletes those saved for the frame after it, which is not dumped
+        """
+        if not self.semantic_cameras or self.semantic_images_finished:
+            return
+        self.semantic_images_finished = True
+
+        data_dumper = self.semantic_cameras[0].data_dumper
+        if data_dumper.count >= FIRST_FRAME:
+            data_dumper.add_semantic_images_to_manifest(data_dumper.count)
+        for semantic_camera in self.semantic_cameras:
+            semantic_camera.delete_last_saved_image()
+
     def destroy(self):
         """
         Destroys all sensors
         """
         super().destroy()
         if self.semantic_cameras:
+            self.finish_semantic_images()
             for semantic_camera in self.semantic_cameras:
-                semantic_camera.delete_last_saved_image()
                 semantic_camera.sensor.destroy()
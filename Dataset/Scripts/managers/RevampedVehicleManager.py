@@ -16,7 +16,7 @@ class RevampedVehicleManager(VehicleManager):
     The constructor also adds semantic cameras to the RevampedPerceptionManager, since they reference the
     RevampedDataDumper
     """
-    def __init__(self, vehicle, config_yaml, carla_map, cav_world, save_path, bp_meta, current_time):
+    def __init__(self, vehicle, config_yaml, carla_map, cav_world, save_path, bp_meta, current_time, route_cache=None):
         """
         :param vehicle: carla.Vehicle
         :param config_yaml: dict
@@ -26,6 +26,8 @@ class RevampedVehicleManager(VehicleManager):
         :param bp_meta: dict
             Blueprint dictionary. Used by data_dumper to get the category of each object when dumping data
         :param current_time: str
+        :param route_cache: RouteCache
+            Cache of planned routes shared by all CAVs. If None, routes are always planned
         """
         self.vid = str(uuid.uuid1())
         self.vehicle = vehicle
@@ -43,7 +45,7 @@ class RevampedVehicleManager(VehicleManager):
         self.perception_manager = RevampedPerceptionManager(vehicle, sensing_config['perception'], cav_world)
         self.map_manager = MapManager(vehicle, carla_map, map_config)
         self.safety_manager = SafetyManager(vehicle=vehicle, params=config_yaml['safety_manager'])
-        self.agent = RevampedBehaviorAgent(vehicle, carla_map, behavior_config)
+        self.agent = RevampedBehaviorAgent(vehicle, carla_map, behavior_config, route_cache)
         self.controller = ControlManager(control_config)
         self.data_dumper = RevampedDataDumper(self.perception_manager, vehicle.id, current_time, save_path, bp_meta)
 
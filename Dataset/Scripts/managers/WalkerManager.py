@@ -1,127 +1,145 @@
 import random
+import time
 import carla
 from tqdm import tqdm
+from Dataset.Scripts.utils.getters import get_spawn_areas
+from Dataset.Scripts.utils.navigation_cache import NavigationCache
 
 
 class WalkerManager:
     """
     Class to spawn Walkers (pedestrians) according to scenario configurations and then destroy the spawned actors.
     """
-    def __init__(self, scenario_params, num_walkers, carla_map, world):
+    def __init__(self, scenario_params, num_walkers, carla_map, world, client, max_batches=5):
         """
         :param scenario_params: dict
         :param num_walkers: int
         :param carla_map: carla.Map
         :param world: carla.World
+        :param client: carla.Client
+            Used to spawn walkers and their controllers in batches
+        :param max_batches: int
+            Maximum number of spawning batches, used to retry walkers that failed to spawn
         """
         self.num_walkers = num_walkers
         self.carla_map = carla_map
         self.world = world
+        self.client = client
+        self.max_batches = max_batches
+        self.walkers = []
 
         if num_walkers > 0:
-            self.spawn_areas = self.create_spawn_ranges(scenario_params)
+            self.spawn_areas = get_spawn_areas(scenario_params)
+            navigation_cache = NavigationCache(
+                self.world, scenario_params["town"], scenario_params["cache"]["path"],
+                scenario_params["cache"]["navigation_samples"]
+            )
+            self.spawn_points = navigation_cache.spawn_points(self.spawn_areas, scenario_params["world"]["seed"])
             self.walker_blueprints = self.world.get_blueprint_library().filter('walker')
             self.world.set_pedestrians_cross_factor(scenario_params["scenario"]["walker_crossing_factor"])
             self.walkers = self.spawn_walkers()
 
-    def create_spawn_ranges(self, params):
-        """
-        Calculates the spawn ranges (x_min, x_max, y_min, y_max) that will be used to spawn walkers based on provided
-        configuration
-
-        :param params: dict
-            Config for current scenario execution
-        :return: list
-            List of spawn ranges (x_min, x_max, y_min, y_max)
-        """
-        cav_list = params["scenario"]["single_cav_list"]
-        rsu_list = params["scenario"]["rsu_list"]
-        spawn_distance = params["scenario"]["spawning_distance"]
-        spawn_distance_to_path = params["scenario"]["spawning_distance_to_path"]
-
-        spawn_ranges = []
-
-        for pov in cav_list + rsu_list:
-            # Defines spawn positions around the CAVs and RSUs
-            spawn_pos = pov["spawn_position"]
-            x_min = spawn_pos[0] - spawn_distance
-            x_max = spawn_pos[0] + spawn_distance
-            y_min = spawn_pos[1] - spawn_distance
-            y_max = spawn_pos[1] + spawn_distance
-            spawn_ranges.append([x_min, x_max, y_min, y_max])
-
-        for cav in cav_list:
-            # Define spawn positions along the paths that will be taken by the CAVs
-            spawn_pos = cav["spawn_position"]
-            destination = cav["destination"]
-            x_min = min(spawn_pos[0], destination[0]) - spawn_distance_to_path
-            x_max = max(spawn_pos[0], destination[0]) + spawn_distance_to_path
-            y_min = min(spawn_pos[1], destination[1]) - spawn_distance_to_path
-            y_max = max(spawn_pos[1], destination[1]) + spawn_distance_to_path
-            spawn_ranges.append([x_min, x_max, y_min, y_max])
-
-        return spawn_ranges
-
     def get_valid_spawn_point(self):
         """
-        Gets a random location for walkers and checks if it is within any of the spawn areas. Repeats until a valid
-        spawn location is found or if the maximum number of attempts (100000) is reached.
+        Gets the next spawn point from the navigation cache, drawn from the samples within the spawn areas
 
         :return: carla.Location
-            Valid spawn point
+            Valid spawn point, or None if all samples within the spawn areas have been used
         """
-        attempts = 100000
-        for i in range(attempts):
-            spawn_point = self.world.get_random_location_from_navigation()
-
-            for area in self.spawn_areas:
-                if area[0] < spawn_point.x < area[1] and area[2] < spawn_point.y < area[3]:
-                    return spawn_point
+        spawn_point = next(self.spawn_points, None)
+        if spawn_point is None:
+            print("### ERROR: No valid spawning points encountered ###")
 
-        print("### ERROR: No valid spawning points encountered ###")
-        return None
+        return spawn_point
 
     def spawn_walkers(self):
         """
-        Spawns walkers in Carla and starts their movement controller
+        Spawns walkers in Carla and starts their movement controller. Walkers and their AI controllers are spawned in
+        batches through client.apply_batch_sync, so the server is only ticked once before the controllers are started,
+        instead of twice per walker. Walkers that fail to spawn (usually due to collisions) are retried in further
+        batches, up to max_batches
 
         :return: list
             List of lists. Each inner list has a carla.Walker and its corresponding carla.WalkerAIController
         """
         print("Spawning walkers...")
-        walkers = []
-        count = 0
-        pbar = tqdm(total=self.num_walkers)
-
-        while count < self.num_walkers:
-            pos = self.get_valid_spawn_point()
-            if pos is None:
+        t0 = time.time()
+        walker_ids = []
+        controller_ids = []
+        controller_bp = self.world.get_blueprint_library().find('controller.ai.walker')
+
+        for batch_number in range(self.max_batches):
+            num_missing = self.num_walkers - len(walker_ids)
+            if num_missing == 0:
                 break
 
-            spawn_transform = carla.Transform(pos, carla.Rotation())
-
-            walker_bp = random.choice(self.walker_blueprints)
-            walker = self.world.try_spawn_actor(walker_bp, spawn_transform)
-            if not walker:  # Spawning failures are usually caused by collisions
-                continue
+            # samples spawn points for all missing walkers at once
+            t_sample = time.time()
+            spawn_points = []
+            for i in range(num_missing):
+                pos = self.get_valid_spawn_point()
+                if pos is None:
+                    break
+                spawn_points.append(pos)
+            t_sample = time.time() - t_sample
+
+            if not spawn_points:
+                break
 
-            controller_bp = self.world.get_blueprint_library().find('controller.ai.walker')
-            walker_controller = self.world.try_spawn_actor(controller_bp, carla.Transform(), walker)
-            if not walker_controller:
-                walker.destroy()
-                continue
+            # spawns all walkers in a single batch
+            t_walkers = time.time()
+            batch = [
+                carla.command.SpawnActor(random.choice(self.walker_blueprints), carla.Transform(pos, carla.Rotation()))
+                for pos in spawn_points
+            ]
+            new_walker_ids = [
+                response.actor_id for response in self.client.apply_batch_sync(batch, False) if not response.error
+            ]
+            t_walkers = time.time() - t_walkers
+
+            # spawns the AI controllers of the walkers that were spawned, also in a single batch
+            t_controllers = time.time()
+            batch = [carla.command.SpawnActor(controller_bp, carla.Transform(), walker_id)
+                     for walker_id in new_walker_ids]
+            responses = self.client.apply_batch_sync(batch, False)
+            t_controllers = time.time() - t_controllers
+
+            orphan_walker_ids = []
+            for walker_id, response in zip(new_walker_ids, responses):
+                if response.error:
+                    orphan_walker_ids.append(walker_id)
+                else:
+                    walker_ids.append(walker_id)
+                    controller_ids.append(response.actor_id)
+
+            # walkers whose controller could not be spawned are destroyed and retried in the next batch
+            if orphan_walker_ids:
+                self.client.apply_batch_sync([carla.command.DestroyActor(x) for x in orphan_walker_ids], False)
+
+            print(f"Walker batch #{batch_number + 1}: {len(spawn_points)} requested, "
+                  f"{len(new_walker_ids) - len(orphan_walker_ids)} spawned | sampling: {t_sample:.2f}s, "
+                  f"walkers: {t_walkers:.2f}s, controllers: {t_controllers:.2f}s")
+
+        if len(walker_ids) < self.num_walkers:
+            print(f"### ERROR: Only {len(walker_ids)} out of {self.num_walkers} walkers were spawned ###")
+
+        # tick MUST be called between AI Controller spawning and start(), otherwise segfaults
+        t_start = time.time()
+        self.world.tick()
 
-            self.world.tick()  # MUST be called between AI Controller spawning and start(), otherwise segfaults
+        walkers = []
+        walker_actors = self.world.get_actors(walker_ids)
+        controller_actors = self.world.get_actors(controller_ids)
+        for walker_id, controller_id in zip(walker_ids, controller_ids):
+            walker = walker_actors.find(walker_id)
+            walker_controller = controller_actors.find(controller_id)
             walker_controller.start()
             walker_controller.go_to_location(self.world.get_random_location_from_navigation())
             walker_controller.set_max_speed(1 + random.random())  # Between 1 and 2 m/s (default is 1.4 m/s)
-            self.world.tick()
-
             walkers.append([walker, walker_controller])
-            count += 1
-            pbar.update(1)
+        t_start = time.time() - t_start
 
-        pbar.close()
+        print(f"{len(walkers)} walkers spawned in {time.time() - t0:.2f}s (controller start: {t_start:.2f}s)")
         return walkers
 
     def destroy(self):
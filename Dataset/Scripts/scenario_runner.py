@@ -10,11 +10,16 @@ from opencda.core.common.cav_world import CavWorld
 from opencda.scenario_testing.utils.yaml_utils import save_yaml
 sys.path.append(".")  # necessary so that this script may be called as a subprocess on main.py
 from Dataset.Configs.enums.weather import Weather
+from Dataset.Scripts.managers.PreviewManager import PreviewManager
+from Dataset.Scripts.managers.ReplayManager import ReplayManager
 from Dataset.Scripts.managers.RevampedRSUManager import RevampedRSUManager
 from Dataset.Scripts.managers.RevampedVehicleManager import RevampedVehicleManager
 from Dataset.Scripts.managers.TrafficLightManager import TrafficLightManager
 from Dataset.Scripts.managers.WalkerManager import WalkerManager
-from Dataset.Scripts.utils.getters import get_label_from_config
+from Dataset.Scripts.utils.getters import get_label_from_config, get_spawn_areas, get_trace_path
+from Dataset.Scripts.utils.manifest import wait_for_manifests
+from Dataset.Scripts.utils.route_cache import RouteCache
+from Dataset.Scripts.utils.summary import SummaryAggregator
 
 
 def save_configs(scenario_params):
@@ -41,16 +46,13 @@ def save_configs(scenario_params):
     return save_path
 
 
-def turn_on_vehicle_lights(cavs, npcs, weather):
+def get_vehicle_lights(weather):
     """
-    Iterates through spawned vehicles (both CAVs and traffic), turning on the vehicle lights
+    Returns the vehicle lights to be turned on for the weather conditions
 
-    :param cavs: list
-        List of VehicleManagers
-    :param npcs: list
-        List of Vehicles without sensors
     :param weather: dict
         Weather configurations
+    :return: carla.VehicleLightState
     """
     if weather["fog_density"] > 30:
         # if scenario is foggy, turns on fog lights as well
@@ -63,6 +65,22 @@ def turn_on_vehicle_lights(cavs, npcs, weather):
             carla.VehicleLightState.LowBeam | carla.VehicleLightState.Brake
         )
 
+    return lights
+
+
+def turn_on_vehicle_lights(cavs, npcs, weather):
+    """
+    Iterates through spawned vehicles (both CAVs and traffic), turning on the vehicle lights
+
+    :param cavs: list
+        List of VehicleManagers
+    :param npcs: list
+        List of Vehicles without sensors
+    :param weather: dict
+        Weather configurations
+    """
+    lights = get_vehicle_lights(weather)
+
     for cav in cavs:
         cav.vehicle.set_light_state(lights)
 
@@ -118,10 +136,6 @@ def add_spawn_from_density(params):
         Modified config with keys for spawn points
     """
     # gets all values from dicts
-    cav_list = params["scenario"]["single_cav_list"]
-    rsu_list = params["scenario"]["rsu_list"]
-    spawn_distance = params["scenario"]["spawning_distance"]
-    spawn_distance_to_path = params["scenario"]["spawning_distance_to_path"]
     params["carla_traffic_manager"]["range"].clear()
     vehicle_num = round(params["scenario"]["num_vehicles"] * params["density"]["vehicle_multiplier"])
 
@@ -129,35 +143,22 @@ def add_spawn_from_density(params):
     x_step = round(global_distance + 3.183)  # largest dimension of the largest vehicle (except for the firetruck)
     y_step = round(global_distance + 3.183)  # largest dimension of the largest vehicle (except for the firetruck)
 
-    # for each pov (cav or rsu), adds spawn points in a rectangular area around it
-    for pov in cav_list + rsu_list:
-        spawn_pos = pov["spawn_position"]
-        x_min = spawn_pos[0] - spawn_distance
-        x_max = spawn_pos[0] + spawn_distance
-        y_min = spawn_pos[1] - spawn_distance
-        y_max = spawn_pos[1] + spawn_distance
-        params["carla_traffic_manager"]["range"].append([x_min, x_max, y_min, y_max, x_step, y_step, vehicle_num])
-
-    # for each cav, adds spawn points along the path taken by the cav
-    for cav in cav_list:
-        spawn_pos = cav["spawn_position"]
-        destination = cav["destination"]
-        x_min = min(spawn_pos[0], destination[0]) - spawn_distance_to_path
-        x_max = max(spawn_pos[0], destination[0]) + spawn_distance_to_path
-        y_min = min(spawn_pos[1], destination[1]) - spawn_distance_to_path
-        y_max = max(spawn_pos[1], destination[1]) + spawn_distance_to_path
+    # adds spawn points in a rectangular area around each pov (cav or rsu) and along the path taken by each cav
+    for x_min, x_max, y_min, y_max in get_spawn_areas(params):
         params["carla_traffic_manager"]["range"].append([x_min, x_max, y_min, y_max, x_step, y_step, vehicle_num])
 
     return params
 
 
-def create_vehicle_manager(scenario_manager, save_path):
+def create_vehicle_manager(scenario_manager, save_path, plan_route=True):
     """
     Creates instances of RevampedVehicleManager for each CAV in the scenario
 
     :param scenario_manager: ScenarioManager
     :param save_path: os.path
         Path of data_dumping
+    :param plan_route: boolean
+        If the route to the destination of each CAV should be planned. Not needed when replaying a trace
     :return: list
         List of RevampedVehicleManagers created
     """
@@ -170,6 +171,9 @@ def create_vehicle_manager(scenario_manager, save_path):
     cav_vehicle_bp = scenario_manager.world.get_blueprint_library().find(default_model)
     single_cav_list = []
 
+    # routes are the same for all weather and density variants of a road configuration, so they are planned only once
+    route_cache = RouteCache(scenario_manager.scenario_params["cache"]["path"], scenario_manager.carla_map)
+
     for i, cav_config in enumerate(scenario_manager.scenario_params['scenario']['single_cav_list']):
         platoon_base = OmegaConf.create({'platoon': scenario_manager.scenario_params.get('platoon_base', {})})
         cav_config = OmegaConf.merge(scenario_manager.scenario_params['vehicle_base'], platoon_base, cav_config)
@@ -191,19 +195,21 @@ def create_vehicle_manager(scenario_manager, save_path):
         # create vehicle manager for each cav
         vehicle_manager = RevampedVehicleManager(
             vehicle, cav_config, scenario_manager.carla_map, scenario_manager.cav_world,
-            save_path, scenario_manager.bp_meta, scenario_manager.scenario_params['current_time']
+            save_path, scenario_manager.bp_meta, scenario_manager.scenario_params['current_time'], route_cache
         )
 
         scenario_manager.world.tick()
         vehicle_manager.v2x_manager.set_platoon(None)  # Adver-City does not use platooning
-        destination = carla.Location(x=cav_config['destination'][0],
-                                     y=cav_config['destination'][1],
-                                     z=cav_config['destination'][2])
-        vehicle_manager.update_info()
-        vehicle_manager.set_destination(vehicle_manager.vehicle.get_location(), destination, clean=True)
+        if plan_route:
+            destination = carla.Location(x=cav_config['destination'][0],
+                                         y=cav_config['destination'][1],
+                                         z=cav_config['destination'][2])
+            vehicle_manager.update_info()
+            vehicle_manager.set_destination(vehicle_manager.vehicle.get_location(), destination, clean=True)
 
         single_cav_list.append(vehicle_manager)
 
+    route_cache.print_hit_rate()
     return single_cav_list
 
 
@@ -231,52 +237,149 @@ def create_rsu_manager(scenario_manager, save_path):
     return rsu_list
 
 
+def clear_world(client, world):
+    """
+    Destroys the actors left in the world by the previous run and resets the world settings, traffic manager and
+    traffic lights, so that the world may be reused without reloading the map
+
+    :param client: carla.Client
+    :param world: carla.World
+    """
+    actors = world.get_actors()
+    actor_ids = [actor.id for actor in actors.filter("sensor.*")]
+    actor_ids += [actor.id for actor in actors.filter("controller.*")]
+    actor_ids += [actor.id for actor in actors.filter("vehicle.*")]
+    actor_ids += [actor.id for actor in actors.filter("walker.*")]
+    client.apply_batch_sync([carla.command.DestroyActor(actor_id) for actor_id in actor_ids], False)
+
+    # default settings (asynchronous mode), so that the server processes the destruction without being ticked
+    world.apply_settings(carla.WorldSettings())
+    # the traffic manager outlives the run in the server. It must leave synchronous mode along with the world, or it
+    # would wait for ticks that never come. Its remaining global settings are set by each run that creates traffic
+    traffic_manager = client.get_trafficmanager()
+    traffic_manager.set_synchronous_mode(False)
+    traffic_manager.set_hybrid_physics_mode(False)
+    world.freeze_all_traffic_lights(False)
+    world.reset_all_traffic_lights()
+    world.wait_for_tick()
+
+
+def create_scenario_manager(scenario_params, cav_world):
+    """
+    Creates the ScenarioManager for the scenario. If the server already has the scenario's town loaded, the world is
+    cleared and reused instead of being loaded again
+
+    :param scenario_params: dict
+        Config for current scenario execution
+    :param cav_world: opencda.CavWorld
+    :return: ScenarioManager
+    """
+    t0 = time.time()
+    town = scenario_params['town']
+
+    client = carla.Client('localhost', scenario_params['world']['client_port'])
+    client.set_timeout(10.0)
+    world = client.get_world()
+    reuse_world = world.get_map().name.split("/")[-1] == town
+    if reuse_world:
+        clear_world(client, world)
+
+    # with town=None, ScenarioManager uses the world currently loaded by the server
+    scenario_manager = sim_api.ScenarioManager(
+        scenario_params, False, '0.9.12', town=None if reuse_world else town, cav_world=cav_world
+    )
+
+    print(f"{'Reused' if reuse_world else 'Loaded'} {town} in {time.time() - t0:.2f}s")
+    return scenario_manager
+
+
 def run_scenario():
     """
-    Initializes manager classes and runs simulation on Carla
+    Initializes manager classes and runs simulation on Carla. If replay is enabled, the first run of each road
+    configuration and density records a trace, which is replayed by the runs of the other weather conditions
     """
+    replay_manager = None
+    summary_aggregator = None
+    preview_manager = None
+    cav_list, rsu_list = [], []
     try:
         # loads config from temp file. Config was not passed was argument to simplify subprocess run call
         scenario_params = OmegaConf.load("temp_config.yaml")
         scenario_params = add_spawn_from_density(scenario_params)
 
         cav_world = CavWorld()
-        scenario_manager = sim_api.ScenarioManager(
-            scenario_params, False, '0.9.12', town=scenario_params['town'], cav_world=cav_world
-        )
+        scenario_manager = create_scenario_manager(scenario_params, cav_world)
 
-        # Spawn pedestrians (done before vehicles because world.tick() is called for each pedestrian spawned)
-        num_walkers = round(scenario_params["scenario"]["num_walkers"] *
-                            scenario_params["density"]["walker_multiplier"])
-        walker_manager = WalkerManager(scenario_params, num_walkers, scenario_manager.carla_map, scenario_manager.world)
+        if scenario_params["replay"]["enabled"]:
+            replay_manager = ReplayManager(
+                get_trace_path(scenario_params), scenario_manager.world, scenario_manager.client
+            )
+        replaying = replay_manager is not None and replay_manager.replaying
+
+        if not replaying:
+            # Spawn pedestrians (done before vehicles because world.tick() is called before the walker controllers
+            # start)
+            num_walkers = round(scenario_params["scenario"]["num_walkers"] *
+                                scenario_params["density"]["walker_multiplier"])
+            walker_manager = WalkerManager(
+                scenario_params, num_walkers, scenario_manager.carla_map, scenario_manager.world,
+                scenario_manager.client
+            )
 
         # Save scenario configs and return path used for saving
         save_path = save_configs(scenario_params)
 
         # Spawn POV vehicles and RSUs
-        cav_list = create_vehicle_manager(scenario_manager, save_path)
+        cav_list = create_vehicle_manager(scenario_manager, save_path, plan_route=not replaying)
         rsu_list = create_rsu_manager(scenario_manager, save_path)
 
-        # create background traffic in carla
-        traffic_manager, bg_veh_list = scenario_manager.create_traffic_carla()
-        traffic_manager.set_random_device_seed(scenario_params["world"]["seed_traffic"])
+        # the summary is built from the data dumped at each frame, instead of reading the frames afterwards
+        summary_aggregator = SummaryAggregator(str(save_path), scenario_params)
+        for manager in cav_list + rsu_list:
+            summary_aggregator.add_dumper(manager.data_dumper)
 
-        turn_on_vehicle_lights(cav_list, bg_veh_list, scenario_params["world"]["weather"])
+        if scenario_params["preview"]["enabled"]:
+            # preview videos are encoded from the camera buffers, instead of from the saved frames afterwards
+            preview_manager = PreviewManager(
+                os.path.join("videos", scenario_params["current_time"]), get_label_from_config(scenario_params),
+                scenario_params["preview"]["scale"], round(1 / scenario_params["world"]["fixed_delta_seconds"])
+            )
+            for manager in cav_list + rsu_list:
+                preview_manager.add_dumper(manager.data_dumper)
+
+        if replaying:
+            # background traffic and walkers are spawned by the replay manager
+            print(f"Replaying {replay_manager.trace_path}...")
+            replay_manager.start_replay(cav_list)
+        else:
+            # create background traffic in carla
+            traffic_manager, bg_veh_list = scenario_manager.create_traffic_carla()
+            traffic_manager.set_random_device_seed(scenario_params["world"]["seed_traffic"])
+
+            turn_on_vehicle_lights(cav_list, bg_veh_list, scenario_params["world"]["weather"])
+
+            traffic_light_manager = TrafficLightManager(
+                cav_list, scenario_params["scenario"]["traffic_lights"],
+                scenario_params["world"]["fixed_delta_seconds"], scenario_manager.world
+            )
 
         spectator = scenario_manager.world.get_spectator()
 
-        traffic_light_manager = TrafficLightManager(
-            cav_list, scenario_params["scenario"]["traffic_lights"], scenario_params["world"]["fixed_delta_seconds"],
-            scenario_manager.world
-        )
-
         # Set weather conditions
         weather = get_weather_from_config(scenario_params["world"]["weather"], scenario_params["dataset_config"])
         scenario_manager.world.set_weather(weather)
+        lights = get_vehicle_lights(scenario_params["world"]["weather"])
 
         count = 0
         # Iterates until scenario termination
         while True:
+            if replaying:
+                if replay_manager.finished:
+                    # the recorded run ended on a tick without data dumping, so the same is done here
+                    scenario_manager.tick()
+                    break
+                replayed, replayed_speeds = replay_manager.replay_step(lights)
+
             scenario_manager.tick()
 
             transform = cav_list[0].vehicle.get_transform()
@@ -284,16 +387,30 @@ def run_scenario():
                 carla.Transform(transform.location + carla.Location(z=70), carla.Rotation(pitch=-90))
             )
 
-            traffic_light_manager.update_info(cav_list, debug=False)
+            if replaying:
+                # only sensing and data dumping are run, planning and control are replaced by the trace
+                for i, cav in enumerate(cav_list):
+                    cav.localizer.localize()
+                    cav.perception_manager.detect(cav.localizer.get_ego_pos())
+                    cav.data_dumper.run_step(cav.perception_manager, cav.localizer, cav.agent, replayed[i])
+            else:
+                traffic_light_manager.update_info(cav_list, debug=False)
 
-            for i, cav in enumerate(cav_list):
-                cav.update_info()
-                control = cav.run_step()
-                cav.vehicle.apply_control(control)
+                for i, cav in enumerate(cav_list):
+                    cav.update_info()
+                    control = cav.run_step()
+                    cav.vehicle.apply_control(control)
 
             for i, rsu in enumerate(rsu_list):
                 rsu.update_info()
-                rsu.run_step()
+                if replaying:
+                    # RSUs have no planning, only the recorded speeds replace those of the teleported actors
+                    rsu.data_dumper.run_step(rsu.perception_manager, rsu.localizer, None, {"speeds": replayed_speeds})
+                else:
+                    rsu.run_step()
+
+            if replay_manager is not None and not replaying:
+                replay_manager.record_step(cav_list)
 
             count += 1
 
@@ -306,10 +423,25 @@ def run_scenario():
                 # generates the video of current run so that error may be observed afterwards
                 p = subprocess.run(["python", "generate_video.py", path_opt, "-a y"], env=os.environ)
                 # delete data from this run
+                wait_for_manifests()
                 shutil.rmtree(save_path)
                 time.sleep(3)
                 break
 
+    except SystemExit:
+        # OpenCDA exits when the ego vehicle reaches its destination, which is when a recorded trace is complete
+        for manager in cav_list + rsu_list:
+            # the POVs are not destroyed after exiting, so their manifests are completed here
+            manager.perception_manager.finish_semantic_images()
+        wait_for_manifests()
+        if replay_manager is not None:
+            replay_manager.save()
+        if summary_aggregator is not None:
+            summary_aggregator.save()
+        if preview_manager is not None:
+            preview_manager.close()
+        raise
+
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
@@ -318,12 +450,21 @@ def run_scenario():
         print(e)
         print("#" * 20)
 
+    # data from runs that reached 1800 frames is deleted, so no summary is saved
+    if summary_aggregator is not None and os.path.isdir(save_path):
+        summary_aggregator.save()
+
+    if preview_manager is not None:
+        preview_manager.close()
+
     for cav in cav_list:
         cav.destroy()
 
     for rsu in rsu_list:
         rsu.destroy()
 
+    wait_for_manifests()
+
 
 if __name__ == "__main__":
     run_scenario()
@@ -1,5 +1,6 @@
 import os
 import carla
+from Dataset.Scripts.utils.dataset import FIRST_FRAME
 
 
 class SemanticCameraSensor:
@@ -95,7 +96,7 @@ class SemanticCameraSensor:
         :param event: event
         """
         counter = data_dumper.count + 1  # Counter is only updated after this method
-        if counter >= 60:
+        if counter >= FIRST_FRAME:
             image.save_to_disk(
                 os.path.join(save_folder, '%06d' % counter + '_semantic' + str(camera_id) + '.png'),
                 carla.ColorConverter.CityScapesPalette
@@ -108,4 +109,7 @@ class SemanticCameraSensor:
         that last frame, which requires them to be removed
         """
         counter = self.data_dumper.count + 1
-        os.remove(os.path.join(self.save_folder, '%06d' % counter + '_semantic' + str(self.id) + '.png'))
+        image_path = os.path.join(self.save_folder, '%06d' % counter + '_semantic' + str(self.id) + '.png')
+        # runs stopped for other reasons do not tick the world after the last dumped frame
+        if os.path.exists(image_path):
+            os.remove(image_path)
@@ -0,0 +1,145 @@
+import json
+import os
+import cv2
+import numpy as np
+from Dataset.Scripts.utils.projection import get_box_corners_3d, x_to_world_matrices
+
+# channels of the BEV grids, in order, and the type they are stored with
+BEV_CHANNELS = {
+    "lidar_occupancy": np.uint8,
+    "lidar_height": np.float16,
+    "vehicles": np.uint8,
+    "walkers": np.uint8
+}
+
+# version of the BEV cache layout, increased whenever channels are added, removed or change meaning, or the index
+# changes
+BEV_SCHEMA_VERSION = 2
+
+
+def get_grid_cells(points, resolution, extent):
+    """
+    Finds the cells of the BEV grid of the points, which is centered on the LiDAR and has its heading pointing up
+
+    :param points: ndarray
+        LiDAR coordinates (x forward, y right) in the first two columns
+    :param resolution: float
+        Side of each cell in meters
+    :param extent: float
+        Distance from the LiDAR to the borders of the grid in meters
+    :return: ndarray, ndarray, ndarray
+        Row and column of each point, and a mask of the points within the grid
+    """
+    size = round(2 * extent / resolution)
+    rows = np.floor((extent - points[:, 0]) / resolution).astype(np.int64)
+    cols = np.floor((points[:, 1] + extent) / resolution).astype(np.int64)
+    inside = (rows >= 0) & (rows < size) & (cols >= 0) & (cols < size)
+    return rows, cols, inside
+
+
+def rasterize_points(points, resolution, extent):
+    """
+    Scatters a point cloud to occupancy and height grids
+
+    :param points: ndarray
+        x, y, z, intensity of each point under LiDAR coordinates
+    :param resolution: float
+    :param extent: float
+    :return: ndarray, ndarray
+        Number of points in each cell (capped at 255) and maximum height of each cell (0 for empty cells)
+    """
+    size = round(2 * extent / resolution)
+    rows, cols, inside = get_grid_cells(points, resolution, extent)
+    cells = rows[inside] * size + cols[inside]
+
+    occupancy = np.minimum(np.bincount(cells, minlength=size * size), 255).astype(np.uint8)
+    height = np.full(size * size, -np.inf, dtype=np.float32)
+    np.maximum.at(height, cells, points[inside, 2].astype(np.float32))
+    height[occupancy == 0] = 0
+    return occupancy.reshape(size, size), height.reshape(size, size)
+
+
+def rasterize_boxes(objects, world_to_lidar, resolution, extent):
+    """
+    Fills the footprints of the bounding boxes of objects in a grid
+
+    :param objects: dict
+        Vehicles or walkers of a ground truth yaml, keyed by their ids
+    :param world_to_lidar: ndarray
+        Transformation matrix from world to LiDAR coordinates, with shape (4, 4)
+    :param resolution: float
+    :param extent: float
+    :return: ndarray
+        1 for cells within a box, 0 otherwise
+    """
+    size = round(2 * extent / resolution)
+    grid = np.zeros((size, size), dtype=np.uint8)
+    if not objects:
+        return grid
+
+    # the bottom face of each box is its footprint
+    corners = get_box_corners_3d(objects)[:, :4]
+    corners = corners @ world_to_lidar[:3, :3].T + world_to_lidar[:3, 3]
+    pixels = np.stack([(corners[..., 1] + extent) / resolution, (extent - corners[..., 0]) / resolution], axis=-1)
+    cv2.fillPoly(grid, list(np.round(pixels).astype(np.int32)), 1)
+    return grid
+
+
+def rasterize_frame(pov_yaml, points, resolution, extent):
+    """
+    Builds the BEV grids of a frame, under the LiDAR coordinates of the POV
+
+    :param pov_yaml: dict
+        Ground truth dictionary of the frame
+    :param points: ndarray
+        Point cloud of the frame
+    :param resolution: float
+    :param extent: float
+    :return: dict
+        Grid of each channel of BEV_CHANNELS, with shape (size, size)
+    """
+    world_to_lidar = np.linalg.inv(x_to_world_matrices(pov_yaml["lidar_pose"])[0])
+    occupancy, height = rasterize_points(points, resolution, extent)
+    return {
+        "lidar_occupancy": occupancy,
+        "lidar_height": height.astype(BEV_CHANNELS["lidar_height"]),
+        "vehicles": rasterize_boxes(pov_yaml.get("vehicles") or {}, world_to_lidar, resolution, extent),
+        "walkers": rasterize_boxes(pov_yaml.get("walkers") or {}, world_to_lidar, resolution, extent)
+    }
+
+
+def load_bev_index(path):
+    """
+    :param path: os.path
+        Path to the BEV folder of a scenario. Eg: bev/2024_06_14_12_47_41/ui_cd_s
+    :return: dict
+        Index of the BEV cache, None if it does not exist or has a different layout
+    """
+    index_path = os.path.join(path, "index.json")
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r") as infile:
+        index = json.load(infile)
+    if index.get("schema_version") != BEV_SCHEMA_VERSION:
+        return None
+    return index
+
+
+def load_bev_frame(path, pov_id, frame, index=None):
+    """
+    Loads the BEV grids of a frame from the cache
+
+    :param path: os.path
+        Path to the BEV folder of a scenario. Eg: bev/2024_06_14_12_47_41/ui_cd_s
+    :param pov_id: str
+    :param frame: str
+        Eg: 000060
+    :param index: dict
+        Index of the cache, loaded from path if None
+    :return: ndarray
+        Grids of each channel of BEV_CHANNELS, with shape (channels, size, size)
+    """
+    index = index or load_bev_index(path)
+    chunk, position = index["povs"][pov_id][frame]
+    with np.load(os.path.join(path, pov_id, chunk)) as grids:
+        return np.stack([grids[channel][position] for channel in BEV_CHANNELS]).astype(np.float32)
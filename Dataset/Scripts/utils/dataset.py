@@ -0,0 +1,247 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from Dataset.Scripts.utils.point_cloud import PLY_SUFFIX, load_point_cloud
+from Dataset.Scripts.utils.summary import get_pov_ids, get_yaml_frames, load_yaml
+
+# frame count of the first dumped frame, the frames before it are skipped while objects are spawned
+FIRST_FRAME = 60
+
+# fields of each frame and the suffix of their files within the pov folder
+FIELD_SUFFIXES = {
+    "annotations": ".yaml",
+    "gnss_imu": "_gnss_imu.yaml",
+    "lidar": PLY_SUFFIX,
+    **{f"camera{i}": f"_camera{i}.png" for i in range(4)},
+    **{f"semantic{i}": f"_semantic{i}.png" for i in range(4)}
+}
+
+
+def get_scenario_paths(path):
+    """
+    Lists the scenario folders within a path, which may be a scenario folder or a run folder containing scenarios
+
+    :param path: os.path
+        Eg: data_dumping/2024_06_14_12_47_41 or data_dumping/2024_06_14_12_47_41/ui_cd_s
+    :return: list
+    """
+    if os.path.exists(os.path.join(path, "data_protocol.yaml")):
+        return [path]
+    return sorted(os.path.join(path, folder) for folder in os.listdir(path)
+                  if os.path.exists(os.path.join(path, folder, "data_protocol.yaml")))
+
+
+def read_field(file_path, field):
+    """
+    Decodes the file of a field
+
+    :param file_path: os.path
+    :param field: str
+        One of FIELD_SUFFIXES
+    :return: dict or ndarray
+        Dictionary for yaml files, BGR image for cameras, semantic image with the CARLA tag of each pixel in the red
+        channel for semantic cameras, and x, y, z, intensity array for point clouds
+    """
+    if field == "lidar":
+        return load_point_cloud(file_path)
+    if file_path.endswith(".yaml"):
+        return load_yaml(file_path)
+    return cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+
+
+def get_size(value):
+    """
+    Estimates the memory used by a decoded field
+
+    :param value: dict or ndarray
+    :return: int
+        Size in bytes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    # yaml dictionaries are small next to images and point clouds, a rough estimate is enough
+    return 4096
+
+
+class AdverCityFrame:
+    """
+    Frame of a POV, whose fields are only loaded when accessed. Eg: frame["camera0"], frame.lidar
+
+    Parameters
+    ----------
+    dataset : AdverCityDataset
+    index : int
+        Index of the frame in the dataset.
+    """
+    def __init__(self, dataset, index):
+        self.dataset = dataset
+        self.index = index
+        self.scenario_path, self.pov_id, self.frame = dataset.frames[index]
+
+    def __getitem__(self, field):
+        return self.dataset.load(self.index, field)
+
+    def __repr__(self):
+        return f"AdverCityFrame({self.scenario_path}, pov={self.pov_id}, frame={self.frame})"
+
+    @property
+    def annotations(self):
+        return self["annotations"]
+
+    @property
+    def lidar(self):
+        return self["lidar"]
+
+    @property
+    def gnss_imu(self):
+        return self["gnss_imu"]
+
+    def camera(self, camera):
+        """
+        :param camera: int
+            Index of the camera. Eg: 0 (front view)
+        :return: ndarray
+        """
+        return self[f"camera{camera}"]
+
+    def semantic(self, camera):
+        """
+        :param camera: int
+            Index of the semantic camera. Eg: 0 (front view)
+        :return: ndarray
+        """
+        return self[f"semantic{camera}"]
+
+
+class AdverCityDataset:
+    """
+    Reader of the data dumped by Adver-City. The frames of all POVs of all scenarios in the path are indexed once, and
+    their fields (annotations, cameras, semantic cameras, point clouds and gnss/imu data) are only read when accessed.
+    Decoded fields are kept in an LRU cache bounded by a memory budget, and can be loaded ahead of the consumer by a
+    thread pool with iterate(). Point clouds with a binary version (_lidar.bin) are memory mapped instead of parsed.
+
+    Parameters
+    ----------
+    path : os.path
+        Path to a run folder or to a scenario folder. Eg: data_dumping/2024_06_14_12_47_41
+    scenarios : list
+        Labels of the scenarios to read, all scenarios in the path if None. Eg: ["ui_cd_s", "ui_cd_d"]
+    povs : list
+        Ids of the POVs to read, all POVs if None. Eg: ["-1", "698"]
+    cache_size : int
+        Memory budget of the cache of decoded fields, in bytes.
+    threads : int
+        Number of threads loading fields ahead of iterate().
+
+    Attributes
+    ----------
+    frames : list
+        (scenario path, pov id, frame) of each frame. Eg: ("data_dumping/2024_06_14_12_47_41/ui_cd_s", "698", "000060")
+    """
+    def __init__(self, path, scenarios=None, povs=None, cache_size=1 << 30, threads=4):
+        self.cache_size = cache_size
+        self.threads = threads
+
+        self.frames = []
+        for scenario_path in get_scenario_paths(path):
+            if scenarios is not None and os.path.basename(scenario_path) not in scenarios:
+                continue
+            for pov_id in get_pov_ids(scenario_path):
+                if povs is not None and pov_id not in povs:
+                    continue
+                self.frames += [(scenario_path, pov_id, yaml_frame.split(".")[0])
+                                for yaml_frame in get_yaml_frames(scenario_path, pov_id)]
+
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        if not -len(self.frames) <= index < len(self.frames):
+            raise IndexError(f"Frame {index} out of range")
+        return AdverCityFrame(self, index % len(self.frames))
+
+    def get_file_path(self, index, field):
+        """
+        :param index: int
+        :param field: str
+            One of FIELD_SUFFIXES
+        :return: os.path
+        """
+        if field not in FIELD_SUFFIXES:
+            raise KeyError(f"Unknown field {field}, expected one of {list(FIELD_SUFFIXES)}")
+        scenario_path, pov_id, frame = self.frames[index]
+        return os.path.join(scenario_path, pov_id, frame + FIELD_SUFFIXES[field])
+
+    def load(self, index, field):
+        """
+        Loads a field of a frame, from the cache if it has been decoded already
+
+        :param index: int
+        :param field: str
+            One of FIELD_SUFFIXES
+        :return: dict or ndarray
+        """
+        key = (index, field)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key][0]
+
+        value = read_field(self.get_file_path(index, field), field)
+        if value is None:
+            raise FileNotFoundError(self.get_file_path(index, field))
+        # memory mapped point clouds are backed by the page cache, they are cheap to map again
+        if isinstance(value, np.memmap):
+            return value
+
+        size = get_size(value)
+        with self.lock:
+            if key not in self.cache and size <= self.cache_size:
+                self.cache[key] = (value, size)
+                self.cached_bytes += size
+                # evicts the least recently used fields until the cache fits the memory budget
+                while self.cached_bytes > self.cache_size:
+                    _, (_, evicted_size) = self.cache.popitem(last=False)
+                    self.cached_bytes -= evicted_size
+        return value
+
+    def load_fields(self, index, fields):
+        """
+        :param index: int
+        :param fields: list
+        :return: dict
+            Loaded value of each field
+        """
+        return {field: self.load(index, field) for field in fields}
+
+    def iterate(self, fields, indices=None):
+        """
+        Iterates over frames with the given fields loaded, which are read by a thread pool ahead of the consumer. At most
+        2 * threads frames are loaded ahead
+
+        :param fields: list
+            Fields to load. Eg: ["annotations", "lidar"]
+        :param indices: list
+            Indexes of the frames, all frames in order if None
+        :return: generator
+            (AdverCityFrame, dict with the loaded fields) for each frame
+        """
+        indices = range(len(self.frames)) if indices is None else indices
+        with ThreadPoolExecutor(self.threads) as executor:
+            pending_results = deque()
+            for index in indices:
+                pending_results.append((index, executor.submit(self.load_fields, index, fields)))
+                if len(pending_results) >= 2 * self.threads:
+                    index, result = pending_results.popleft()
+                    yield AdverCityFrame(self, index), result.result()
+
+            while pending_results:
+                index, result = pending_results.popleft()
+                yield AdverCityFrame(self, index), result.result()
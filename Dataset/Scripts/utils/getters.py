@@ -1,3 +1,6 @@
+import os
+
+
 def get_label_from_config(config):
     """
     Helper function
@@ -12,3 +15,56 @@ def get_label_from_config(config):
                       dataset_config["weather_abbreviation"] + "_" +
                       dataset_config["density_abbreviation"])
     return scenario_label
+
+
+def get_spawn_areas(config):
+    """
+    Calculates the rectangular spawn areas (x_min, x_max, y_min, y_max) around each POV (CAV or RSU) and along the
+    paths taken by the CAVs. Used for both vehicle and walker spawning
+
+    :param config: dict
+        Config dictionary from Omegaconf.load
+    :return: list
+        List of spawn areas (x_min, x_max, y_min, y_max)
+    """
+    cav_list = config["scenario"]["single_cav_list"]
+    rsu_list = config["scenario"]["rsu_list"]
+    spawn_distance = config["scenario"]["spawning_distance"]
+    spawn_distance_to_path = config["scenario"]["spawning_distance_to_path"]
+
+    spawn_areas = []
+
+    for pov in cav_list + rsu_list:
+        # Defines spawn areas around the CAVs and RSUs
+        spawn_pos = pov["spawn_position"]
+        x_min = spawn_pos[0] - spawn_distance
+        x_max = spawn_pos[0] + spawn_distance
+        y_min = spawn_pos[1] - spawn_distance
+        y_max = spawn_pos[1] + spawn_distance
+        spawn_areas.append([x_min, x_max, y_min, y_max])
+
+    for cav in cav_list:
+        # Defines spawn areas along the paths that will be taken by the CAVs
+        spawn_pos = cav["spawn_position"]
+        destination = cav["destination"]
+        x_min = min(spawn_pos[0], destination[0]) - spawn_distance_to_path
+        x_max = max(spawn_pos[0], destination[0]) + spawn_distance_to_path
+        y_min = min(spawn_pos[1], destination[1]) - spawn_distance_to_path
+        y_max = max(spawn_pos[1], destination[1]) + spawn_distance_to_path
+        spawn_areas.append([x_min, x_max, y_min, y_max])
+
+    return spawn_areas
+
+
+def get_trace_path(config):
+    """
+    Path of the replay trace of the scenario. Traces are shared by all weather conditions of the same road
+    configuration and density within a run
+
+    :param config: dict
+        Config dictionary from Omegaconf.load
+    :return: os.path
+    """
+    dataset_config = config["dataset_config"]
+    trace_name = dataset_config["scenario_abbreviation"] + "_" + dataset_config["density_abbreviation"] + ".pkl"
+    return os.path.join(config["cache"]["path"], "traces", config["current_time"], trace_name)
@@ -0,0 +1,140 @@
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# manifest of the files saved by each POV, one line is appended per frame
+MANIFEST_FILE = "manifest.jsonl"
+
+# single thread calculating the checksums of the files saved during the simulation, so that they are not read again
+# within the simulation tick. Having a single thread keeps the records of each POV in order
+_manifest_executor = None
+
+
+def get_file_checksum(path):
+    """
+    CRC32 of a file, which is fast enough to be calculated while the simulation is running
+
+    :param path: os.path
+    :return: int
+    """
+    checksum = 0
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            checksum = zlib.crc32(block, checksum)
+    return checksum
+
+
+def get_manifest_entries(pov_path, file_names):
+    """
+    :param pov_path: os.path
+        Path to the pov folder
+    :param file_names: list
+        Names of files within the pov folder
+    :return: dict
+        [size, checksum] of each file
+    """
+    files = {}
+    for file_name in file_names:
+        file_path = os.path.join(pov_path, file_name)
+        files[file_name] = [os.path.getsize(file_path), get_file_checksum(file_path)]
+    return files
+
+
+def write_manifest_record(pov_path, frame, files):
+    """
+    Appends a record of files of a frame to the manifest of a POV
+
+    :param pov_path: os.path
+        Path to the pov folder
+    :param frame: str
+        Eg: 000060
+    :param files: dict
+        [size, checksum] of each file, from get_manifest_entries()
+    """
+    with open(os.path.join(pov_path, MANIFEST_FILE), "a") as outfile:
+        outfile.write(json.dumps({"frame": frame, "files": files}) + "\n")
+
+
+def write_manifest_entries(pov_path, frame, file_names):
+    """
+    Reads the size and checksum of files of a frame and appends their record to the manifest of a POV. Run by the
+    background thread of append_manifest(), so errors are printed instead of raised
+
+    :param pov_path: os.path
+        Path to the pov folder
+    :param frame: str
+        Eg: 000060
+    :param file_names: list
+        Names of the files saved for the frame, within the pov folder
+    """
+    try:
+        write_manifest_record(pov_path, frame, get_manifest_entries(pov_path, file_names))
+    except OSError as e:
+        # eg: the data of runs that reach 1800 frames is deleted
+        print(f"### ERROR: manifest record of frame {frame} of {pov_path} could not be written: {e} ###")
+
+
+def append_manifest(pov_path, frame, file_names):
+    """
+    Appends the size and checksum of files of a frame to the manifest of a POV. The files are read by a background
+    thread, wait_for_manifests() must be called before the manifests are used
+
+    :param pov_path: os.path
+        Path to the pov folder
+    :param frame: str
+        Eg: 000060
+    :param file_names: list
+        Names of the files saved for the frame, within the pov folder
+    """
+    global _manifest_executor
+    if _manifest_executor is None:
+        _manifest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="manifest")
+    _manifest_executor.submit(write_manifest_entries, pov_path, frame, file_names)
+
+
+def wait_for_manifests():
+    """
+    Blocks until all records appended by append_manifest() have been written
+    """
+    global _manifest_executor
+    if _manifest_executor is not None:
+        _manifest_executor.shutdown(wait=True)
+        _manifest_executor = None
+
+
+def load_manifest(pov_path):
+    """
+    Loads the manifest of a POV. Files of the same frame may be recorded in multiple lines, which are merged
+
+    :param pov_path: os.path
+        Path to the pov folder
+    :return: dict
+        [size, checksum] of each file of each frame, keyed by frame and file name, or None if the POV has no manifest
+    """
+    manifest_path = os.path.join(pov_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    manifest = {}
+    with open(manifest_path, "r") as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a crash while appending leaves an incomplete last line, whose files are reported as orphans
+                continue
+            manifest.setdefault(record["frame"], {}).update(record["files"])
+    return dict(sorted(manifest.items()))
+
+
+def get_manifest_files(manifest, suffix):
+    """
+    :param manifest: dict
+        Manifest loaded by load_manifest()
+    :param suffix: str
+        Eg: _camera0.png
+    :return: list
+        Sorted names of the files ending with the suffix
+    """
+    return sorted(file_name for files in manifest.values() for file_name in files if file_name.endswith(suffix))
@@ -0,0 +1,82 @@
+import os
+import carla
+import numpy as np
+from tqdm import tqdm
+
+
+class NavigationCache:
+    """
+    Per-town cache of locations sampled from the navigation mesh (sidewalks and crosswalks). Samples are taken from
+    the server only once per town and stored on disk, so that spawn points within the spawn areas can be drawn from a
+    pre-filtered pool instead of rejecting random locations one RPC at a time.
+    """
+    def __init__(self, world, town, cache_path, num_samples=200000):
+        """
+        :param world: carla.World
+        :param town: str
+            Name of the town loaded in the world. Eg: Town03
+        :param cache_path: os.path
+            Folder where the cache files are stored
+        :param num_samples: int
+            Number of navigation mesh samples taken when the cache is created
+        """
+        self.world = world
+        self.town = town
+        self.file_path = os.path.join(cache_path, f"{town}_navigation.npy")
+        self.num_samples = num_samples
+        self.locations = self.load()
+
+    def load(self):
+        """
+        Loads the navigation mesh samples of the town from disk, creating the cache file if it does not exist
+
+        :return: np.ndarray
+            Array of shape (num_samples, 3) with the x, y, z coordinates of the samples
+        """
+        if os.path.isfile(self.file_path):
+            return np.load(self.file_path)
+
+        print(f"Creating navigation cache for {self.town}...")
+        locations = np.zeros((self.num_samples, 3))
+        for i in tqdm(range(self.num_samples)):
+            location = self.world.get_random_location_from_navigation()
+            locations[i] = [location.x, location.y, location.z]
+
+        if not os.path.exists(os.path.dirname(self.file_path)):
+            os.makedirs(os.path.dirname(self.file_path))
+        np.save(self.file_path, locations)
+
+        return locations
+
+    def filter(self, spawn_areas):
+        """
+        Returns the samples that are within any of the spawn areas
+
+        :param spawn_areas: list
+            List of spawn areas (x_min, x_max, y_min, y_max)
+        :return: np.ndarray
+            Array of shape (n, 3) with the samples within the spawn areas
+        """
+        areas = np.asarray(spawn_areas, dtype=float).reshape(-1, 4)
+        x = self.locations[:, 0, np.newaxis]
+        y = self.locations[:, 1, np.newaxis]
+
+        inside = (areas[:, 0] < x) & (x < areas[:, 1]) & (areas[:, 2] < y) & (y < areas[:, 3])
+        return self.locations[inside.any(axis=1)]
+
+    def spawn_points(self, spawn_areas, seed):
+        """
+        Generator of spawn points within the spawn areas. Points are drawn without replacement from the filtered
+        samples, in an order defined by the seed
+
+        :param spawn_areas: list
+            List of spawn areas (x_min, x_max, y_min, y_max)
+        :param seed: int
+        :return: generator
+            Yields carla.Location
+        """
+        locations = self.filter(spawn_areas)
+        rng = np.random.default_rng(seed)
+
+        for x, y, z in locations[rng.permutation(len(locations))]:
+            yield carla.Location(x=float(x), y=float(y), z=float(z))
@@ -0,0 +1,144 @@
+import os
+import numpy as np
+
+PLY_SUFFIX = "_lidar.ply"
+# float32 x, y, z, intensity per point, same layout as KITTI's velodyne files
+BIN_SUFFIX = "_lidar.bin"
+POINT_FIELDS = 4
+
+
+def read_ply_header(infile):
+    """
+    Reads the header of a PLY file, leaving the file positioned at the start of the data
+
+    :param infile: file
+        PLY file opened in binary mode
+    :return: int, list, str
+        Number of points, names of the properties of each point and format of the data. Eg: ascii
+    """
+    num_points, properties, data_format = 0, [], None
+    for line in infile:
+        words = line.decode("ascii").split()
+        if not words:
+            continue
+        if words[0] == "format":
+            data_format = words[1]
+        elif words[:2] == ["element", "vertex"]:
+            num_points = int(words[2])
+        elif words[0] == "property":
+            properties.append(words[-1])
+        elif words[0] == "end_header":
+            break
+    return num_points, properties, data_format
+
+
+def read_ply(path):
+    """
+    Reads an ASCII point cloud saved by RevampedDataDumper.save_lidar_points(). The intensity of each point is stored
+    by Open3D in its red channel, scaled to 0-255
+
+    :param path: os.path
+    :return: ndarray
+        float32 array with x, y, z and intensity of each point, with shape (number of points, 4)
+    """
+    with open(path, "rb") as infile:
+        num_points, properties, data_format = read_ply_header(infile)
+        if data_format != "ascii":
+            raise ValueError(f"{path} is not an ASCII PLY file")
+        values = np.fromstring(infile.read().decode("ascii"), dtype=np.float64, sep=" ")
+
+    if values.size != num_points * len(properties):
+        raise ValueError(f"{path} has {values.size / max(len(properties), 1):.0f} points, but its header declares "
+                         f"{num_points}")
+    values = values.reshape(num_points, len(properties))
+    points = np.empty((num_points, POINT_FIELDS), dtype=np.float32)
+    points[:, :3] = values[:, [properties.index("x"), properties.index("y"), properties.index("z")]]
+    points[:, 3] = values[:, properties.index("red")] / 255 if "red" in properties else 0
+    return points
+
+
+def get_bin_path(ply_path):
+    """
+    :param ply_path: os.path
+        Path to a point cloud. Eg: 698/000060_lidar.ply
+    :return: os.path
+        Path to its binary version. Eg: 698/000060_lidar.bin
+    """
+    return ply_path[:-len(PLY_SUFFIX)] + BIN_SUFFIX
+
+
+def load_point_cloud(ply_path):
+    """
+    Loads a point cloud, memory mapping its binary version if it has been converted, and parsing the PLY file otherwise
+
+    :param ply_path: os.path
+    :return: ndarray
+        float32 array with x, y, z and intensity of each point, with shape (number of points, 4)
+    """
+    bin_path = get_bin_path(ply_path)
+    if os.path.exists(bin_path):
+        # empty files can not be memory mapped
+        if os.path.getsize(bin_path) == 0:
+            return np.zeros((0, POINT_FIELDS), dtype=np.float32)
+        return np.memmap(bin_path, dtype=np.float32, mode="r").reshape(-1, POINT_FIELDS)
+    return read_ply(ply_path)
+
+
+def get_range_mask(points, max_range):
+    """
+    Finds the points within a range from the origin, in the horizontal plane
+
+    :param points: ndarray
+        Points with x and y in the first two columns
+    :param max_range: float
+        Range in meters
+    :return: ndarray
+        Boolean mask of the points within range
+    """
+    return np.einsum("ij,ij->i", points[:, :2], points[:, :2]) <= max_range ** 2
+
+
+def voxel_downsample(points, voxel_size):
+    """
+    Keeps the first point of each voxel
+
+    :param points: ndarray
+        Points with x, y and z in the first three columns
+    :param voxel_size: float
+        Side of the voxels in meters
+    :return: ndarray
+        Indexes of the points kept, in their original order
+    """
+    voxels = np.floor(points[:, :3] / voxel_size).astype(np.int64)
+    _, indexes = np.unique(voxels, axis=0, return_index=True)
+    indexes.sort()
+    return indexes
+
+
+def write_pcd(path, points):
+    """
+    Saves a point cloud as a binary PCD file, with its intensity in the red channel, as in OPV2V's point clouds
+
+    :param path: os.path
+    :param points: ndarray
+        x, y, z, intensity of each point
+    """
+    red = np.round(np.clip(points[:, 3], 0, 1) * 255).astype(np.uint32) << 16
+    data = np.empty((len(points), 4), dtype=np.float32)
+    data[:, :3] = points[:, :3]
+    data[:, 3] = red.view(np.float32)
+
+    header = ("# .PCD v0.7 - Point Cloud Data file format\n"
+              "VERSION 0.7\n"
+              "FIELDS x y z rgb\n"
+              "SIZE 4 4 4 4\n"
+              "TYPE F F F F\n"
+              "COUNT 1 1 1 1\n"
+              f"WIDTH {len(points)}\n"
+              "HEIGHT 1\n"
+              "VIEWPOINT 0 0 0 1 0 0 0\n"
+              f"POINTS {len(points)}\n"
+              "DATA binary\n")
+    with open(path, "wb") as outfile:
+        outfile.write(header.encode("ascii"))
+        outfile.write(data.tobytes())
@@ -0,0 +1,179 @@
+import warnings
+import numpy as np
+
+# corners of a box with unit extent, in the same order as OpenCDA's sensor_transformation.create_bb_points()
+BOX_CORNERS = np.array([[1, 1, -1], [-1, 1, -1], [-1, -1, -1], [1, -1, -1],
+                        [1, 1, 1], [-1, 1, 1], [-1, -1, 1], [1, -1, 1]])
+
+# from UE4 axes (x forward, y right, z up) to camera axes (x right, y down, z forward)
+UE4_TO_CAMERA = np.array([[0, 1, 0, 0],
+                          [0, 0, -1, 0],
+                          [1, 0, 0, 0],
+                          [0, 0, 0, 1]], dtype=np.float64)
+
+# pairs of corners joined by the edges of a box
+BOX_EDGES = np.array([[0, 1], [1, 2], [2, 3], [3, 0],
+                      [4, 5], [5, 6], [6, 7], [7, 4],
+                      [0, 4], [1, 5], [2, 6], [3, 7]])
+
+# depth of the near plane at which box edges crossing the camera plane are clipped, in meters
+NEAR_PLANE = 0.01
+
+
+def x_to_world_matrices(poses):
+    """
+    Batched version of OpenCDA's sensor_transformation.x_to_world_transformation()
+
+    :param poses: ndarray
+        Poses [x, y, z, roll, yaw, pitch] under CARLA map coordinates, with shape (N, 6)
+    :return: ndarray
+        Transformation matrices to world coordinates, with shape (N, 4, 4)
+    """
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+    roll, yaw, pitch = np.radians(poses[:, 3:]).T
+    c_r, s_r = np.cos(roll), np.sin(roll)
+    c_y, s_y = np.cos(yaw), np.sin(yaw)
+    c_p, s_p = np.cos(pitch), np.sin(pitch)
+
+    matrices = np.zeros((len(poses), 4, 4))
+    matrices[:, :3, 3] = poses[:, :3]
+    matrices[:, 3, 3] = 1
+    matrices[:, 0, 0] = c_p * c_y
+    matrices[:, 0, 1] = c_y * s_p * s_r - s_y * c_r
+    matrices[:, 0, 2] = -c_y * s_p * c_r - s_y * s_r
+    matrices[:, 1, 0] = s_y * c_p
+    matrices[:, 1, 1] = s_y * s_p * s_r + c_y * c_r
+    matrices[:, 1, 2] = -s_y * s_p * c_r + c_y * s_r
+    matrices[:, 2, 0] = s_p
+    matrices[:, 2, 1] = -c_p * s_r
+    matrices[:, 2, 2] = c_p * c_r
+    return matrices
+
+
+def get_box_corners_3d(objects):
+    """
+    Calculates the corners of the 3D bounding boxes of objects, for all objects at once
+
+    :param objects: dict
+        Vehicles or walkers of a ground truth yaml, keyed by their ids
+    :return: ndarray
+        World coordinates of the corners of each box, with shape (number of objects, 8, 3)
+    """
+    if not objects:
+        return np.zeros((0, 8, 3))
+
+    values = list(objects.values())
+    # "angle" is [roll, yaw, pitch], same order as the rotation of a pose
+    poses = np.array([list(value["location"]) + list(value["angle"]) for value in values])
+    # walkers have no center, their bounding boxes are centered on their location
+    centers = np.array([value.get("center", [0, 0, 0]) for value in values])
+    extents = np.array([value["extent"] for value in values])
+
+    corners = centers[:, None, :] + BOX_CORNERS[None, :, :] * extents[:, None, :]
+    matrices = x_to_world_matrices(poses)
+    return np.einsum("nij,nkj->nki", matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+
+
+def get_camera_parameters(pov_yaml):
+    """
+    Reads the parameters of all cameras of a POV from its ground truth dictionary
+
+    :param pov_yaml: dict
+        Ground truth dictionary of a frame
+    :return: ndarray, ndarray
+        World to camera matrices, with shape (number of cameras, 4, 4), and intrinsic matrices, with shape
+        (number of cameras, 3, 3)
+    """
+    camera_keys = sorted(key for key in pov_yaml if key.startswith("camera"))
+    camera_to_world = x_to_world_matrices([pov_yaml[key]["cords"] for key in camera_keys])
+    intrinsics = np.array([pov_yaml[key]["intrinsic"] for key in camera_keys], dtype=np.float64).reshape(-1, 3, 3)
+    return np.linalg.inv(camera_to_world), intrinsics
+
+
+def project_to_cameras(points, world_to_camera, intrinsics):
+    """
+    Projects world points to the images of multiple cameras in a single batched operation
+
+    :param points: ndarray
+        World coordinates, with shape (M, 3)
+    :param world_to_camera: ndarray
+        World to camera matrices, with shape (C, 4, 4)
+    :param intrinsics: ndarray
+        Intrinsic matrices, with shape (C, 3, 3)
+    :return: ndarray, ndarray
+        Pixel coordinates (u, v) of each point in each camera, with shape (C, M, 2), and depth of each point in each
+        camera, with shape (C, M). Points behind a camera have negative depth
+    """
+    homogeneous = np.concatenate([points.reshape(-1, 3), np.ones((points.size // 3, 1))], axis=1)
+    sensor_points = world_to_camera @ homogeneous.T
+
+    camera_points = UE4_TO_CAMERA[:3] @ sensor_points
+    image_points = intrinsics @ camera_points
+
+    depth = image_points[:, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pixels = image_points[:, :2] / depth[:, None]
+    return pixels.transpose(0, 2, 1), depth
+
+
+def get_2d_boxes(pixels, depth, width, height):
+    """
+    Calculates the 2D bounding boxes of projected 3D boxes, for all objects and cameras at once. Boxes are built from
+    the corners in front of the near plane and from the points where the box edges cross it, so that objects crossing
+    the camera plane (eg: vehicles alongside the POV) extend to the borders of the image
+
+    :param pixels: ndarray
+        Pixel coordinates of the box corners, with shape (C, N, 8, 2)
+    :param depth: ndarray
+        Depth of the box corners, with shape (C, N, 8)
+    :param width: int
+        Image width
+    :param height: int
+        Image height
+    :return: ndarray, ndarray, ndarray
+        Boxes [x_min, y_min, x_max, y_max] clipped to the image (zeros if not in the frustum), with shape (C, N, 4).
+        Whether each object is in the camera frustum (at least partially in front of the camera and within the image),
+        with shape (C, N). Truncation of each box, the fraction of its area outside the image (1 if it is not in the
+        frustum), with shape (C, N)
+    """
+    # homogeneous image coordinates are linear along the edges, unlike pixel coordinates
+    homogeneous = np.concatenate([pixels * depth[..., None], depth[..., None]], axis=-1)
+    start, end = homogeneous[..., BOX_EDGES[:, 0], :], homogeneous[..., BOX_EDGES[:, 1], :]
+    crosses = (start[..., 2] > NEAR_PLANE) != (end[..., 2] > NEAR_PLANE)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # only used for the edges that cross the near plane, t is NaN or infinite for the others
+        t = (start[..., 2] - NEAR_PLANE) / (start[..., 2] - end[..., 2])
+        clipped_points = (start + t[..., None] * (end - start))[..., :2] / NEAR_PLANE
+
+    candidates = np.concatenate([pixels, clipped_points], axis=-2)
+    in_front = np.concatenate([depth > NEAR_PLANE, crosses], axis=-1)
+    masked_u = np.where(in_front, candidates[..., 0], np.nan)
+    masked_v = np.where(in_front, candidates[..., 1], np.nan)
+
+    with warnings.catch_warnings():
+        # objects completely behind a camera have no corners to reduce, their boxes are left as NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        boxes = np.stack([np.nanmin(masked_u, axis=-1), np.nanmin(masked_v, axis=-1),
+                          np.nanmax(masked_u, axis=-1), np.nanmax(masked_v, axis=-1)], axis=-1)
+
+    clipped = np.clip(boxes, 0, [width, height, width, height])
+    area = (boxes[..., 2] - boxes[..., 0]) * (boxes[..., 3] - boxes[..., 1])
+    clipped_area = (clipped[..., 2] - clipped[..., 0]) * (clipped[..., 3] - clipped[..., 1])
+
+    in_frustum = in_front.any(axis=-1) & (clipped_area > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        truncation = np.where(in_frustum, 1 - clipped_area / area, 1.0)
+    return np.where(in_frustum[..., None], clipped, 0.0), in_frustum, truncation
+
+
+def get_pairwise_transforms(poses):
+    """
+    Calculates the transformation matrices between all pairs of sensors at once
+
+    :param poses: ndarray
+        Poses [x, y, z, roll, yaw, pitch] of the sensors under CARLA map coordinates, with shape (P, 6)
+    :return: ndarray
+        Matrices with shape (P, P, 4, 4), where [i, j] transforms coordinates of sensor j to coordinates of sensor i
+    """
+    to_world = x_to_world_matrices(poses)
+    return np.linalg.inv(to_world)[:, None] @ to_world[None, :]
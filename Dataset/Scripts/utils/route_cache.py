@@ -0,0 +1,104 @@
+import json
+import os
+from opencda.core.plan.local_planner_behavior import RoadOption
+
+
+class RouteCache:
+    """
+    Persistent cache of routes planned by OpenCDA's global route planner. Spawn and destination pairs are the same for
+    all weather and density variants of a road configuration, so routes are planned once and reused afterwards.
+    Routes are stored per town as lists of OpenDRIVE waypoint coordinates (road_id, lane_id, s) and road options, and
+    are rebuilt with carla.Map.get_waypoint_xodr().
+    """
+    def __init__(self, cache_path, carla_map):
+        """
+        :param cache_path: os.path
+            Folder where the cache files are stored
+        :param carla_map: carla.Map
+        """
+        self.carla_map = carla_map
+        town = carla_map.name.split("/")[-1]
+        self.file_path = os.path.join(cache_path, f"{town}_routes.json")
+
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(self.file_path):
+            with open(self.file_path, "r") as infile:
+                self.routes = json.load(infile)
+        else:
+            self.routes = {}
+
+    def get_key(self, start_location, end_location, sampling_resolution):
+        """
+        :param start_location: carla.Location
+        :param end_location: carla.Location
+        :param sampling_resolution: float
+            Distance between waypoints of the route used by the planner
+        :return: str
+            Key of the route, with locations rounded to 10 cm
+        """
+        return "%.1f_%.1f_%.1f_%.1f_%.1f_%.1f_%.2f" % (
+            start_location.x, start_location.y, start_location.z,
+            end_location.x, end_location.y, end_location.z,
+            sampling_resolution
+        )
+
+    def get(self, start_location, end_location, sampling_resolution):
+        """
+        Returns the cached route between the two locations
+
+        :param start_location: carla.Location
+        :param end_location: carla.Location
+        :param sampling_resolution: float
+        :return: list
+            List of (carla.Waypoint, RoadOption) tuples, as returned by GlobalRoutePlanner.trace_route(), or None if the
+            route is not in the cache
+        """
+        key = self.get_key(start_location, end_location, sampling_resolution)
+        if key not in self.routes:
+            self.misses += 1
+            return None
+
+        route = []
+        for road_id, lane_id, s, road_option in self.routes[key]:
+            waypoint = self.carla_map.get_waypoint_xodr(road_id, lane_id, s)
+            if waypoint is None:
+                # the map has changed since the route was cached
+                self.misses += 1
+                return None
+            route.append((waypoint, RoadOption(road_option)))
+
+        self.hits += 1
+        return route
+
+    def add(self, start_location, end_location, sampling_resolution, route):
+        """
+        Adds a route to the cache and saves it to disk
+
+        :param start_location: carla.Location
+        :param end_location: carla.Location
+        :param sampling_resolution: float
+        :param route: list
+            List of (carla.Waypoint, RoadOption) tuples
+        """
+        key = self.get_key(start_location, end_location, sampling_resolution)
+        self.routes[key] = [[waypoint.road_id, waypoint.lane_id, waypoint.s, road_option.value]
+                            for waypoint, road_option in route]
+
+        if not os.path.exists(os.path.dirname(self.file_path)):
+            os.makedirs(os.path.dirname(self.file_path))
+
+        # main.py may kill the run at any moment, so the file is replaced in a single rename
+        with open(self.file_path + ".part", "w") as outfile:
+            json.dump(self.routes, outfile)
+        os.replace(self.file_path + ".part", self.file_path)
+
+    def print_hit_rate(self):
+        """
+        Prints the number of routes reused from the cache
+        """
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        print(f"Route cache: {self.hits}/{total} routes reused ({100 * self.hits / total:.1f}% hit rate)")
@@ -1,5 +1,8 @@
 import copy
+import hashlib
+import json
 import os.path
+from multiprocessing import Pool
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -7,12 +10,104 @@ from matplotlib import colors
 from Dataset.Configs.enums.density import Density
 from Dataset.Configs.enums.scenarios import Scenarios
 from Dataset.Configs.enums.weather import WeatherCondition, Daytime
+from Dataset.Scripts.utils.summary import load_columnar_summary, load_yaml, summary_to_columns
+
+# version of the partial state saved by Stats.get_state(), increased whenever the statistics or the state change
+STATS_STATE_VERSION = 1
+
+
+class RunningStats:
+    """
+    Count, sum, mean and variance of a series of values, updated in batches with Chan et al.'s parallel algorithm, so
+    that the values themselves do not have to be kept in memory
+    """
+    def __init__(self):
+        self.count = 0
+        # an empty series sums to 0.0, same as np.sum([])
+        self.total = 0.0
+        self.mean = np.float64(0)
+        self.m2 = np.float64(0)
+
+    def update(self, values):
+        """
+        Adds a batch of values to the series
+
+        :param values: list or ndarray
+        """
+        values = np.asarray(values)
+        if values.size == 0:
+            return
+
+        batch = RunningStats()
+        batch.count = values.size
+        batch.total = values.sum().item()
+        batch.mean = np.mean(values, dtype=np.float64)
+        batch.m2 = np.sum((values - batch.mean) ** 2)
+        self.merge(batch)
+
+    def merge(self, other):
+        """
+        Adds all values of another series to this one
+
+        :param other: RunningStats
+        """
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.total = other.total if self.count == 0 else self.total + other.total
+        self.count = count
+
+    def get_state(self):
+        """
+        :return: list
+            JSON serializable state of the series: [count, total, mean, M2]
+        """
+        return [self.count, self.total, float(self.mean), float(self.m2)]
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        :param state: list
+            State returned by get_state()
+        :return: RunningStats
+        """
+        running_stats = cls()
+        running_stats.count, running_stats.total = state[0], state[1]
+        running_stats.mean, running_stats.m2 = np.float64(state[2]), np.float64(state[3])
+        return running_stats
+
+    @property
+    def std(self):
+        """
+        :return: np.float64
+            Population standard deviation, same as np.std
+        """
+        return np.sqrt(self.m2 / self.count)
 
 
 class Stats:
     """
     Used to store information on each frame of the simulation and then generate statistics of the scenarios
     """
+    # charts that can be generated, keyed by name, with the method that creates them, the keys of the state they are
+    # created from and their output file
+    CHARTS = {
+        "stats": ("scenario_stats_table", ["scenarios"], "stats.csv"),
+        "weather": ("weather_frames_pie_chart", ["weather"], "weather.pdf"),
+        "time_of_day": ("time_of_day_frames_pie_chart", ["time_of_day"], "time_of_day.pdf"),
+        "class_histogram": ("plot_class_histogram", ["class_histogram"], "class_histogram.pdf"),
+        "vehicles_per_speed": ("num_vehicles_per_speed", ["traffic_speed"], "vehicles_per_speed.pdf"),
+        "density_by_range_to_ego": ("density_by_range_to_ego", ["density"], "density_by_range_to_ego.pdf"),
+        "num_frames_per_ego_speed": ("num_frames_per_ego_speed", ["ego_speed"], "num_frames_per_ego_speed.pdf"),
+        "num_keyframes_per_num_annotations": ("num_keyframes_per_num_annotations", ["num_keyframes"],
+                                              "num_keyframes_per_num_annotations.pdf"),
+        "polar_density_map": ("polar_density_map", ["polar_histogram"], "polar_density_map.pdf")
+    }
+
     def __init__(self, path):
         """
         :param path: os.path
@@ -27,11 +122,12 @@ class Stats:
                 "rural_curved_non_junction"
             }
             Values: (dict) {
-                Each scenario value is a dict itself, with lists storing information on objects in the scenarios
+                Each scenario value is a dict itself, with running statistics of the simulations and objects in the
+                scenarios
                 Keys: {
                     "num_frames", "num_vehicles", "num_walkers", "traffic_speed", "cav_speed"
                 }
-                Values: (list)
+                Values: (RunningStats)
             }
         }
         weather (dict):
@@ -68,11 +164,11 @@ class Stats:
             Stores discretized values for the speed of the ego vehicle
         num_keyframes (ndarray, dim 15):
             Store discretized values of the amount of annotations in each keyframe
-        angles_to_ego (list):
-            Stores the relative angle of objects in the scene to the ego vehicle (if object is within ego`s line of
-            sight)
-        distances_to_ego (list):
-            Stores the distance of objects in the scene to the ego vehicle (if object is within ego`s line of sight)
+        polar_bins (tuple):
+            Angle (radians) and distance (m) bin edges of the polar density map
+        polar_histogram (ndarray, dim 36x16):
+            Stores the number of objects in the scene per relative angle and distance to the ego vehicle (if object is
+            within ego`s line of sight)
         discretization (dict):
             Stores parameters used to discretize data for plotting
             Keys: {
@@ -96,11 +192,11 @@ class Stats:
         self.path = path
 
         base_scenario = {
-            "num_frames": [],
-            "num_vehicles": [],
-            "num_walkers": [],
-            "traffic_speed": [],
-            "cav_speed": []
+            "num_frames": RunningStats(),
+            "num_vehicles": RunningStats(),
+            "num_walkers": RunningStats(),
+            "traffic_speed": RunningStats(),
+            "cav_speed": RunningStats()
         }
 
         self.scenarios = {}
@@ -132,8 +228,8 @@ class Stats:
         self.ego_speed = np.zeros(101)
         self.num_keyframes = np.zeros(15)
 
-        self.angles_to_ego = []
-        self.distances_to_ego = []
+        self.polar_bins = (np.linspace(0, 2 * np.pi, 37), np.linspace(0, 200, 17))
+        self.polar_histogram = np.zeros((len(self.polar_bins[0]) - 1, len(self.polar_bins[1]) - 1))
 
         self.discretization = {
             "speed": {"max": 75, "bins": 75},
@@ -158,47 +254,98 @@ class Stats:
 
     def read_summary_data(self, summary):
         """
-        Reads data from a summary file and saves it to class attributes
+        Reads data from a summary file and saves it to class attributes. All frames and objects of the summary are
+        processed at once, as arrays
 
         :param summary: dict
-            Dictionary with data read from the summary yaml file
+            Columnar summary loaded from the summary npz file, or dictionary with data read from the summary yaml file,
+            which is converted to the columnar format
         """
+        if "schema_version" not in summary:
+            summary = summary_to_columns(summary)
+
         label = summary["scenario"]
         num_frames = summary["num_frames"]
-        self.scenarios[label]["num_frames"].append(num_frames)
-        self.scenarios[label]["num_vehicles"].append(summary["num_vehicles"])
-        self.scenarios[label]["num_walkers"].append(summary["num_walkers"])
+        self.scenarios[label]["num_frames"].update([num_frames])
+        self.scenarios[label]["num_vehicles"].update([summary["num_vehicles"]])
+        self.scenarios[label]["num_walkers"].update([summary["num_walkers"]])
 
         self.weather[summary["weather"]] += num_frames
         self.time_of_day[summary["time_of_day"]] += num_frames
 
-        for frame in summary["frames"]:
-            for key, value in summary["frames"][frame]["cav_speeds"].items():
-                self.scenarios[label]["cav_speed"].append(value)
-                if key == "ego":
-                    speed_bin = self.get_discretized_bin(value, "speed")
-                    self.ego_speed[speed_bin] += 1
-
-            num_annotations = summary["frames"][frame]["num_annotations"]
-            annotation_bin = self.get_discretized_bin(num_annotations, "annotations")
-            self.num_keyframes[annotation_bin] += 1
+        # speeds of all cavs, frame by frame
+        cav_speeds = summary["cav_speeds"]
+        self.scenarios[label]["cav_speed"].update(cav_speeds)
+        if "ego" in summary["cav_names"]:
+            ego_speeds = cav_speeds[:, summary["cav_names"].tolist().index("ego")]
+            np.add.at(self.ego_speed, self.get_discretized_bin(ego_speeds, "speed"), 1)
+
+        annotation_bins = self.get_discretized_bin(summary["num_annotations"], "annotations")
+        np.add.at(self.num_keyframes, annotation_bins, 1)
+
+        object_classes = summary["classes"][summary["object_class"]]
+        class_counts = np.bincount(summary["object_class"], minlength=len(summary["classes"]))
+        for obj_class, count in zip(summary["classes"].tolist(), class_counts.tolist()):
+            self.class_histogram[obj_class] += count
+
+        traffic_speeds = summary["object_speed"][object_classes != "walker"]
+        np.add.at(self.traffic_speed, self.get_discretized_bin(traffic_speeds, "speed"), 1)
+        self.scenarios[label]["traffic_speed"].update(traffic_speeds)
+
+        # objects detected by ego are the only ones with distance and angle to ego
+        detected_by_ego = ~np.isnan(summary["object_distance_to_ego"])
+        distances_to_ego = summary["object_distance_to_ego"][detected_by_ego]
+        np.add.at(self.density[summary["density"]], self.get_discretized_bin(distances_to_ego, "distance"), 1)
+
+        angles_to_ego = self.rad_angle(summary["object_angle_to_ego"][detected_by_ego])
+        self.polar_histogram += np.histogram2d(angles_to_ego, distances_to_ego, bins=self.polar_bins)[0]
+
+    def get_state(self):
+        """
+        Partial state of the statistics, holding everything read from summaries so far. States of different summaries
+        or runs can be saved, and later combined with merge()
+
+        :return: dict
+            JSON serializable state
+        """
+        return {
+            "version": STATS_STATE_VERSION,
+            "scenarios": {label: {key: running_stats.get_state() for key, running_stats in scenario.items()}
+                          for label, scenario in self.scenarios.items()},
+            "weather": dict(self.weather),
+            "time_of_day": dict(self.time_of_day),
+            "density": {density: histogram.tolist() for density, histogram in self.density.items()},
+            "class_histogram": dict(self.class_histogram),
+            "traffic_speed": self.traffic_speed.tolist(),
+            "ego_speed": self.ego_speed.tolist(),
+            "num_keyframes": self.num_keyframes.tolist(),
+            "polar_histogram": self.polar_histogram.tolist()
+        }
 
-            for obj_id, values in summary["frames"][frame].items():
-                if obj_id in ["cav_speeds", "num_annotations"]:
-                    continue
+    def merge(self, state):
+        """
+        Adds a partial state to the statistics, as if its summaries had been read by this object
 
-                self.class_histogram[values["class"]] += 1
-                if values["class"] != "walker":
-                    speed_bin = self.get_discretized_bin(values["speed"], "speed")
-                    self.traffic_speed[speed_bin] += 1
-                    self.scenarios[label]["traffic_speed"].append(values["speed"])
+        :param state: dict
+            State returned by get_state()
+        """
+        for label, scenario in state["scenarios"].items():
+            for key, running_state in scenario.items():
+                self.scenarios[label][key].merge(RunningStats.from_state(running_state))
 
-                if "distance_to_ego" in values:
-                    distance_bin = self.get_discretized_bin(values["distance_to_ego"], "distance")
-                    self.density[summary["density"]][distance_bin] += 1
+        for weather, num_frames in state["weather"].items():
+            self.weather[weather] += num_frames
+        for time_of_day, num_frames in state["time_of_day"].items():
+            self.time_of_day[time_of_day] += num_frames
+        for density, histogram in state["density"].items():
+            self.density[density] += histogram
+        for obj_class, count in state["class_histogram"].items():
+            self.class_histogram[obj_class] += count
 
-                    self.angles_to_ego.append(self.rad_angle(values["angle_to_ego"]))
-                    self.distances_to_ego.append(values["distance_to_ego"])
+        self.traffic_speed += state["traffic_speed"]
+        self.ego_speed += state["ego_speed"]
+        self.num_keyframes += state["num_keyframes"]
+        self.polar_histogram += state["polar_histogram"]
 
     def rad_angle(self, angle):
         """
@@ -217,143 +364,169 @@ class Stats:
         """
         Given a value and the key that describes it, returns the index of the bin this value belongs to
 
-        :param value: float
+        :param value: float or ndarray
         :param key: str
         :param angle: boolean
             If value is an angle or not
-        :return: int
-            Index of bin used to discretize values
+        :return: int or ndarray
+            Index of bin used to discretize values, for each value if an array is given
         """
         discretization_factor = self.discretization[key]["max"] / self.discretization[key]["bins"]
 
-        if angle and value > (360 - (discretization_factor / 2)):
-            return 0
-        else:
-            return round(value / discretization_factor)
+        # np.rint rounds halves to even, same as round()
+        bins = np.rint(np.asarray(value) / discretization_factor).astype(int)
+        if angle:
+            bins = np.where(np.asarray(value) > (360 - (discretization_factor / 2)), 0, bins)
 
-    def generate_charts(self):
+        return bins if bins.ndim else bins.item()
+
+    def generate_charts(self, charts=None, processes=None, force=False):
         """
-        Calls all methods that create the statistics charts
+        Creates the statistics charts in parallel. The hash of the data each chart is created from is saved to the
+        charts.json file, and charts whose data has not changed since they were last created are skipped
+
+        :param charts: list
+            Names of the charts to be created, from Stats.CHARTS. If None, all charts are created
+        :param processes: int
+            Number of processes. If None, the number of CPUs is used
+        :param force: boolean
+            Creates the charts even if their data has not changed
         """
-        self.scenario_stats_table()
-        self.weather_frames_pie_chart()
-        self.time_of_day_frames_pie_chart()
-        self.plot_class_histogram()
-        self.num_vehicles_per_speed()
-        self.density_by_range_to_ego()
-        self.num_frames_per_ego_speed()
-        self.num_keyframes_per_num_annotations()
-        self.polar_density_map()
+        state = self.get_state()
+        hashes_path = os.path.join(self.path, "charts.json")
+        if os.path.isfile(hashes_path):
+            with open(hashes_path, "r") as infile:
+                hashes = json.load(infile)
+        else:
+            hashes = {}
+
+        pending_charts = []
+        for chart in charts or self.CHARTS:
+            _, keys, file = self.CHARTS[chart]
+            chart_data = json.dumps([state["version"]] + [state[key] for key in keys], sort_keys=True)
+            chart_hash = hashlib.sha1(chart_data.encode()).hexdigest()
+            if not force and hashes.get(chart) == chart_hash and os.path.isfile(os.path.join(self.path, file)):
+                continue
+            pending_charts.append(chart)
+            hashes[chart] = chart_hash
+
+        skipped_charts = len(charts or self.CHARTS) - len(pending_charts)
+        if skipped_charts:
+            print(f"Skipping {skipped_charts} charts whose data has not changed")
+        if not pending_charts:
+            return
+
+        with Pool(min(processes or os.cpu_count(), len(pending_charts))) as pool:
+            pool.starmap(render_chart, [(self.path, state, chart) for chart in pending_charts])
+
+        with open(hashes_path, "w") as outfile:
+            json.dump(hashes, outfile)
 
     def avg(self, values, decimal_places=0):
         """
-        Helper function to calculate the average of a list of values
+        Helper function to calculate the average of a series of values
 
-        :param values: list
+        :param values: RunningStats
         :param decimal_places: int
             Decimal places to be used for rounding the average value
         :return: float
-            Average value of the list, rounded
+            Average value of the series, rounded
         """
-        if not values:
+        if values.count == 0:
             return 0
         elif decimal_places == 0:
-            return round(np.average(values))
+            return round(values.mean)
         else:
-            return round(np.average(values), decimal_places)
+            return round(values.mean, decimal_places)
 
     def stddev(self, values, decimal_places=0):
         """
-        Helper function to calculate the standard deviation of a list of values
+        Helper function to calculate the standard deviation of a series of values
 
-        :param values: list
+        :param values: RunningStats
         :param decimal_places: int
             Decimal places to be used for rounding the average value
         :return: float
-            Standard deviation of the list, rounded
+            Standard deviation of the series, rounded
         """
-        if not values:
+        if values.count == 0:
             return 0
         elif decimal_places == 0:
-            return round(np.std(values))
+            return round(values.std)
         else:
-            return round(np.std(values), decimal_places)
+            return round(values.std, decimal_places)
 
     def sum(self, values, decimal_places=0):
         """
-        Helper function to calculate the sum of a list of values
+        Helper function to calculate the sum of a series of values
 
-        :param values: list
+        :param values: RunningStats
         :param decimal_places: int
             Decimal places to be used for rounding the average value
         :return: float
-            Sum of the list, rounded
+            Sum of the series, rounded
         """
-        if not values:
+        if values.count == 0:
             return 0
         elif decimal_places == 0:
-            return round(np.sum(values))
+            return round(values.total)
         else:
-            return round(np.sum(values), decimal_places)
+            return round(values.total, decimal_places)
 
-    def save_to_csv(self, label, num_frames, num_vehicles, num_walkers, traffic_speed, cav_speed):
+    def get_csv_row(self, label, num_frames, num_vehicles, num_walkers, traffic_speed, cav_speed):
         """
-        Helper function to store data in CSV file, handling file creation if necessary
+        Helper function to create the row of a scenario in the CSV file
 
         :param label: str
-        :param num_frames: list
-        :param num_vehicles: list
-        :param num_walkers: list
-        :param traffic_speed: list
-        :param cav_speed: list
-        """
-        csv_file_path = os.path.join(self.path, "stats.csv")
-
-        df = pd.DataFrame({
-            "Scenario": [label],
-            "Length (avg)": [self.avg(num_frames)],
-            "Length (stddev)": [self.stddev(num_frames)],
-            "Length (sum)": [np.sum(num_frames)],
-            "Num vehicles (avg)": [self.avg(num_vehicles)],
-            "Num vehicles (stddev)": [self.stddev(num_vehicles)],
-            "Num vehicles (sum)": [np.sum(num_vehicles)],
-            "Num walkers (avg)": [self.avg(num_walkers)],
-            "Num walkers (stddev)": [self.stddev(num_walkers)],
-            "Num walkers (sum)": [np.sum(num_walkers)],
-            "Traffic speed (avg)": [self.avg(traffic_speed, decimal_places=3)],
-            "Traffic speed (stddev)": [self.stddev(traffic_speed, decimal_places=3)],
-            "CAV speed (avg)": [self.avg(cav_speed, decimal_places=3)],
-            "CAV speed (stddev)": [self.stddev(cav_speed, decimal_places=3)]
-        })
-
-        if not os.path.isfile(csv_file_path):
-            df.to_csv(csv_file_path, index=False)
-        else:
-            file_df = pd.read_csv(csv_file_path)
-            file_df = file_df.append(df)
-            file_df.to_csv(csv_file_path, index=False)
+        :param num_frames: RunningStats
+        :param num_vehicles: RunningStats
+        :param num_walkers: RunningStats
+        :param traffic_speed: RunningStats
+        :param cav_speed: RunningStats
+        :return: dict
+        """
+        return {
+            "Scenario": label,
+            "Length (avg)": self.avg(num_frames),
+            "Length (stddev)": self.stddev(num_frames),
+            "Length (sum)": num_frames.total,
+            "Num vehicles (avg)": self.avg(num_vehicles),
+            "Num vehicles (stddev)": self.stddev(num_vehicles),
+            "Num vehicles (sum)": num_vehicles.total,
+            "Num walkers (avg)": self.avg(num_walkers),
+            "Num walkers (stddev)": self.stddev(num_walkers),
+            "Num walkers (sum)": num_walkers.total,
+            "Traffic speed (avg)": self.avg(traffic_speed, decimal_places=3),
+            "Traffic speed (stddev)": self.stddev(traffic_speed, decimal_places=3),
+            "CAV speed (avg)": self.avg(cav_speed, decimal_places=3),
+            "CAV speed (stddev)": self.stddev(cav_speed, decimal_places=3)
+        }
 
     def scenario_stats_table(self):
         """
         Iterates through scenarios, saving their statistics to a CSV file
         """
-        num_frames = []
-        num_vehicles = []
-        num_walkers = []
-        traffic_speed = []
-        cav_speed = []
+        num_frames = RunningStats()
+        num_vehicles = RunningStats()
+        num_walkers = RunningStats()
+        traffic_speed = RunningStats()
+        cav_speed = RunningStats()
 
+        rows = []
         for label, scenario in self.scenarios.items():
-            self.save_to_csv(label, scenario["num_frames"], scenario["num_vehicles"], scenario["num_walkers"],
-                             scenario["traffic_speed"], scenario["cav_speed"])
+            rows.append(self.get_csv_row(label, scenario["num_frames"], scenario["num_vehicles"],
+                                         scenario["num_walkers"], scenario["traffic_speed"], scenario["cav_speed"]))
+
+            num_frames.merge(scenario["num_frames"])
+            num_vehicles.merge(scenario["num_vehicles"])
+            num_walkers.merge(scenario["num_walkers"])
+            traffic_speed.merge(scenario["traffic_speed"])
+            cav_speed.merge(scenario["cav_speed"])
 
-            num_frames.extend(scenario["num_frames"])
-            num_vehicles.extend(scenario["num_vehicles"])
-            num_walkers.extend(scenario["num_walkers"])
-            traffic_speed.extend(scenario["traffic_speed"])
-            cav_speed.extend(scenario["cav_speed"])
+        rows.append(self.get_csv_row("TOTAL", num_frames, num_vehicles, num_walkers, traffic_speed, cav_speed))
 
-        self.save_to_csv("TOTAL", num_frames, num_vehicles, num_walkers, traffic_speed, cav_speed)
+        # the table is built in memory and written at once, replacing the file of previous executions
+        pd.DataFrame(rows).to_csv(os.path.join(self.path, "stats.csv"), index=False)
 
     def weather_frames_pie_chart(self):
         """
@@ -537,11 +710,8 @@ class Stats:
         """
         Creates a polar density maps of objects in relation to the ego vehicle, in log scale
         """
-        rbins = np.linspace(0, 200, 17)
-        abins = np.linspace(0, 2 * np.pi, 37)
-        angles_array = np.array(self.angles_to_ego)
-        distances_array = np.array(self.distances_to_ego)
-        hist, _, _ = np.histogram2d(angles_array, distances_array, bins=(abins, rbins))
+        abins, rbins = self.polar_bins
+        hist = self.polar_histogram
         A, R = np.meshgrid(abins, rbins)
 
         with plt.rc_context({'font.size': 14}):
@@ -554,3 +724,63 @@ class Stats:
             fig.colorbar(pc, pad=0.12)
             fig.tight_layout()
             fig.savefig(self.path + "polar_density_map.pdf")
+
+
+def render_chart(path, state, chart):
+    """
+    Creates a chart from a statistics state. Used by Stats.generate_charts() to create charts in separate processes
+
+    :param path: os.path
+        Path used to save plots
+    :param state: dict
+        State returned by Stats.get_state()
+    :param chart: str
+        Name of the chart, from Stats.CHARTS
+    """
+    stats = Stats(path)
+    stats.merge(state)
+    getattr(stats, Stats.CHARTS[chart][0])()
+
+
+def load_summary(simulation_path):
+    """
+    Loads the summary of a scenario, preferring its columnar format
+
+    :param simulation_path: os.path
+        Path to the scenario folder
+    :return: dict
+    """
+    if os.path.isfile(os.path.join(simulation_path, "summary.npz")):
+        return load_columnar_summary(simulation_path)
+    # summaries generated before the columnar format was introduced. Run convert_summary.py to speed this up
+    return load_yaml(os.path.join(simulation_path, "summary.yaml"))
+
+
+def get_summary_state(simulation_path):
+    """
+    Returns the partial statistics state of a scenario. The state is cached to the stats_partial.json file of the
+    scenario, and only recalculated when the summary has changed since it was cached
+
+    :param simulation_path: os.path
+        Path to the scenario folder
+    :return: dict
+        State returned by Stats.get_state()
+    """
+    summary_file = "summary.npz" if os.path.isfile(os.path.join(simulation_path, "summary.npz")) else "summary.yaml"
+    summary_mtime = os.stat(os.path.join(simulation_path, summary_file)).st_mtime_ns
+    state_path = os.path.join(simulation_path, "stats_partial.json")
+
+    if os.path.isfile(state_path):
+        with open(state_path, "r") as infile:
+            cached = json.load(infile)
+        if cached["version"] == STATS_STATE_VERSION and cached["summary"] == [summary_file, summary_mtime]:
+            return cached["state"]
+
+    stats = Stats(simulation_path)
+    stats.read_summary_data(load_summary(simulation_path))
+    state = stats.get_state()
+
+    with open(state_path, "w") as outfile:
+        json.dump({"version": STATS_STATE_VERSION, "summary": [summary_file, summary_mtime], "state": state}, outfile)
+
+    return state
@@ -0,0 +1,465 @@
+import hashlib
+import json
+import os
+import numpy as np
+import yaml
+from Dataset.Scripts.utils.manifest import load_manifest
+
+# version of the columnar summary layout, increased whenever arrays are added, removed or change meaning
+SUMMARY_SCHEMA_VERSION = 1
+
+# scenario information saved as 0-d arrays in the columnar summary
+SCENARIO_FIELDS = ["simulation", "scenario", "weather", "time_of_day", "density", "num_frames", "num_vehicles",
+                   "num_walkers"]
+
+# libyaml's C loader is an order of magnitude faster than the pure Python one, but may not be available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+def load_yaml(path):
+    """
+    Loads a yaml file into plain dicts and lists
+
+    :param path: os.path
+    :return: dict
+    """
+    with open(path, "r") as infile:
+        return yaml.load(infile, Loader=SafeLoader)
+
+
+def split_weather_and_time_of_day(weather_config):
+    """
+    Splits the weather_config string into weather and time of day
+
+    :param weather_config: str
+    :return: str, str
+    """
+    time_of_day = weather_config.split("_")[-1]
+    weather = weather_config[:-(len(time_of_day) + 1)]
+    return weather, time_of_day
+
+
+def get_pov_ids(path):
+    """
+    Lists the POV folders of the scenario, which are named after the ids of the CAVs and RSUs
+
+    :param path: os.path
+        Path to the scenario folder
+    :return: list
+        Sorted folder names of all POVs
+    """
+    folders = [folder for folder in os.listdir(path) if os.path.isdir(os.path.join(path, folder))]
+    folders.sort()
+    return folders
+
+
+def get_cav_ids(pov_ids, data_protocol):
+    """
+    Finds the folders of the CAVs among the POVs. RSU folders are named after the ids in the rsu_list of the config,
+    while CAV folders are named after the carla ids of the vehicles
+
+    :param pov_ids: list
+        Folder names of the POVs
+    :param data_protocol: dict
+        Dictionary loaded from data_protocol.yaml
+    :return: list
+    """
+    rsu_ids = {str(rsu_config["id"]) for rsu_config in data_protocol["scenario"]["rsu_list"]}
+    return [pov_id for pov_id in pov_ids if pov_id not in rsu_ids]
+
+
+def get_ego_id(pov_ids, data_protocol):
+    """
+    Finds the folder of the ego among the POVs. Carla ids are assigned in spawn order, so the ego (first CAV of
+    single_cav_list) has the lowest id
+
+    :param pov_ids: list
+        Folder names of the POVs
+    :param data_protocol: dict
+        Dictionary loaded from data_protocol.yaml
+    :return: str
+    """
+    return min(get_cav_ids(pov_ids, data_protocol), key=int)
+
+
+def get_yaml_frames(path, pov_id):
+    """
+    Lists the ground truth yaml files of a POV, in frame order. They are read from the manifest of the POV if it has
+    one, which avoids listing its folder
+
+    :param path: os.path
+        Path to the scenario folder
+    :param pov_id: str
+    :return: list
+    """
+    manifest = load_manifest(os.path.join(path, pov_id))
+    if manifest is not None:
+        return [f"{frame}.yaml" for frame, files in manifest.items() if f"{frame}.yaml" in files]
+
+    yaml_frames = [file
+                   for file in os.listdir(os.path.join(path, pov_id))
+                   if (file.endswith("yaml") and ("_" not in file))]
+    yaml_frames.sort()
+    return yaml_frames
+
+
+def get_scenario_summary(path, data_protocol, num_frames):
+    """
+    Scenario information saved at the beginning of the summary file
+
+    :param path: os.path
+        Path to the scenario folder
+    :param data_protocol: dict
+        Dictionary loaded from data_protocol.yaml
+    :param num_frames: int
+    :return: dict
+    """
+    scenario_label = path.split("/")[-1]
+    weather, time_of_day = split_weather_and_time_of_day(data_protocol["dataset_config"]["weather"])
+    num_spawn_points = len(data_protocol["scenario"]["rsu_list"]) + 2 * len(
+        data_protocol["scenario"]["single_cav_list"])
+
+    summary = {
+        "simulation": scenario_label,
+        "scenario": data_protocol["dataset_config"]["scenario"],
+        "weather": weather,
+        "time_of_day": time_of_day,
+        "density": data_protocol["dataset_config"]["density"],
+        "num_frames": num_frames,
+        "num_vehicles": round(data_protocol["scenario"]["num_vehicles"] * num_spawn_points *
+                              data_protocol["density"]["vehicle_multiplier"]),
+        "num_walkers": round(data_protocol["scenario"]["num_walkers"] * data_protocol["density"]["walker_multiplier"])
+    }
+
+    return summary
+
+
+def summarize_frame(path, pov_ids, yaml_frame):
+    """
+    Reads the ground truth yamls of all POVs for a frame and creates its summary entry
+
+    :param path: os.path
+        Path to the scenario folder
+    :param pov_ids: list
+        Folder names of the POVs
+    :param yaml_frame: str
+        Name of the frame's yaml file. Eg: 000060.yaml
+    :return: int, dict
+        Frame number and its summary entry
+    """
+    frame_number = yaml_frame.split(".")[0]
+    pov_yamls = [load_yaml(os.path.join(path, pov_id, yaml_frame)) for pov_id in pov_ids]
+    return int(frame_number), summarize_povs(pov_ids, pov_yamls)
+
+
+def summarize_povs(pov_ids, pov_yamls):
+    """
+    Merges the ground truths of all POVs for a frame and creates its summary entry. Any number of CAVs and RSUs is
+    supported: CAVs are told apart from RSUs by the RSU flag of their ground truths, and the CAV with the lowest id is
+    the ego
+
+    :param pov_ids: list
+        Sorted folder names of the POVs
+    :param pov_yamls: list
+        Ground truth dictionaries of the frame, in the same order as pov_ids
+    :return: dict
+    """
+    # cavs in spawn order, the first one being the ego
+    cav_indices = sorted((i for i, pov_yaml in enumerate(pov_yamls) if not pov_yaml["RSU"]),
+                         key=lambda i: int(pov_ids[i]))
+    ego_yaml = pov_yamls[cav_indices[0]]
+
+    # Number of walkers might be 0, so key might not exist on dictionary
+    objs = ["vehicles", "walkers"] if "walkers" in ego_yaml else ["vehicles"]
+    ego_objs = set().union(*(ego_yaml[obj] for obj in objs))
+
+    # only the objects are merged, one update per POV. Ego goes last in merge order so that it can override values,
+    # while objects keep the position in which they first appear
+    merge_order = [pov_yaml for i, pov_yaml in enumerate(pov_yamls) if i != cav_indices[0]] + [ego_yaml]
+    merged_objs = {obj: {} for obj in objs}
+    for pov_yaml in merge_order:
+        for obj in objs:
+            merged_objs[obj].update(pov_yaml.get(obj, {}))
+
+    # information on the current frame to be save to the summary: speeds of cavs and total number of ground truths
+    cav_speeds = {"ego": ego_yaml["ego_speed"]}
+    cav_speeds.update({f"cav{i}": pov_yamls[cav_index]["ego_speed"] for i, cav_index in enumerate(cav_indices[1:], 1)})
+    frame_dict = {
+        "cav_speeds": cav_speeds,
+        "num_annotations": sum(len(merged_objs[obj]) for obj in objs)
+    }
+
+    ignored_ids = set(pov_ids)
+    for obj in objs:
+        # iterates through detected objects, saving their ground truths to the summary
+        for obj_id, values in merged_objs[obj].items():
+            if str(obj_id) in ignored_ids:
+                # ignore cavs
+                continue
+
+            classe = values["class"] if "class" in values else "walker"
+            if obj_id in ego_objs:
+                # Vehicle/walker detected by ego
+                frame_dict.update({obj_id: {
+                    "class": classe,
+                    "speed": values["speed"],
+                    "distance_to_ego": values["dist"],
+                    "angle_to_ego": values["relative_angle"]
+                }})
+            else:
+                # Vehicle/walker out of range from ego
+                frame_dict.update({obj_id: {
+                    "class": classe,
+                    "speed": values["speed"]
+                }})
+
+    return frame_dict
+
+
+def summary_to_columns(summary):
+    """
+    Converts a summary into its columnar format: scenario information, one table of frame-level fields and one table
+    of object-level rows, each column being an array. Objects not detected by ego have NaN distance and angle to ego
+
+    :param summary: dict
+        Summary as saved to summary.yaml
+    :return: dict
+        Scenario information and arrays of the columnar summary, keyed by column name
+    """
+    frame_numbers, cav_speeds, num_annotations = [], [], []
+    object_frames, object_ids, object_classes, object_speeds, distances_to_ego, angles_to_ego = [], [], [], [], [], []
+    cav_names = []
+    classes = {}
+
+    for frame, frame_dict in summary["frames"].items():
+        frame_numbers.append(frame)
+        cav_names = list(frame_dict["cav_speeds"].keys())
+        cav_speeds.append(list(frame_dict["cav_speeds"].values()))
+        num_annotations.append(frame_dict["num_annotations"])
+
+        for obj_id, values in frame_dict.items():
+            if obj_id in ["cav_speeds", "num_annotations"]:
+                continue
+
+            object_frames.append(frame)
+            object_ids.append(obj_id)
+            object_classes.append(classes.setdefault(values["class"], len(classes)))
+            object_speeds.append(values["speed"])
+            distances_to_ego.append(values.get("distance_to_ego", np.nan))
+            angles_to_ego.append(values.get("angle_to_ego", np.nan))
+
+    # scenario information is kept as Python scalars, which np.savez stores as 0-d arrays
+    columns = {field: summary[field] for field in SCENARIO_FIELDS}
+    columns.update({
+        "schema_version": SUMMARY_SCHEMA_VERSION,
+        # frame-level table
+        "frame": np.array(frame_numbers, dtype=np.int64),
+        "cav_names": np.array(cav_names, dtype=str),
+        "cav_speeds": np.array(cav_speeds, dtype=np.float64).reshape(len(frame_numbers), len(cav_names)),
+        "num_annotations": np.array(num_annotations, dtype=np.int64),
+        # object-level table, with classes stored as indices of the "classes" array
+        "classes": np.array(list(classes.keys()), dtype=str),
+        "object_frame": np.array(object_frames, dtype=np.int64),
+        "object_id": np.array(object_ids, dtype=np.int64),
+        "object_class": np.array(object_classes, dtype=np.int64),
+        "object_speed": np.array(object_speeds, dtype=np.float64),
+        "object_distance_to_ego": np.array(distances_to_ego, dtype=np.float64),
+        "object_angle_to_ego": np.array(angles_to_ego, dtype=np.float64)
+    })
+
+    return columns
+
+
+def save_columnar_summary(path, columns):
+    """
+    Saves the columnar summary to the summary.npz file of the scenario
+
+    :param path: os.path
+        Path to the scenario folder
+    :param columns: dict
+        Arrays returned by summary_to_columns()
+    """
+    with open(os.path.join(path, "summary.npz"), "wb") as outfile:
+        np.savez_compressed(outfile, **columns)
+
+
+def load_columnar_summary(path):
+    """
+    Loads the summary.npz file of a scenario. Scenario information is returned as Python scalars and tables as arrays
+
+    :param path: os.path
+        Path to the scenario folder
+    :return: dict
+    """
+    with np.load(os.path.join(path, "summary.npz"), allow_pickle=False) as data:
+        columns = {key: data[key] for key in data.files}
+
+    schema_version = columns["schema_version"].item()
+    if schema_version != SUMMARY_SCHEMA_VERSION:
+        raise ValueError(f"Summary of {path} has schema version {schema_version}, expected {SUMMARY_SCHEMA_VERSION}. "
+                         f"Run convert_summary.py to update it")
+
+    for field in SCENARIO_FIELDS + ["schema_version"]:
+        columns[field] = columns[field].item()
+
+    return columns
+
+
+def save_summary(path, summary, hashes=True):
+    """
+    Saves the summary to the summary.yaml file of the scenario, its columnar format to the summary.npz file and the
+    manifest of the files it was built from
+
+    :param path: os.path
+        Path to the scenario folder
+    :param summary: dict
+    :param hashes: boolean
+        Whether the hash of each input is saved to the manifest, see save_manifest()
+    """
+    summary_path = os.path.join(path, "summary.yaml")
+    with open(summary_path, "w") as outfile:
+        yaml.dump(summary, outfile, default_flow_style=False, sort_keys=False)
+
+    save_columnar_summary(path, summary_to_columns(summary))
+    save_manifest(path, hashes)
+
+
+def get_summary_inputs(path):
+    """
+    Lists the files a summary is built from: data_protocol.yaml and the ground truth yamls of all POV folders
+
+    :param path: os.path
+        Path to the scenario folder
+    :return: list
+        Paths relative to the scenario folder
+    """
+    inputs = ["data_protocol.yaml"]
+    for pov_id in get_pov_ids(path):
+        inputs.extend(os.path.join(pov_id, yaml_frame) for yaml_frame in get_yaml_frames(path, pov_id))
+    return inputs
+
+
+def get_file_hash(file_path):
+    """
+    :param file_path: os.path
+    :return: str
+        SHA-1 digest of the file contents
+    """
+    with open(file_path, "rb") as infile:
+        return hashlib.sha1(infile.read()).hexdigest()
+
+
+def save_manifest(path, hashes=True):
+    """
+    Saves the size, modification time and hash of every input of the summary to the summary_manifest.json file of the
+    scenario, so that later runs of generate_summary.py can tell whether the summary is up to date
+
+    :param path: os.path
+        Path to the scenario folder
+    :param hashes: boolean
+        If False, hashes are not calculated and saved as None, so that the inputs are not read again. Inputs whose
+        modification time changes are then considered modified
+    """
+    files = {}
+    for input_file in get_summary_inputs(path):
+        file_path = os.path.join(path, input_file)
+        stat = os.stat(file_path)
+        files[input_file] = [stat.st_size, stat.st_mtime_ns, get_file_hash(file_path) if hashes else None]
+
+    manifest_path = os.path.join(path, "summary_manifest.json")
+    with open(manifest_path + ".part", "w") as outfile:
+        json.dump({"schema_version": SUMMARY_SCHEMA_VERSION, "files": files}, outfile)
+    # written last and renamed into place, so a manifest only exists next to a complete summary
+    os.replace(manifest_path + ".part", manifest_path)
+
+
+def is_summary_up_to_date(path):
+    """
+    Compares the current inputs of the summary against its manifest. Files whose modification time changed are only
+    considered modified if their hash changed as well, or if the manifest has no hash for them, so copied or re-dumped
+    but identical frames do not trigger a rebuild
+
+    :param path: os.path
+        Path to the scenario folder
+    :return: boolean
+        True if the summary exists and was built from the current inputs
+    """
+    summary_files = ["summary.yaml", "summary.npz", "summary_manifest.json"]
+    if not all(os.path.isfile(os.path.join(path, summary_file)) for summary_file in summary_files):
+        return False
+
+    with open(os.path.join(path, "summary_manifest.json"), "r") as infile:
+        manifest = json.load(infile)
+
+    inputs = get_summary_inputs(path)
+    if manifest["schema_version"] != SUMMARY_SCHEMA_VERSION or set(inputs) != set(manifest["files"]):
+        return False
+
+    for input_file in inputs:
+        file_path = os.path.join(path, input_file)
+        size, mtime, file_hash = manifest["files"][input_file]
+        stat = os.stat(file_path)
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns != mtime and (file_hash is None or get_file_hash(file_path) != file_hash):
+            return False
+
+    return True
+
+
+class SummaryAggregator:
+    """
+    Builds the summary of a scenario while it is being simulated, from the ground truths dumped by each POV, so that
+    the frames do not have to be read again afterwards. Frames are summarized as soon as all POVs have dumped them
+    """
+    def __init__(self, path, data_protocol):
+        """
+        :param path: os.path
+            Path to the scenario folder
+        :param data_protocol: dict
+            Config of the scenario, as saved to data_protocol.yaml
+        """
+        self.path = path
+        self.data_protocol = data_protocol
+        self.pov_ids = []
+        self.pending_frames = {}
+        self.frames = {}
+
+    def add_dumper(self, data_dumper):
+        """
+        Hooks the aggregator into the data dumper of a POV
+
+        :param data_dumper: RevampedDataDumper
+        """
+        data_dumper.summary_aggregator = self
+        self.pov_ids.append(str(data_dumper.vehicle_id))
+        # same order as the POV folders listed by get_pov_ids()
+        self.pov_ids.sort()
+
+    def add(self, pov_id, frame, pov_yaml):
+        """
+        Adds the ground truths dumped by a POV for a frame
+
+        :param pov_id: int
+        :param frame: int
+        :param pov_yaml: dict
+            Ground truth dictionary saved to the frame's yaml file
+        """
+        pov_yamls = self.pending_frames.setdefault(frame, {})
+        pov_yamls[str(pov_id)] = pov_yaml
+
+        if len(pov_yamls) == len(self.pov_ids):
+            del self.pending_frames[frame]
+            self.frames[frame] = summarize_povs(self.pov_ids, [pov_yamls[pov_id] for pov_id in self.pov_ids])
+
+    def save(self):
+        """
+        Saves the summary of all frames dumped by every POV. Frames that were not dumped by all POVs are ignored
+        """
+        summary = get_scenario_summary(self.path, self.data_protocol, len(self.frames))
+        summary.update({"frames": dict(sorted(self.frames.items()))})
+        # the frames were summarized as they were dumped, so only their sizes and modification times are recorded
+        save_summary(self.path, summary, hashes=False)
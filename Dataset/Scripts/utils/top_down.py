@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+
+# BGR colors of the top-down view
+VEHICLE_COLOR = (255, 160, 60)
+CAV_COLOR = (60, 200, 60)
+WALKER_COLOR = (60, 60, 255)
+TRAJECTORY_COLOR = (0, 215, 255)
+RING_COLOR = (70, 70, 70)
+
+
+def get_box_corners(objects):
+    """
+    Calculates the corners of the bounding boxes of objects seen from above, for all objects at once
+
+    :param objects: dict
+        Vehicles or walkers of a ground truth yaml, keyed by their ids
+    :return: ndarray
+        World coordinates (x, y) of the corners of each box, with shape (number of objects, 4, 2)
+    """
+    if not objects:
+        return np.zeros((0, 4, 2))
+
+    values = list(objects.values())
+    locations = np.array([value["location"][:2] for value in values])
+    # walkers have no center, their bounding boxes are centered on their location
+    centers = np.array([value.get("center", [0, 0, 0])[:2] for value in values])
+    extents = np.array([value["extent"][:2] for value in values])
+    yaws = np.radians([value["angle"][1] for value in values])
+
+    # corners in the object's frame, then rotated by its yaw and moved to its location
+    signs = np.array([[1, 1], [1, -1], [-1, -1], [-1, 1]])
+    corners = centers[:, None, :] + signs[None, :, :] * extents[:, None, :]
+    cos, sin = np.cos(yaws)[:, None], np.sin(yaws)[:, None]
+    x = locations[:, 0, None] + corners[..., 0] * cos - corners[..., 1] * sin
+    y = locations[:, 1, None] + corners[..., 0] * sin + corners[..., 1] * cos
+    return np.stack([x, y], axis=-1)
+
+
+def world_to_pixels(points, pov_pose, size, view_range):
+    """
+    Converts world coordinates to pixels of the top-down view, which is centered on the POV and has its heading pointing
+    up
+
+    :param points: ndarray
+        World coordinates (x, y) in the last dimension
+    :param pov_pose: list
+        [x, y, z, roll, yaw, pitch] of the POV
+    :param size: int
+        Side of the top-down view in pixels
+    :param view_range: float
+        Distance from the POV to the borders of the view in meters
+    :return: ndarray
+        Pixel coordinates (u, v) in the last dimension
+    """
+    pixels_per_meter = size / (2 * view_range)
+    yaw = np.radians(pov_pose[4])
+    relative = np.asarray(points, dtype=np.float64)[..., :2] - np.array(pov_pose[:2])
+
+    forward = relative[..., 0] * np.cos(yaw) + relative[..., 1] * np.sin(yaw)
+    right = -relative[..., 0] * np.sin(yaw) + relative[..., 1] * np.cos(yaw)
+    pixels = np.stack([size / 2 + right * pixels_per_meter, size / 2 - forward * pixels_per_meter], axis=-1)
+    return np.round(pixels).astype(np.int32)
+
+
+def draw_top_down(pov_yaml, size, view_range=50, cav_ids=()):
+    """
+    Draws the annotations of a frame seen from above: bounding boxes of vehicles and walkers, the planned trajectory of
+    the POV and range rings every 10 meters
+
+    :param pov_yaml: dict
+        Ground truth dictionary of the frame
+    :param size: int
+        Side of the top-down view in pixels
+    :param view_range: float
+        Distance from the POV to the borders of the view in meters
+    :param cav_ids: list
+        Ids of the CAVs, which are drawn in a different color
+    :return: ndarray
+        BGR image of shape (size, size, 3)
+    """
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    pov_pose = pov_yaml["true_ego_pos"]
+    pixels_per_meter = size / (2 * view_range)
+
+    for ring in range(10, view_range + 1, 10):
+        cv2.circle(image, (size // 2, size // 2), round(ring * pixels_per_meter), RING_COLOR, 1)
+
+    if pov_yaml.get("plan_trajectory"):
+        trajectory = world_to_pixels(np.array(pov_yaml["plan_trajectory"])[:, :2], pov_pose, size, view_range)
+        cv2.polylines(image, [trajectory], False, TRAJECTORY_COLOR, 2)
+
+    vehicles = pov_yaml.get("vehicles", {})
+    cav_ids = {str(cav_id) for cav_id in cav_ids}
+    is_cav = np.array([str(vehicle_id) in cav_ids for vehicle_id in vehicles], dtype=bool)
+    vehicle_boxes = world_to_pixels(get_box_corners(vehicles), pov_pose, size, view_range)
+    walker_boxes = world_to_pixels(get_box_corners(pov_yaml.get("walkers", {})), pov_pose, size, view_range)
+
+    cv2.fillPoly(image, list(vehicle_boxes[~is_cav]), VEHICLE_COLOR)
+    cv2.fillPoly(image, list(vehicle_boxes[is_cav]), CAV_COLOR)
+    cv2.fillPoly(image, list(walker_boxes), WALKER_COLOR)
+
+    # POV marker, pointing to its heading
+    center = size // 2
+    marker_size = max(3, round(2 * pixels_per_meter))
+    marker = np.array([[center, center - 2 * marker_size],
+                       [center - marker_size, center + marker_size],
+                       [center + marker_size, center + marker_size]], dtype=np.int32)
+    cv2.fillPoly(image, [marker], CAV_COLOR)
+
+    return image
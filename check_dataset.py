@@ -0,0 +1,112 @@
+import argparse
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool
+from tqdm import tqdm
+from Dataset.Scripts.utils.dataset import get_scenario_paths
+from Dataset.Scripts.utils.manifest import MANIFEST_FILE, get_file_checksum, load_manifest
+from Dataset.Scripts.utils.point_cloud import BIN_SUFFIX, PLY_SUFFIX, get_bin_path
+from Dataset.Scripts.utils.summary import get_pov_ids
+
+# kinds of issues found by the checker
+ISSUES = ["missing", "truncated", "corrupted", "incomplete", "orphaned"]
+
+
+def check_pov(pov_path, checksums=False):
+    """
+    Validates the files of a POV against its manifest
+
+    :param pov_path: os.path
+        Path to the pov folder
+    :param checksums: boolean
+        Also compares the checksum of each file, which requires reading all of them
+    :return: os.path, int, dict
+        Path to the pov folder, number of files checked (None if the POV has no manifest) and the files with each
+        kind of issue: missing (recorded but not found), truncated (size differs from the recorded one), corrupted
+        (checksum differs from the recorded one), incomplete (frames missing files that most frames have) and orphaned
+        (found but not recorded)
+    """
+    manifest = load_manifest(pov_path)
+    if manifest is None:
+        return pov_path, None, {}
+
+    issues = {issue: [] for issue in ISSUES}
+    recorded = set()
+    for frame, files in manifest.items():
+        for file_name, (size, checksum) in files.items():
+            recorded.add(file_name)
+            file_path = os.path.join(pov_path, file_name)
+            if not os.path.exists(file_path):
+                # point clouds converted by convert_point_clouds.py with -d only have their binary version
+                if not (file_name.endswith(PLY_SUFFIX) and os.path.exists(get_bin_path(file_path))):
+                    issues["missing"].append(file_name)
+            elif os.path.getsize(file_path) != size:
+                issues["truncated"].append(file_name)
+            elif checksums and get_file_checksum(file_path) != checksum:
+                issues["corrupted"].append(file_name)
+
+    # files expected in every frame are those that most frames have. Eg: _camera0.png, _lidar.ply
+    frame_suffixes = {frame: {file_name[len(frame):] for file_name in files} for frame, files in manifest.items()}
+    suffix_counts = Counter(suffix for suffixes in frame_suffixes.values() for suffix in suffixes)
+    expected_suffixes = {suffix for suffix, count in suffix_counts.items() if count > len(manifest) / 2}
+    for frame, suffixes in frame_suffixes.items():
+        issues["incomplete"] += [frame + suffix for suffix in sorted(expected_suffixes - suffixes)]
+
+    for file_name in sorted(os.listdir(pov_path)):
+        if file_name == MANIFEST_FILE or file_name.endswith(BIN_SUFFIX):
+            continue
+        if file_name not in recorded:
+            issues["orphaned"].append(file_name)
+
+    return pov_path, len(recorded), issues
+
+
+def check_job(job):
+    return check_pov(*job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dataset integrity checker. Validates the files of each POV against "
+                                                 "the manifest saved by the data dumper.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run or scenario folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-c', "--checksums", type=bool,
+                        help='Boolean to also compare the checksum of each file. Slower, as all files are read.')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of POVs checked in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-v', "--verbose", type=bool,
+                        help='Boolean to list every file with issues, instead of the first 5 of each kind per POV.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+
+    t0 = time.time()
+    check_jobs = [(os.path.join(scenario_path, pov_id), bool(opt.checksums))
+                  for scenario_path in get_scenario_paths(opt.path)
+                  for pov_id in get_pov_ids(scenario_path)]
+
+    print(f"Checking {len(check_jobs)} POVs...")
+    totals = Counter()
+    num_files, without_manifest = 0, []
+    with Pool(opt.jobs) as pool:
+        for pov_path, pov_files, pov_issues in tqdm(pool.imap(check_job, check_jobs), total=len(check_jobs)):
+            if pov_files is None:
+                without_manifest.append(pov_path)
+                continue
+            num_files += pov_files
+            for issue in ISSUES:
+                if not pov_issues[issue]:
+                    continue
+                totals[issue] += len(pov_issues[issue])
+                shown = pov_issues[issue] if opt.verbose else pov_issues[issue][:5]
+                more = "" if len(shown) == len(pov_issues[issue]) else f" and {len(pov_issues[issue]) - len(shown)} more"
+                print(f"### {pov_path}: {len(pov_issues[issue])} {issue} files: {', '.join(shown)}{more} ###")
+
+    if without_manifest:
+        print(f"{len(without_manifest)} POVs have no manifest and were not checked: {', '.join(without_manifest)}")
+    print(f"{num_files} files checked in {time.time() - t0:.2f}s: " +
+          ", ".join(f"{totals[issue]} {issue}" for issue in ISSUES) + ".")
+    exit(1 if sum(totals.values()) else 0)
@@ -0,0 +1,116 @@
+import argparse
+import os
+import time
+from functools import partial
+from multiprocessing import Pool
+from tqdm import tqdm
+from Dataset.Scripts.utils.point_cloud import PLY_SUFFIX, POINT_FIELDS, get_bin_path, read_ply, read_ply_header
+
+
+def get_ply_paths(path):
+    """
+    Lists all point clouds within a folder and its subfolders
+
+    :param path: os.path
+        Eg: data_dumping/2024_06_14_12_47_41
+    :return: list
+    """
+    return sorted(os.path.join(folder, file)
+                  for folder, _, files in os.walk(path)
+                  for file in files
+                  if file.endswith(PLY_SUFFIX))
+
+
+def convert_point_cloud(ply_path, delete=False):
+    """
+    Converts an ASCII point cloud to a float32 x, y, z, intensity binary file next to it. Point clouds whose binary file
+    already has the number of points declared in the PLY header are skipped, so that interrupted conversions can be
+    resumed. Binary files are written to a temporary file first, so that a partial file is never mistaken for a
+    converted one
+
+    :param ply_path: os.path
+    :param delete: boolean
+        Deletes the PLY file once its binary file has been written and verified
+    :return: str, int, int, int
+        Status (converted, skipped or failed: <reason>), number of points, and sizes in bytes of the PLY and binary files
+    """
+    bin_path = get_bin_path(ply_path)
+    ply_size = os.path.getsize(ply_path)
+    with open(ply_path, "rb") as infile:
+        num_points = read_ply_header(infile)[0]
+    expected_size = num_points * POINT_FIELDS * 4
+
+    if os.path.exists(bin_path) and os.path.getsize(bin_path) == expected_size:
+        status = "skipped"
+    else:
+        try:
+            points = read_ply(ply_path)
+        except ValueError as error:
+            return f"failed: {error}", 0, ply_size, 0
+
+        points.tofile(bin_path + ".part")
+        os.replace(bin_path + ".part", bin_path)
+        status = "converted"
+
+    bin_size = os.path.getsize(bin_path)
+    if bin_size != expected_size:
+        return f"failed: {bin_path} has {bin_size} bytes, expected {expected_size}", 0, ply_size, bin_size
+
+    if delete:
+        os.remove(ply_path)
+    return status, num_points, ply_size, bin_size
+
+
+def convert_point_clouds(ply_paths, processes=None, delete=False):
+    """
+    Converts point clouds in parallel, reporting throughput and space saved
+
+    :param ply_paths: list
+    :param processes: int
+        Number of processes, defaults to the number of CPUs
+    :param delete: boolean
+        Deletes the PLY files once converted
+    """
+    t0 = time.time()
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    num_points, ply_bytes, bin_bytes = 0, 0, 0
+    with Pool(processes) as pool:
+        results = pool.imap(partial(convert_point_cloud, delete=delete), ply_paths, chunksize=16)
+        for status, points, ply_size, bin_size in tqdm(results, total=len(ply_paths)):
+            if status.startswith("failed"):
+                counts["failed"] += 1
+                print(f"### ERROR: {status[len('failed: '):]} ###")
+                continue
+            counts[status] += 1
+            num_points += points
+            ply_bytes += ply_size
+            bin_bytes += bin_size
+
+    total_time = time.time() - t0
+    print(f"{counts['converted']} point clouds converted, {counts['skipped']} already converted and "
+          f"{counts['failed']} failed in {total_time:.2f}s.")
+    print(f"{num_points / max(total_time, 1e-9) / 1e6:.2f}M points/s, "
+          f"{ply_bytes / max(total_time, 1e-9) / 2 ** 20:.1f} MB/s of PLY files.")
+    print(f"PLY files: {ply_bytes / 2 ** 20:.1f} MB, binary files: {bin_bytes / 2 ** 20:.1f} MB "
+          f"({(ply_bytes - bin_bytes) / 2 ** 20:.1f} MB saved{'' if delete else ' by deleting the PLY files'}).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Point cloud converter. Converts the ASCII PLY point clouds of a run "
+                                                 "or scenario to float32 x, y, z, intensity binary files, which are "
+                                                 "memory mapped by AdverCityDataset.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run, scenario or pov folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of point clouds converted in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-d', "--delete", type=bool,
+                        help='Boolean to delete each PLY file once its binary file has been written and verified.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+
+    ply_paths = get_ply_paths(opt.path)
+    print(f"Converting {len(ply_paths)} point clouds...")
+    convert_point_clouds(ply_paths, opt.jobs, bool(opt.delete))
@@ -0,0 +1,34 @@
+import argparse
+import os
+from tqdm import tqdm
+from Dataset.Scripts.utils.summary import load_yaml, save_columnar_summary, summary_to_columns
+
+# create an argument parser
+parser = argparse.ArgumentParser(description="Adver-City summary converter. Converts summary.yaml files to the "
+                                             "columnar summary.npz format read by generate_statistics.py")
+
+# add arguments to the parser
+parser.add_argument('-p', "--path", type=str,
+                    help='Path of scenario. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s')
+parser.add_argument("-a", "--all", type=bool,
+                    help="Boolean to convert the summaries of all simulations in a folder.")
+
+# parse the arguments and return the result
+opt = parser.parse_args()
+
+arg_path = opt.path
+if opt.all:
+    # if "all" flag is active, lists scenario folders within path and converts all of their summaries
+    simulation_paths = [os.path.join(arg_path, simulation_path)
+                        for simulation_path in sorted(os.listdir(arg_path))
+                        if simulation_path != "stats"]
+else:
+    simulation_paths = [arg_path]
+
+print(f"Converting {len(simulation_paths)} summaries...")
+for simulation_path in tqdm(simulation_paths):
+    summary_path = os.path.join(simulation_path, "summary.yaml")
+    if not os.path.isfile(summary_path):
+        print(f"### ERROR: {summary_path} not found. Run generate_summary.py first ###")
+        continue
+    save_columnar_summary(simulation_path, summary_to_columns(load_yaml(summary_path)))
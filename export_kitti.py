@@ -0,0 +1,242 @@
+import argparse
+import os
+import shutil
+import time
+from multiprocessing import Pool
+import numpy as np
+from tqdm import tqdm
+from Dataset.Scripts.utils.dataset import get_scenario_paths
+from Dataset.Scripts.utils.point_cloud import PLY_SUFFIX, get_bin_path, load_point_cloud
+from Dataset.Scripts.utils.projection import UE4_TO_CAMERA, get_2d_boxes, get_box_corners_3d, project_to_cameras, \
+    x_to_world_matrices
+from Dataset.Scripts.utils.summary import get_pov_ids, get_yaml_frames, load_yaml
+from export_subset import get_output_error, link_or_copy
+
+# KITTI object types of Adver-City's classes, KITTI has no motorcycles, so their riders are labelled as cyclists
+KITTI_CLASSES = {
+    "car": "Car",
+    "van": "Van",
+    "truck": "Truck",
+    "bicycle": "Cyclist",
+    "motorcycle": "Cyclist",
+    "walker": "Pedestrian"
+}
+
+# folders of a KITTI split and the extension of their files
+KITTI_FOLDERS = {"calib": ".txt", "image_2": ".png", "label_2": ".txt", "velodyne": ".bin"}
+
+# from KITTI's velodyne axes (x forward, y left, z up) to UE4 axes (x forward, y right, z up)
+VELODYNE_TO_UE4 = np.diag([1.0, -1.0, 1.0, 1.0])
+
+
+def get_lidar_transforms(pov_yaml, camera):
+    """
+    :param pov_yaml: dict
+        Ground truth dictionary of the frame
+    :param camera: int
+    :return: ndarray, ndarray
+        Transformation matrices with shape (4, 4) from world to LiDAR coordinates and from LiDAR to camera coordinates,
+        both under UE4 axes
+    """
+    world_to_lidar = np.linalg.inv(x_to_world_matrices(pov_yaml["lidar_pose"])[0])
+    lidar_to_camera = np.array(pov_yaml[f"camera{camera}"]["extrinsic"])
+    return world_to_lidar, lidar_to_camera
+
+
+def get_kitti_calib(pov_yaml, camera):
+    """
+    :param pov_yaml: dict
+    :param camera: int
+        Camera exported as image_2
+    :return: str
+        Contents of the calib file of a sample. All projection matrices are those of the exported camera
+    """
+    intrinsic = np.array(pov_yaml[f"camera{camera}"]["intrinsic"])
+    _, lidar_to_camera = get_lidar_transforms(pov_yaml, camera)
+    matrices = {
+        **{f"P{i}": np.concatenate([intrinsic, np.zeros((3, 1))], axis=1) for i in range(4)},
+        "R0_rect": np.eye(3),
+        "Tr_velo_to_cam": (UE4_TO_CAMERA @ lidar_to_camera @ VELODYNE_TO_UE4)[:3],
+        "Tr_imu_to_velo": np.eye(4)[:3]
+    }
+    return "".join(f"{name}: {' '.join(f'{value:.12e}' for value in matrix.flatten())}\n"
+                   for name, matrix in matrices.items())
+
+
+def get_kitti_labels(pov_yaml, camera):
+    """
+    Converts the objects of a frame to KITTI labels of a camera, for all objects at once. Objects are moved from world
+    to LiDAR coordinates with the LiDAR pose, and then to camera coordinates with the extrinsic matrix, as the point
+    clouds are. Only objects within the camera frustum are labelled. Occlusion is not simulated, so all objects are
+    labelled as fully visible
+
+    :param pov_yaml: dict
+    :param camera: int
+    :return: str
+        Contents of the label file of a sample
+    """
+    vehicles = pov_yaml.get("vehicles") or {}
+    walkers = pov_yaml.get("walkers") or {}
+    if not vehicles and not walkers:
+        return ""
+    # CARLA ids are unique across vehicles and walkers
+    objects = {**vehicles, **walkers}
+    types = [KITTI_CLASSES.get(obj.get("class"), "Car") for obj in vehicles.values()] + ["Pedestrian"] * len(walkers)
+
+    world_to_lidar, lidar_to_camera = get_lidar_transforms(pov_yaml, camera)
+    world_to_camera = lidar_to_camera @ world_to_lidar
+    intrinsic = np.array(pov_yaml[f"camera{camera}"]["intrinsic"])
+    corners = get_box_corners_3d(objects)
+
+    pixels, depth = project_to_cameras(corners, world_to_camera[None], intrinsic[None])
+    # CARLA's principal point is the center of the image
+    width, height = 2 * intrinsic[0, 2], 2 * intrinsic[1, 2]
+    boxes, in_frustum, truncation = get_2d_boxes(pixels.reshape(1, -1, 8, 2), depth.reshape(1, -1, 8), width, height)
+    boxes, in_frustum, truncation = boxes[0], in_frustum[0], truncation[0]
+
+    # KITTI locations are the bottom centers of the boxes, under camera axes (x right, y down, z forward)
+    to_camera = UE4_TO_CAMERA @ world_to_camera
+    bottom_centers = corners[:, :4].mean(axis=1)
+    locations = bottom_centers @ to_camera[:3, :3].T + to_camera[:3, 3]
+    # rotation_y is 0 for objects heading to the camera's x axis, and their heading is (cos, 0, -sin) under camera axes
+    poses = [list(obj["location"]) + list(obj["angle"]) for obj in objects.values()]
+    headings = x_to_world_matrices(poses)[:, :3, 0] @ to_camera[:3, :3].T
+    rotation_y = np.arctan2(-headings[:, 2], headings[:, 0])
+    alpha = rotation_y - np.arctan2(locations[:, 0], locations[:, 2])
+    alpha = (alpha + np.pi) % (2 * np.pi) - np.pi
+    extents = np.array([obj["extent"] for obj in objects.values()])
+    dimensions = 2 * extents[:, [2, 1, 0]]
+
+    labels = np.concatenate([truncation[:, None], np.zeros((len(objects), 1)), alpha[:, None], boxes, dimensions,
+                             locations, rotation_y[:, None]], axis=1)
+    return "".join(f"{types[i]} {labels[i, 0]:.2f} 0 " + " ".join(f"{value:.2f}" for value in labels[i, 2:]) + "\n"
+                   for i in np.flatnonzero(in_frustum))
+
+
+def export_scenario(scenario_path, split_path, samples):
+    """
+    Exports samples of a scenario to a KITTI split. Point clouds are written once per frame and linked to the samples
+    of the remaining cameras
+
+    :param scenario_path: os.path
+    :param split_path: os.path
+        Split folder, with the folders of KITTI_FOLDERS
+    :param samples: list
+        Index, POV id, frame and camera of each sample
+    :return: os.path, int
+        Scenario folder and number of samples exported
+    """
+    loaded_frame, pov_yaml, velodyne_path = None, None, None
+    for index, pov_id, frame, camera in samples:
+        pov_path = os.path.join(scenario_path, pov_id)
+        sample = f"{index:06d}"
+        sample_velodyne_path = os.path.join(split_path, "velodyne", sample + KITTI_FOLDERS["velodyne"])
+
+        if (pov_id, frame) != loaded_frame:
+            loaded_frame = pov_id, frame
+            pov_yaml = load_yaml(os.path.join(pov_path, f"{frame}.yaml"))
+            points = np.array(load_point_cloud(os.path.join(pov_path, frame + PLY_SUFFIX)), dtype=np.float32)
+            points[:, 1] *= -1
+            points.tofile(sample_velodyne_path)
+            velodyne_path = sample_velodyne_path
+        else:
+            link_or_copy(velodyne_path, sample_velodyne_path)
+
+        link_or_copy(os.path.join(pov_path, f"{frame}_camera{camera}.png"),
+                     os.path.join(split_path, "image_2", sample + KITTI_FOLDERS["image_2"]))
+        with open(os.path.join(split_path, "calib", sample + KITTI_FOLDERS["calib"]), "w") as outfile:
+            outfile.write(get_kitti_calib(pov_yaml, camera))
+        with open(os.path.join(split_path, "label_2", sample + KITTI_FOLDERS["label_2"]), "w") as outfile:
+            outfile.write(get_kitti_labels(pov_yaml, camera))
+
+    return scenario_path, len(samples)
+
+
+def export_job(job):
+    return export_scenario(*job)
+
+
+def get_scenario_samples(scenario_path, cameras):
+    """
+    :param scenario_path: os.path
+    :param cameras: list
+    :return: list
+        POV id, frame and camera of each sample of the scenario, one per frame and camera with a ground truth file,
+        a camera image and a point cloud
+    """
+    samples = []
+    for pov_id in get_pov_ids(scenario_path):
+        pov_path = os.path.join(scenario_path, pov_id)
+        for yaml_frame in get_yaml_frames(scenario_path, pov_id):
+            frame = yaml_frame.split(".")[0]
+            ply_path = os.path.join(pov_path, frame + PLY_SUFFIX)
+            if not (os.path.exists(ply_path) or os.path.exists(get_bin_path(ply_path))):
+                continue
+            samples += [(pov_id, frame, camera) for camera in cameras
+                        if os.path.exists(os.path.join(pov_path, f"{frame}_camera{camera}.png"))]
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KITTI exporter. Converts the scenarios of a run to KITTI's object "
+                                                 "detection layout, with a sample per frame and camera of each POV.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run or scenario folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-o', "--output", required=True, type=str,
+                        help='Folder where the dataset is exported. Eg: kitti')
+    parser.add_argument('-s', "--split", type=str, default="training",
+                        help='Split folder where the samples are exported. Eg: testing')
+    parser.add_argument('-c', "--cameras", type=int, nargs="+", default=[0],
+                        help='Cameras exported as image_2, each in its own samples. Eg: 0 1 2 3')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of scenarios exported in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-f', "--force", type=bool,
+                        help='Boolean to replace the split folder if it is not empty.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+    split_path = os.path.join(opt.output, opt.split)
+    output_error = get_output_error(opt.path, opt.output, [split_path], opt.force)
+    if output_error:
+        print(output_error)
+        exit(1)
+
+    t0 = time.time()
+    if os.path.exists(split_path):
+        shutil.rmtree(split_path)
+    for folder in KITTI_FOLDERS:
+        os.makedirs(os.path.join(split_path, folder))
+    os.makedirs(os.path.join(opt.output, "ImageSets"), exist_ok=True)
+
+    # samples are numbered across all scenarios, and the source of each one is saved in mapping.txt
+    export_jobs, num_samples = [], 0
+    with open(os.path.join(split_path, "mapping.txt"), "w") as mapping_file, \
+            open(os.path.join(opt.output, "ImageSets", f"{opt.split}.txt"), "w") as image_set_file:
+        for scenario_path in get_scenario_paths(opt.path):
+            scenario_samples = [(num_samples + i, *sample)
+                                for i, sample in enumerate(get_scenario_samples(scenario_path, opt.cameras))]
+            for index, pov_id, frame, camera in scenario_samples:
+                mapping_file.write(f"{index:06d} {os.path.abspath(scenario_path)} {pov_id} {frame} {camera}\n")
+                image_set_file.write(f"{index:06d}\n")
+            export_jobs.append((scenario_path, split_path, scenario_samples))
+            num_samples += len(scenario_samples)
+
+    print(f"Exporting {num_samples} samples of {len(export_jobs)} scenarios to {split_path}...")
+    num_exported = 0
+    with Pool(opt.jobs) as pool:
+        for scenario_path, scenario_samples in tqdm(pool.imap_unordered(export_job, export_jobs),
+                                                    total=len(export_jobs)):
+            num_exported += scenario_samples
+
+    # every sample has a file in each folder
+    num_mismatches = 0
+    for folder, extension in KITTI_FOLDERS.items():
+        num_files = sum(file_name.endswith(extension) for file_name in os.listdir(os.path.join(split_path, folder)))
+        if num_files != num_samples:
+            num_mismatches += 1
+            print(f"### ERROR: {folder} has {num_files} files, {num_samples} samples were exported ###")
+
+    print(f"{num_exported} samples exported in {time.time() - t0:.2f}s.")
+    exit(1 if num_mismatches else 0)
@@ -0,0 +1,165 @@
+import argparse
+import os
+import shutil
+import time
+from collections import Counter
+from multiprocessing import Pool
+import yaml
+from tqdm import tqdm
+from Dataset.Scripts.utils.dataset import FIELD_SUFFIXES, get_scenario_paths
+from Dataset.Scripts.utils.point_cloud import BIN_SUFFIX, PLY_SUFFIX, get_bin_path, load_point_cloud, write_pcd
+from Dataset.Scripts.utils.summary import get_pov_ids, get_yaml_frames, load_yaml
+from export_subset import get_output_error, link_or_copy
+
+# fields of OPV2V's ground truth files, the remaining ones are Adver-City's additions
+OPV2V_KEYS = ["ego_speed", "lidar_pose", "plan_trajectory", "predicted_ego_pos", "true_ego_pos", "vehicles"]
+OPV2V_CAMERA_KEYS = ["cords", "extrinsic", "intrinsic"]
+OPV2V_VEHICLE_KEYS = ["angle", "center", "extent", "location", "speed"]
+CAMERA_SUFFIXES = [FIELD_SUFFIXES[f"camera{i}"] for i in range(4)]
+
+
+def to_opv2v_annotations(pov_yaml):
+    """
+    Strips a ground truth dictionary down to OPV2V's fields. Walkers are dropped, as OPV2V only annotates vehicles
+
+    :param pov_yaml: dict
+    :return: dict
+    """
+    opv2v_yaml = {key: pov_yaml[key] for key in OPV2V_KEYS if key in pov_yaml}
+    opv2v_yaml["vehicles"] = {vehicle_id: {key: vehicle[key] for key in OPV2V_VEHICLE_KEYS}
+                              for vehicle_id, vehicle in (pov_yaml.get("vehicles") or {}).items()}
+    for key in pov_yaml:
+        if key.startswith("camera"):
+            opv2v_yaml[key] = {camera_key: pov_yaml[key][camera_key] for camera_key in OPV2V_CAMERA_KEYS}
+    return opv2v_yaml
+
+
+def count_files(path, suffixes):
+    """
+    :param path: os.path
+    :param suffixes: list
+    :return: Counter
+        Number of files in the folder ending with each suffix
+    """
+    counts = Counter()
+    for file_name in os.listdir(path):
+        for suffix in suffixes:
+            if file_name.endswith(suffix):
+                counts[suffix] += 1
+    return counts
+
+
+def get_source_counts(pov_path, yaml_frames):
+    """
+    :param pov_path: os.path
+    :param yaml_frames: list
+        Ground truth files of the POV
+    :return: Counter
+        Number of files the export of the POV should have with each suffix of OPV2V
+    """
+    counts = count_files(pov_path, CAMERA_SUFFIXES)
+    counts[".yaml"] = len(yaml_frames)
+    # point clouds converted by convert_point_clouds.py may have a binary version, or only the binary one
+    counts[".pcd"] = len({file_name.split("_")[0] for file_name in os.listdir(pov_path)
+                          if file_name.endswith((PLY_SUFFIX, BIN_SUFFIX))})
+    return +counts
+
+
+def export_scenario(scenario_path, output_path, rsus=False):
+    """
+    Exports a scenario to OPV2V's layout: <output_path>/<cav_id>/<frame>.yaml, <frame>.pcd and <frame>_camera{i}.png
+
+    :param scenario_path: os.path
+    :param output_path: os.path
+        Output scenario folder, replaced if it exists, which is only allowed by get_output_error() if forced
+    :param rsus: boolean
+        Also exports the RSUs, as in V2XSet, where their negative ids keep them from being picked as ego
+    :return: os.path, int, list
+        Output scenario folder, number of frames exported and the POVs whose file counts differ from the source
+    """
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    os.makedirs(output_path)
+    link_or_copy(os.path.join(scenario_path, "data_protocol.yaml"), os.path.join(output_path, "data_protocol.yaml"))
+
+    num_frames, mismatches = 0, []
+    for pov_id in get_pov_ids(scenario_path):
+        if int(pov_id) < 0 and not rsus:
+            continue
+        pov_path = os.path.join(scenario_path, pov_id)
+        output_pov_path = os.path.join(output_path, pov_id)
+        os.makedirs(output_pov_path)
+
+        yaml_frames = get_yaml_frames(scenario_path, pov_id)
+        for yaml_frame in yaml_frames:
+            frame = yaml_frame.split(".")[0]
+            pov_yaml = load_yaml(os.path.join(pov_path, yaml_frame))
+            with open(os.path.join(output_pov_path, yaml_frame), "w") as outfile:
+                yaml.dump(to_opv2v_annotations(pov_yaml), outfile, default_flow_style=False)
+
+            ply_path = os.path.join(pov_path, frame + PLY_SUFFIX)
+            if os.path.exists(ply_path) or os.path.exists(get_bin_path(ply_path)):
+                write_pcd(os.path.join(output_pov_path, f"{frame}.pcd"), load_point_cloud(ply_path))
+
+            for key in pov_yaml:
+                camera_file = f"{frame}_{key}.png"
+                if key.startswith("camera") and os.path.exists(os.path.join(pov_path, camera_file)):
+                    link_or_copy(os.path.join(pov_path, camera_file), os.path.join(output_pov_path, camera_file))
+            num_frames += 1
+
+        expected = get_source_counts(pov_path, yaml_frames)
+        if count_files(output_pov_path, list(expected)) != expected:
+            mismatches.append(pov_id)
+
+    return output_path, num_frames, mismatches
+
+
+def export_job(job):
+    return export_scenario(*job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OPV2V exporter. Converts the scenarios of a run to OPV2V's layout, "
+                                                 "to be used with OpenCOOD and other OPV2V data loaders.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run or scenario folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-o', "--output", required=True, type=str,
+                        help='Folder where the dataset is exported. Eg: opv2v')
+    parser.add_argument('-s', "--split", type=str, default="train",
+                        help='Split folder where the scenarios are exported. Eg: validate')
+    parser.add_argument('-r', "--rsus", type=bool,
+                        help='Boolean to also export the RSUs, as in V2XSet. Only CAVs are exported by default.')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of scenarios exported in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-f', "--force", type=bool,
+                        help='Boolean to replace the scenario folders of the split that are not empty.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+
+    split_path = os.path.join(opt.output, opt.split)
+    export_jobs = [(scenario_path, os.path.join(split_path, os.path.basename(os.path.normpath(scenario_path))),
+                    bool(opt.rsus)) for scenario_path in get_scenario_paths(opt.path)]
+    output_error = get_output_error(opt.path, opt.output, [output_path for _, output_path, _ in export_jobs],
+                                    opt.force)
+    if output_error:
+        print(output_error)
+        exit(1)
+
+    t0 = time.time()
+
+    print(f"Exporting {len(export_jobs)} scenarios to {split_path}...")
+    num_frames, num_mismatches = 0, 0
+    with Pool(opt.jobs) as pool:
+        for output_path, scenario_frames, mismatches in tqdm(pool.imap_unordered(export_job, export_jobs),
+                                                              total=len(export_jobs)):
+            num_frames += scenario_frames
+            num_mismatches += len(mismatches)
+            if mismatches:
+                print(f"### ERROR: {output_path}: file counts differ from the source for POVs "
+                      f"{', '.join(mismatches)} ###")
+
+    print(f"{num_frames} frames exported in {time.time() - t0:.2f}s.")
+    exit(1 if num_mismatches else 0)
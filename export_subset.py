@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from multiprocessing import Pool
+import cv2
+import numpy as np
+import yaml
+from tqdm import tqdm
+from Dataset.Scripts.utils.dataset import FIELD_SUFFIXES, FIRST_FRAME, get_scenario_paths
+from Dataset.Scripts.utils.manifest import get_manifest_entries, write_manifest_record
+from Dataset.Scripts.utils.point_cloud import BIN_SUFFIX, get_bin_path, get_range_mask, \
+    load_point_cloud, voxel_downsample
+from Dataset.Scripts.utils.summary import get_pov_ids, get_yaml_frames, load_yaml
+
+
+def matches_dataset_config(data_protocol, scenarios=None, weathers=None, densities=None):
+    """
+    Checks the dataset_config of a scenario against the selected scenarios, weathers and densities, given by their
+    names or abbreviations, as in main.py
+
+    :param data_protocol: dict
+        Dictionary loaded from data_protocol.yaml
+    :param scenarios: list
+        Eg: ["ui", "rural_intersection"]. All scenarios if None
+    :param weathers: list
+        Eg: ["cd", "foggy_night"]. All weathers if None
+    :param densities: list
+        Eg: ["d"]. All densities if None
+    :return: boolean
+    """
+    dataset_config = data_protocol["dataset_config"]
+    for key, selected in (("scenario", scenarios), ("weather", weathers), ("density", densities)):
+        if selected is None:
+            continue
+        names = {str(dataset_config[key]).lower(), str(dataset_config[f"{key}_abbreviation"]).lower()}
+        if not names & {value.lower() for value in selected}:
+            return False
+    return True
+
+
+def is_frame_selected(scenario, frame, every=1, sample=1.0, seed=0):
+    """
+    Selects every Nth frame, and then a random sample of them. The sample only depends on the seed, scenario and frame,
+    so that the same frames are selected for all POVs of a scenario, regardless of the order in which they are exported
+
+    :param scenario: str
+        Scenario label. Eg: ui_cd_s
+    :param frame: str
+        Eg: 000060
+    :param every: int
+    :param sample: float
+        Fraction of the frames kept, between 0 and 1
+    :param seed: int
+    :return: boolean
+    """
+    if (int(frame) - FIRST_FRAME) % every != 0:
+        return False
+    digest = hashlib.sha1(f"{seed}:{scenario}:{frame}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < sample
+
+
+def get_output_error(path, output, targets, force=False):
+    """
+    Checks that an export can be written without touching its source: the exported path and the output folder can not
+    be within each other, and the folders replaced by the export must be empty, unless it is forced
+
+    :param path: os.path
+        Exported path
+    :param output: os.path
+        Output folder
+    :param targets: list
+        Folders replaced by the export
+    :param force: boolean
+    :return: str
+        Reason why the export can not be written, None if it can
+    """
+    real_path, real_output = os.path.realpath(path), os.path.realpath(output)
+    if os.path.commonpath([real_output, real_path]) in (real_path, real_output):
+        return "The output folder and the exported path can not be within each other."
+    non_empty = [target for target in targets if os.path.isdir(target) and os.listdir(target)]
+    if non_empty and not force:
+        return f"{non_empty[0]} is not empty, use --force to replace its contents."
+    return None
+
+
+def link_or_copy(source, destination):
+    """
+    Hard links a file, copying it if hard links are not supported (eg: destination in another file system)
+
+    :param source: os.path
+    :param destination: os.path
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def scale_annotations(pov_yaml, scale):
+    """
+    Scales the camera intrinsics and 2D bounding boxes of a ground truth dictionary to downscaled images
+
+    :param pov_yaml: dict
+    :param scale: float
+    :return: dict
+    """
+    for key in pov_yaml:
+        if key.startswith("camera"):
+            intrinsic = np.array(pov_yaml[key]["intrinsic"])
+            intrinsic[:2] *= scale
+            pov_yaml[key]["intrinsic"] = intrinsic.tolist()
+    for object_type in ("vehicles", "walkers"):
+        for obj in (pov_yaml.get(object_type) or {}).values():
+            if "bbx_2d" in obj:
+                obj["bbx_2d"] = (np.array(obj["bbx_2d"]) * scale).tolist()
+    return pov_yaml
+
+
+def export_frame(source_path, output_path, frame, fields, max_range=None, voxel_size=None, scale=1):
+    """
+    Exports the files of a frame of a POV, hard linking those that are not transformed
+
+    :param source_path: os.path
+        Source pov folder
+    :param output_path: os.path
+        Output pov folder
+    :param frame: str
+        Eg: 000060
+    :param fields: list
+        Fields exported, from FIELD_SUFFIXES
+    :param max_range: float
+        Crops the point cloud to this range, in meters, if given
+    :param voxel_size: float
+        Downsamples the point cloud to this voxel size, in meters, if given
+    :param scale: float
+        Scale factor of the images. The camera intrinsics and 2D bounding boxes are scaled accordingly
+    :return: str, dict, int, int
+        Frame, [size, checksum] of each exported file, and number of files linked and written
+    """
+    file_names, num_linked, num_written = [], 0, 0
+    for field in fields:
+        file_name = frame + FIELD_SUFFIXES[field]
+        source_file = os.path.join(source_path, file_name)
+        output_file = os.path.join(output_path, file_name)
+
+        if field == "lidar":
+            if not (os.path.exists(source_file) or os.path.exists(get_bin_path(source_file))):
+                continue
+            if max_range is None and voxel_size is None:
+                for lidar_file in (source_file, get_bin_path(source_file)):
+                    if os.path.exists(lidar_file):
+                        link_or_copy(lidar_file, os.path.join(output_path, os.path.basename(lidar_file)))
+                        file_names.append(os.path.basename(lidar_file))
+                        num_linked += 1
+                continue
+            # transformed point clouds are saved in the binary format, which is read by all tools
+            points = np.asarray(load_point_cloud(source_file))
+            if max_range is not None:
+                points = points[get_range_mask(points, max_range)]
+            if voxel_size is not None:
+                points = points[voxel_downsample(points, voxel_size)]
+            points.tofile(get_bin_path(output_file))
+            file_names.append(frame + BIN_SUFFIX)
+            num_written += 1
+            continue
+
+        if not os.path.exists(source_file):
+            continue
+        if scale != 1 and field.startswith(("camera", "semantic")):
+            image = cv2.imread(source_file, cv2.IMREAD_UNCHANGED)
+            # semantic tags must not be blended between neighbouring pixels
+            interpolation = cv2.INTER_NEAREST if field.startswith("semantic") else cv2.INTER_AREA
+            cv2.imwrite(output_file, cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation))
+            num_written += 1
+        elif scale != 1 and field == "annotations":
+            with open(output_file, "w") as outfile:
+                yaml.dump(scale_annotations(load_yaml(source_file), scale), outfile, default_flow_style=False)
+            num_written += 1
+        else:
+            link_or_copy(source_file, output_file)
+            num_linked += 1
+        file_names.append(file_name)
+
+    return frame, get_manifest_entries(output_path, file_names), num_linked, num_written
+
+
+def export_job(job):
+    return job[:2], export_frame(*job)
+
+
+def get_export_jobs(scenario_paths, output_folder, opt):
+    """
+    Streams the frames to be exported, preparing the output folders of their scenarios and POVs
+
+    :param scenario_paths: list
+    :param output_folder: os.path
+    :param opt: argparse.Namespace
+    :return: generator
+        Arguments of export_frame() for each frame
+    """
+    for scenario_path in scenario_paths:
+        scenario = os.path.basename(os.path.normpath(scenario_path))
+        output_scenario_path = os.path.join(output_folder, scenario)
+        os.makedirs(output_scenario_path, exist_ok=True)
+        link_or_copy(os.path.join(scenario_path, "data_protocol.yaml"),
+                     os.path.join(output_scenario_path, "data_protocol.yaml"))
+
+        for pov_id in get_pov_ids(scenario_path):
+            output_pov_path = os.path.join(output_scenario_path, pov_id)
+            os.makedirs(output_pov_path, exist_ok=True)
+            for yaml_frame in get_yaml_frames(scenario_path, pov_id):
+                frame = yaml_frame.split(".")[0]
+                if is_frame_selected(scenario, frame, opt.every, opt.sample, opt.seed):
+                    yield (os.path.join(scenario_path, pov_id), output_pov_path, frame, opt.fields, opt.range,
+                           opt.voxel, opt.scale)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Subset exporter. Exports a subset of a run, selected by the "
+                                                 "dataset_config of each scenario, to a new run folder.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run or scenario folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-o', "--output", required=True, type=str,
+                        help='Run folder where the subset is exported. Eg: data_dumping/subset')
+    parser.add_argument('-s', "--scenario", type=str, nargs="+",
+                        help='Scenarios exported, by name or abbreviation. All if none is given. Eg: ui rsnj')
+    parser.add_argument('-w', "--weather", type=str, nargs="+",
+                        help='Weather conditions exported, by name or abbreviation. All if none is given. Eg: cd fn')
+    parser.add_argument('-d', "--density", type=str, nargs="+",
+                        help='Densities exported, by name or abbreviation. All if none is given. Eg: d')
+    parser.add_argument('-n', "--every", type=int, default=1,
+                        help='Exports every Nth frame. Eg: 10 for 1 Hz')
+    parser.add_argument("--sample", type=float, default=1.0,
+                        help='Fraction of the frames kept after --every, selected at random. Eg: 0.5')
+    parser.add_argument("--seed", type=int, default=0,
+                        help='Seed of the random selection of frames.')
+    parser.add_argument('-f', "--fields", type=str, nargs="+", default=list(FIELD_SUFFIXES),
+                        choices=list(FIELD_SUFFIXES),
+                        help='Files exported for each frame. Annotations are always exported. Eg: camera0 lidar')
+    parser.add_argument('-r', "--range", type=float,
+                        help='Crops the point clouds to this range from the LiDAR, in meters. Eg: 50')
+    parser.add_argument('-v', "--voxel", type=float,
+                        help='Downsamples the point clouds to a single point per voxel of this size, in meters.')
+    parser.add_argument('-c', "--scale", type=float, default=1,
+                        help='Scale factor of the camera images. Eg: 0.5 for half resolution')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of frames exported in parallel. Defaults to the number of CPUs.')
+    parser.add_argument("--force", type=bool,
+                        help='Boolean to replace the contents of the output folder if it is not empty.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+    output_error = get_output_error(opt.path, opt.output, [opt.output], opt.force)
+    if output_error:
+        print(output_error)
+        exit(1)
+    if os.path.isdir(opt.output):
+        shutil.rmtree(opt.output)
+    # frames are indexed by their ground truth files
+    if "annotations" not in opt.fields:
+        opt.fields = ["annotations"] + opt.fields
+
+    t0 = time.time()
+    selected_paths = [scenario_path for scenario_path in get_scenario_paths(opt.path)
+                      if matches_dataset_config(load_yaml(os.path.join(scenario_path, "data_protocol.yaml")),
+                                                opt.scenario, opt.weather, opt.density)]
+    print(f"Exporting {len(selected_paths)} scenarios to {opt.output}...")
+    os.makedirs(opt.output, exist_ok=True)
+    with open(os.path.join(opt.output, "export.json"), "w") as export_file:
+        json.dump({"source": os.path.abspath(opt.path), **vars(opt)}, export_file, indent=2)
+
+    num_frames, num_linked, num_written = 0, 0, 0
+    with Pool(opt.jobs) as pool:
+        # results arrive in order, so the manifest of each exported POV is written by this process alone
+        for (source_pov_path, output_pov_path), (frame, files, linked, written) in \
+                tqdm(pool.imap(export_job, get_export_jobs(selected_paths, opt.output, opt), chunksize=8)):
+            write_manifest_record(output_pov_path, frame, files)
+            num_frames += 1
+            num_linked += linked
+            num_written += written
+
+    print(f"{num_frames} frames exported in {time.time() - t0:.2f}s: {num_linked} files linked, {num_written} files "
+          f"written.")
@@ -0,0 +1,195 @@
+import argparse
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from tqdm import tqdm
+from Dataset.Scripts.utils.dataset import get_scenario_paths
+from Dataset.Scripts.utils.point_cloud import PLY_SUFFIX, get_bin_path, get_range_mask, load_point_cloud, \
+    voxel_downsample
+from Dataset.Scripts.utils.projection import get_pairwise_transforms
+from Dataset.Scripts.utils.summary import get_ego_id, get_pov_ids, get_yaml_frames, load_yaml
+
+
+def get_frame_inputs(scenario_path, pov_ids, frame):
+    """
+    Finds the POVs with a point cloud in a frame, and the files their fused point cloud is built from
+
+    :param scenario_path: os.path
+    :param pov_ids: list
+        Folder names of the POVs, ego first
+    :param frame: str
+        Eg: 000060
+    :return: list, list
+        POVs available in the frame, ego first, and their yaml and point cloud files
+    """
+    available_pov_ids, input_files = [], []
+    for pov_id in pov_ids:
+        yaml_file = os.path.join(scenario_path, pov_id, f"{frame}.yaml")
+        ply_file = os.path.join(scenario_path, pov_id, frame + PLY_SUFFIX)
+        cloud_file = get_bin_path(ply_file) if os.path.exists(get_bin_path(ply_file)) else ply_file
+        if os.path.exists(yaml_file) and os.path.exists(cloud_file):
+            available_pov_ids.append(pov_id)
+            input_files += [yaml_file, cloud_file]
+    return available_pov_ids, input_files
+
+
+def is_fused_up_to_date(output_file, input_files, max_range, voxel_size):
+    """
+    :param output_file: os.path
+    :param input_files: list
+    :param max_range: float
+    :param voxel_size: float
+    :return: boolean
+        True if the fused point cloud is newer than its inputs and was built with the same parameters
+    """
+    if not os.path.exists(output_file):
+        return False
+    if os.path.getmtime(output_file) < max(os.path.getmtime(input_file) for input_file in input_files):
+        return False
+    with np.load(output_file) as fused:
+        return np.array_equal(fused["max_range"], max_range, equal_nan=True) and \
+            np.array_equal(fused["voxel_size"], voxel_size, equal_nan=True)
+
+
+def fuse_frame(scenario_path, pov_ids, frame, output_path, max_range=None, voxel_size=None, force=False):
+    """
+    Transforms the point clouds of all POVs of a frame to the LiDAR coordinates of the ego and saves them as a single
+    point cloud, along with the transformation matrices between all pairs of POVs. The matrices of all pairs are
+    calculated at once, and the point clouds of all POVs are transformed in a single batched matrix multiplication
+
+    :param scenario_path: os.path
+    :param pov_ids: list
+        Folder names of the POVs, ego first
+    :param frame: str
+        Eg: 000060
+    :param output_path: os.path
+        Folder where the fused point cloud is saved, as <frame>.npz
+    :param max_range: float
+        Removes the points farther than max_range meters from the ego LiDAR, if given
+    :param voxel_size: float
+        Keeps a single point per voxel of voxel_size meters, if given
+    :param force: boolean
+        Fuses the point clouds even if the saved ones are up to date
+    :return: str, int
+        Status (fused, skipped, missing or no_ego) and number of points saved. Frames without the ego's point cloud are
+        not fused, as there is no reference frame to transform the other point clouds to
+    """
+    output_file = os.path.join(output_path, f"{frame}.npz")
+    max_range = np.nan if max_range is None else max_range
+    voxel_size = np.nan if voxel_size is None else voxel_size
+
+    ego_id = pov_ids[0]
+    pov_ids, input_files = get_frame_inputs(scenario_path, pov_ids, frame)
+    if not pov_ids:
+        return "missing", 0
+    if pov_ids[0] != ego_id:
+        return "no_ego", 0
+    if not force and is_fused_up_to_date(output_file, input_files, max_range, voxel_size):
+        return "skipped", 0
+
+    lidar_poses = np.array([load_yaml(yaml_file)["lidar_pose"] for yaml_file in input_files[::2]])
+    transforms = get_pairwise_transforms(lidar_poses)
+    clouds = [load_point_cloud(os.path.join(scenario_path, pov_id, frame + PLY_SUFFIX)) for pov_id in pov_ids]
+
+    # clouds are padded to the same length to be transformed in a single batched operation
+    counts = np.array([len(cloud) for cloud in clouds])
+    padded = np.zeros((len(clouds), counts.max(), 3))
+    for i, cloud in enumerate(clouds):
+        padded[i, :counts[i]] = cloud[:, :3]
+    to_ego = transforms[0]
+    transformed = padded @ to_ego[:, :3, :3].transpose(0, 2, 1) + to_ego[:, None, :3, 3]
+
+    valid = np.arange(counts.max())[None, :] < counts[:, None]
+    points = np.empty((counts.sum(), 4), dtype=np.float32)
+    points[:, :3] = transformed[valid]
+    points[:, 3] = np.concatenate([cloud[:, 3] for cloud in clouds])
+    pov_index = np.repeat(np.arange(len(clouds), dtype=np.uint8), counts)
+
+    if not np.isnan(max_range):
+        mask = get_range_mask(points, max_range)
+        points, pov_index = points[mask], pov_index[mask]
+    if not np.isnan(voxel_size):
+        indexes = voxel_downsample(points, voxel_size)
+        points, pov_index = points[indexes], pov_index[indexes]
+
+    os.makedirs(output_path, exist_ok=True)
+    # saved to a temporary file first, so that an interrupted run never leaves a partial file behind
+    with open(output_file + ".part", "wb") as outfile:
+        np.savez_compressed(outfile, points=points, pov_index=pov_index, pov_ids=np.array(pov_ids),
+                            lidar_poses=lidar_poses, transforms=transforms, max_range=max_range,
+                            voxel_size=voxel_size)
+    os.replace(output_file + ".part", output_file)
+    return "fused", len(points)
+
+
+def get_fusion_jobs(path, output_folder, max_range=None, voxel_size=None, force=False):
+    """
+    Lists the frames to be fused of all scenarios in a path, one job per frame
+
+    :param path: os.path
+        Path to a run or scenario folder
+    :param output_folder: os.path
+        Fused point clouds are saved to <output_folder>/<run>/<scenario>
+    :param max_range: float
+    :param voxel_size: float
+    :param force: boolean
+    :return: list
+        Arguments of fuse_frame() for each frame
+    """
+    jobs = []
+    for scenario_path in get_scenario_paths(path):
+        folder_names = os.path.abspath(scenario_path).split(os.sep)
+        output_path = os.path.join(output_folder, folder_names[-2], folder_names[-1])
+
+        pov_ids = get_pov_ids(scenario_path)
+        data_protocol = load_yaml(os.path.join(scenario_path, "data_protocol.yaml"))
+        ego_id = get_ego_id(pov_ids, data_protocol)
+        pov_ids = [ego_id] + [pov_id for pov_id in pov_ids if pov_id != ego_id]
+
+        jobs += [(scenario_path, pov_ids, yaml_frame.split(".")[0], output_path, max_range, voxel_size, force)
+                 for yaml_frame in get_yaml_frames(scenario_path, ego_id)]
+    return jobs
+
+
+def fuse_job(job):
+    return fuse_frame(*job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Point cloud fusion. Transforms the point clouds of all CAVs and RSUs "
+                                                 "of each frame to the LiDAR coordinates of the ego and caches them.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run or scenario folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-o', "--output", type=str, default="fused",
+                        help='Folder where the fused point clouds are saved, under <run>/<scenario>.')
+    parser.add_argument('-r', "--range", type=float,
+                        help='Removes the points farther than this range from the ego LiDAR, in meters. Eg: 100')
+    parser.add_argument('-v', "--voxel", type=float,
+                        help='Keeps a single point per voxel of this size, in meters. Eg: 0.1')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of frames fused in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-f', "--force", type=bool,
+                        help='Boolean to fuse all frames, even those whose fused point clouds are up to date.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+
+    t0 = time.time()
+    fusion_jobs = get_fusion_jobs(opt.path, opt.output, opt.range, opt.voxel, bool(opt.force))
+    print(f"Fusing the point clouds of {len(fusion_jobs)} frames...")
+    counts = {"fused": 0, "skipped": 0, "missing": 0, "no_ego": 0}
+    num_points = 0
+    with Pool(opt.jobs) as pool:
+        for job, (status, points) in zip(fusion_jobs, tqdm(pool.imap(fuse_job, fusion_jobs, chunksize=4),
+                                                           total=len(fusion_jobs))):
+            counts[status] += 1
+            num_points += points
+            if status == "no_ego":
+                print(f"### ERROR: {job[0]}: frame {job[2]} not fused, the ego has no point cloud ###")
+
+    print(f"{counts['fused']} frames fused ({num_points} points), {counts['skipped']} up to date, "
+          f"{counts['missing']} without point clouds and {counts['no_ego']} without the ego's point cloud in "
+          f"{time.time() - t0:.2f}s.")
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from Dataset.Scripts.utils.bev import BEV_CHANNELS, BEV_SCHEMA_VERSION, load_bev_index, rasterize_frame
+from Dataset.Scripts.utils.dataset import get_scenario_paths
+from Dataset.Scripts.utils.point_cloud import PLY_SUFFIX, get_bin_path, load_point_cloud
+from Dataset.Scripts.utils.summary import get_pov_ids, get_yaml_frames, load_yaml
+
+
+def get_pov_frames(scenario_path):
+    """
+    Lists the frames of each POV that have both a ground truth yaml and a point cloud. Frames without a point cloud
+    (eg: runs interrupted while dumping, before the manifests) are left out
+
+    :param scenario_path: os.path
+    :return: dict, int
+        Frames of each POV, eg: {"698": ["000060", "000061", ...], ...}, and number of frames left out
+    """
+    pov_frames, num_missing = {}, 0
+    for pov_id in get_pov_ids(scenario_path):
+        pov_frames[pov_id] = []
+        for yaml_frame in get_yaml_frames(scenario_path, pov_id):
+            frame = yaml_frame.split(".")[0]
+            ply_path = os.path.join(scenario_path, pov_id, frame + PLY_SUFFIX)
+            if os.path.exists(ply_path) or os.path.exists(get_bin_path(ply_path)):
+                pov_frames[pov_id].append(frame)
+            else:
+                num_missing += 1
+    return pov_frames, num_missing
+
+
+def get_pov_inputs(scenario_path, pov_id, frames):
+    """
+    Lists the files the grids of a POV are built from: the ground truth yaml and the point cloud of each frame, the
+    binary version of the point cloud being the one read if it has been converted
+
+    :param scenario_path: os.path
+    :param pov_id: str
+    :param frames: list
+    :return: dict
+        [size, modification time] of each file, keyed by file name
+    """
+    pov_path = os.path.join(scenario_path, pov_id)
+    inputs = {}
+    for frame in frames:
+        ply_path = os.path.join(pov_path, frame + PLY_SUFFIX)
+        for file_path in (os.path.join(pov_path, f"{frame}.yaml"),
+                          get_bin_path(ply_path) if os.path.exists(get_bin_path(ply_path)) else ply_path):
+            stat = os.stat(file_path)
+            inputs[os.path.basename(file_path)] = [stat.st_size, stat.st_mtime_ns]
+    return inputs
+
+
+def is_bev_up_to_date(output_path, pov_frames, pov_inputs, parameters):
+    """
+    :param output_path: os.path
+        BEV folder of the scenario
+    :param pov_frames: dict
+        Frames of each POV in the scenario
+    :param pov_inputs: dict
+        Inputs of each POV in the scenario, see get_pov_inputs()
+    :param parameters: dict
+        Resolution, extent and chunk size of the grids
+    :return: boolean
+        True if the cache has the same parameters and frames as the scenario, and was built from inputs with the same
+        sizes and modification times, so that re-dumped or converted frames are rasterized again
+    """
+    index = load_bev_index(output_path)
+    if index is None or index["parameters"] != parameters or index["inputs"] != pov_inputs:
+        return False
+    return {pov_id: sorted(frames) for pov_id, frames in index["povs"].items()} == pov_frames
+
+
+def rasterize_pov(scenario_path, pov_id, frames, output_path, resolution, extent, chunk_size):
+    """
+    Builds the BEV grids of all frames of a POV, saving them in compressed chunks of chunk_size frames
+
+    :param scenario_path: os.path
+    :param pov_id: str
+    :param frames: list
+    :param output_path: os.path
+        BEV folder of the scenario, chunks are saved to <output_path>/<pov_id>
+    :param resolution: float
+        Side of each cell in meters
+    :param extent: float
+        Distance from the LiDAR to the borders of the grid in meters
+    :param chunk_size: int
+        Number of frames per chunk
+    :return: str, dict
+        POV id and the chunk file and position of each frame within it
+    """
+    pov_path = os.path.join(scenario_path, pov_id)
+    pov_output_path = os.path.join(output_path, pov_id)
+    os.makedirs(pov_output_path, exist_ok=True)
+
+    frame_index = {}
+    for chunk_start in range(0, len(frames), chunk_size):
+        chunk_frames = frames[chunk_start:chunk_start + chunk_size]
+        grids = [rasterize_frame(load_yaml(os.path.join(pov_path, f"{frame}.yaml")),
+                                 load_point_cloud(os.path.join(pov_path, frame + PLY_SUFFIX)), resolution, extent)
+                 for frame in chunk_frames]
+
+        chunk = f"chunk_{chunk_start // chunk_size:05d}.npz"
+        with open(os.path.join(pov_output_path, chunk + ".part"), "wb") as outfile:
+            np.savez_compressed(outfile, frames=np.array(chunk_frames),
+                                **{channel: np.stack([grid[channel] for grid in grids]) for channel in BEV_CHANNELS})
+        os.replace(os.path.join(pov_output_path, chunk + ".part"), os.path.join(pov_output_path, chunk))
+        frame_index.update({frame: [chunk, position] for position, frame in enumerate(chunk_frames)})
+
+    return pov_id, frame_index
+
+
+def save_bev_index(output_path, parameters, povs, pov_inputs):
+    """
+    :param output_path: os.path
+        BEV folder of the scenario
+    :param parameters: dict
+    :param povs: dict
+        Chunk file and position of each frame of each POV
+    :param pov_inputs: dict
+        Inputs of each POV, as listed before rasterizing them
+    """
+    index = {"schema_version": BEV_SCHEMA_VERSION, "channels": list(BEV_CHANNELS), "parameters": parameters,
+             "povs": povs, "inputs": pov_inputs}
+    with open(os.path.join(output_path, "index.json.part"), "w") as outfile:
+        json.dump(index, outfile)
+    os.replace(os.path.join(output_path, "index.json.part"), os.path.join(output_path, "index.json"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BEV cache generator. Rasterizes the point cloud and the bounding "
+                                                 "boxes of each frame of each POV into bird's eye view grids.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to a run or scenario folder. Eg: data_dumping/2024_06_14_12_47_41')
+    parser.add_argument('-o', "--output", type=str, default="bev",
+                        help='Folder where the grids are saved, under <run>/<scenario>.')
+    parser.add_argument('-r', "--resolution", type=float, default=0.4,
+                        help='Side of each cell, in meters.')
+    parser.add_argument('-e', "--extent", type=float, default=51.2,
+                        help='Distance from the LiDAR to the borders of the grids, in meters.')
+    parser.add_argument('-c', "--chunk", type=int, default=50,
+                        help='Number of frames saved in each compressed chunk.')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of POVs rasterized in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-f', "--force", type=bool,
+                        help='Boolean to rasterize all scenarios, even those whose grids are up to date.')
+    opt = parser.parse_args()
+
+    if not os.path.exists(opt.path):
+        print("Path not found.")
+        exit(1)
+
+    t0 = time.time()
+    bev_parameters = {"resolution": opt.resolution, "extent": opt.extent, "chunk_size": opt.chunk}
+    scenario_jobs, scenario_inputs = {}, {}
+    num_skipped, num_missing = 0, 0
+    for scenario_path in get_scenario_paths(opt.path):
+        folder_names = os.path.abspath(scenario_path).split(os.sep)
+        scenario_output_path = os.path.join(opt.output, folder_names[-2], folder_names[-1])
+        scenario_pov_frames, scenario_missing = get_pov_frames(scenario_path)
+        if scenario_missing:
+            print(f"### ERROR: {scenario_path}: {scenario_missing} frames without point clouds are not rasterized ###")
+            num_missing += scenario_missing
+        # inputs are listed before rasterizing, so that files modified meanwhile are rasterized again in the next run
+        scenario_inputs[scenario_output_path] = {pov_id: get_pov_inputs(scenario_path, pov_id, pov_frames)
+                                                 for pov_id, pov_frames in scenario_pov_frames.items()}
+        if not opt.force and is_bev_up_to_date(scenario_output_path, scenario_pov_frames,
+                                               scenario_inputs[scenario_output_path], bev_parameters):
+            num_skipped += 1
+            continue
+        scenario_jobs[scenario_output_path] = [(scenario_path, pov_id, pov_frames, scenario_output_path,
+                                                opt.resolution, opt.extent, opt.chunk)
+                                               for pov_id, pov_frames in scenario_pov_frames.items()]
+
+    print(f"Rasterizing {len(scenario_jobs)} scenarios ({num_skipped} up to date)...")
+    with Pool(opt.jobs) as pool:
+        results = {scenario_output_path: [pool.apply_async(rasterize_pov, job) for job in jobs]
+                   for scenario_output_path, jobs in scenario_jobs.items()}
+        # the index of each scenario is only saved once all its POVs have been rasterized
+        for scenario_output_path, scenario_results in results.items():
+            save_bev_index(scenario_output_path, bev_parameters, dict(result.get() for result in scenario_results),
+                           scenario_inputs[scenario_output_path])
+            print(f"{scenario_output_path}: {len(scenario_results)} POVs rasterized")
+
+    print(f"All scenarios rasterized in {time.time() - t0:.2f}s, {num_missing} frames without point clouds skipped.")
@@ -0,0 +1,179 @@
+import argparse
+import cv2
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from generate_video import prefetch, read_frame
+from Dataset.Scripts.utils.projection import BOX_EDGES, get_box_corners_3d, get_camera_parameters, project_to_cameras
+from Dataset.Scripts.utils.summary import get_cav_ids, get_pov_ids, get_yaml_frames, load_yaml
+from Dataset.Scripts.utils.top_down import CAV_COLOR, VEHICLE_COLOR, WALKER_COLOR
+
+
+def draw_boxes(image, pixels, depth, colors):
+    """
+    Draws the edges of projected 3D bounding boxes on an image. Edges with an end behind the camera are not drawn
+
+    :param image: ndarray
+        BGR image, modified in place
+    :param pixels: ndarray
+        Pixel coordinates of the box corners, with shape (N, 8, 2)
+    :param depth: ndarray
+        Depth of the box corners, with shape (N, 8)
+    :param colors: list
+        BGR color of each box
+    """
+    edges = pixels[:, BOX_EDGES]
+    visible = (depth[:, BOX_EDGES] > 0).all(axis=-1)
+    # keeps far away corners within the range of int32 coordinates, OpenCV clips the lines to the image
+    edges = np.round(np.clip(edges, -1e5, 1e5)).astype(np.int32)
+
+    for color in set(colors):
+        mask = visible & (np.array([box_color == color for box_color in colors])[:, None])
+        if mask.any():
+            cv2.polylines(image, list(edges[mask]), False, color, 1, cv2.LINE_AA)
+
+
+def render_overlay_frame(image_folder, frame, cameras, scale, cav_ids):
+    """
+    Draws the annotations of a frame on the images of its cameras. The boxes of all objects are projected to all
+    cameras in a single batched operation
+
+    :param image_folder: os.path
+        Path to the pov folder
+    :param frame: str
+        Frame number. Eg: 000060
+    :param cameras: list
+        Indexes of the cameras
+    :param scale: float
+        Scale factor applied to the images
+    :param cav_ids: list
+        Ids of the CAVs, drawn in a different color
+    :return: list
+        BGR image of each camera
+    """
+    pov_yaml = load_yaml(os.path.join(image_folder, f"{frame}.yaml"))
+    vehicles = pov_yaml.get("vehicles") or {}
+    walkers = pov_yaml.get("walkers") or {}
+
+    cav_ids = {str(cav_id) for cav_id in cav_ids}
+    colors = [CAV_COLOR if str(vehicle_id) in cav_ids else VEHICLE_COLOR for vehicle_id in vehicles]
+    colors += [WALKER_COLOR] * len(walkers)
+    corners = np.concatenate([get_box_corners_3d(vehicles), get_box_corners_3d(walkers)])
+
+    world_to_camera, intrinsics = get_camera_parameters(pov_yaml)
+    pixels, depth = project_to_cameras(corners.reshape(-1, 3), world_to_camera[cameras], intrinsics[cameras])
+    pixels = pixels.reshape(len(cameras), -1, 8, 2) * scale
+    depth = depth.reshape(len(cameras), -1, 8)
+
+    images = []
+    for i, camera in enumerate(cameras):
+        image = read_frame(os.path.join(image_folder, f"{frame}_camera{camera}.png"), scale)
+        draw_boxes(image, pixels[i], depth[i], colors)
+        images.append(image)
+    return images
+
+
+def generate_overlay(image_folder, cameras, scale=1, threads=4, images=False):
+    """
+    Renders the annotations of a POV over its camera images, in a single pass over the frames for all cameras
+
+    :param image_folder: os.path
+        Path to the pov folder. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s/109
+    :param cameras: list
+        Indexes of the cameras
+    :param scale: float
+        Scale factor applied to the images
+    :param threads: int
+        Number of threads rendering the frames
+    :param images: boolean
+        Saves the overlays as images instead of videos
+    :return: str, int, float
+        Output folder, number of frames and time taken to render them
+    """
+    t0 = time.time()
+    folder_names = image_folder.rstrip("/").split("/")
+    cameras = [int(camera) for camera in cameras]
+    if images:
+        output_folder = os.path.join("overlays", *folder_names[-3:])
+    else:
+        output_folder = f"videos/{folder_names[-3]}"
+    os.makedirs(output_folder, exist_ok=True)
+
+    scenario_path = os.path.dirname(image_folder.rstrip("/"))
+    frames = [yaml_frame.split(".")[0] for yaml_frame in get_yaml_frames(scenario_path, folder_names[-1])]
+    if not frames:
+        return output_folder, 0, time.time() - t0
+
+    data_protocol = load_yaml(os.path.join(scenario_path, "data_protocol.yaml"))
+    cav_ids = get_cav_ids(get_pov_ids(scenario_path), data_protocol)
+
+    videos = []
+    for frame, overlays in zip(frames, prefetch(render_overlay_frame,
+                                                [(image_folder, frame, cameras, scale, cav_ids) for frame in frames],
+                                                threads)):
+        if images:
+            for camera, overlay in zip(cameras, overlays):
+                cv2.imwrite(os.path.join(output_folder, f"{frame}_camera{camera}.png"), overlay)
+            continue
+
+        if not videos:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            for camera, overlay in zip(cameras, overlays):
+                video_name = f"{output_folder}/{folder_names[-2]}_{folder_names[-1]}_cam{camera}_overlay.mp4"
+                videos.append(cv2.VideoWriter(video_name, fourcc, 10, (overlay.shape[1], overlay.shape[0])))  # 10 fps
+        for video, overlay in zip(videos, overlays):
+            video.write(overlay)
+
+    for video in videos:
+        video.release()
+    return output_folder, len(frames), time.time() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Annotation overlay renderer.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to pov object from current folder, or, if "all" is used, to the parent folder '
+                             'containing the folders of all objects. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s/109 '
+                             'or, if "all" is used, data_dumping/2024_06_14_12_47_41/ui_cd_s')
+    parser.add_argument('-a', "--all", type=bool, help='Boolean to render the overlays of all POVs at once.')
+    parser.add_argument('-c', "--camera", type=str, nargs="+", default=["0", "1", "2", "3"],
+                        help='Cameras to render, all four by default. Eg: 0 or 0 2')
+    parser.add_argument('-s', "--scale", type=float, default=1,
+                        help='Scale factor applied to the frames. Eg: 0.5 for half resolution.')
+    parser.add_argument('-i', "--images", type=bool,
+                        help='Boolean to save the overlays as images in the overlays folder instead of videos.')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of POVs rendered in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-t', "--threads", type=int, default=4,
+                        help='Number of threads rendering the frames of each POV.')
+    opt = parser.parse_args()
+
+    folder = opt.path
+    if not os.path.exists(folder):
+        print("Path not found.")
+        exit(1)
+
+    if opt.all:
+        # if all flag is active, lists all folders in the path given, rendering the overlays of all povs
+        image_folder_list = [folder[0] for folder in os.walk(folder)]
+        image_folder_list.pop(0)
+    else:
+        # else, considers just the folder in the path given (the pov folder)
+        image_folder_list = [folder]
+
+    if not image_folder_list:
+        print("No POV folders found in the path given.")
+        exit(1)
+
+    t0 = time.time()
+    print(f"Rendering the overlays of {len(image_folder_list)} POVs...")
+    with Pool(min(opt.jobs or os.cpu_count(), len(image_folder_list))) as pool:
+        results = [pool.apply_async(generate_overlay, (image_folder, opt.camera, opt.scale, opt.threads,
+                                                       bool(opt.images)))
+                   for image_folder in image_folder_list]
+        for result, image_folder in zip(results, image_folder_list):
+            output_folder, num_frames, overlay_time = result.get()
+            print(f"{image_folder} -> {output_folder}: {num_frames} frames in {overlay_time:.2f}s")
+
+    print(f"All overlays rendered in {time.time() - t0:.2f}s.")
@@ -1,37 +1,53 @@
 import argparse
 import os
-from omegaconf import OmegaConf
+from multiprocessing import Pool
 from tqdm import tqdm
-from Dataset.Scripts.utils.stats import Stats
-
-# create an argument parser
-parser = argparse.ArgumentParser(description="Adver-City dataset annotation statistics generator.")
-
-# add arguments to the parser
-parser.add_argument('-p', "--path", type=str,
-                    help='Path of run to have its annotation statistics generated. Eg: '
-                         'data_dumping/2024_06_14_12_47_41')
-
-# parse the arguments and return the result
-opt = parser.parse_args()
-
-run_path = opt.path
-simulation_folders = os.listdir(run_path)
-statistics_path = os.path.join(run_path, "stats/")
-if not os.path.exists(statistics_path):
-    os.makedirs(statistics_path)
-
-stats = Stats(statistics_path)
-
-print("Reading summary data...")
-for simulation_folder in tqdm(simulation_folders):
-    if simulation_folder == "stats":
-        continue
-    simulation_summary = OmegaConf.load(os.path.join(run_path, simulation_folder, "summary.yaml"))
-    stats.read_summary_data(simulation_summary)
-
-print("Generating charts...")
-stats.generate_charts()
-
-
-
+from Dataset.Scripts.utils.stats import Stats, get_summary_state
+
+if __name__ == "__main__":
+    # create an argument parser
+    parser = argparse.ArgumentParser(description="Adver-City dataset annotation statistics generator.")
+
+    # add arguments to the parser
+    parser.add_argument('-p', "--path", type=str, nargs="+",
+                        help='Path of run to have its annotation statistics generated. Eg: '
+                             'data_dumping/2024_06_14_12_47_41. Multiple runs may be given to combine their statistics')
+    parser.add_argument("-o", "--output", type=str,
+                        help="Folder where the statistics are saved. Defaults to the stats folder of the run, and is "
+                             "required when multiple runs are given.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of processes used to read the summaries and create the charts. Defaults to the "
+                             "number of CPUs.")
+    parser.add_argument("-c", "--charts", type=str, nargs="+", choices=list(Stats.CHARTS),
+                        help="Names of the charts to be created. Defaults to all charts.")
+    parser.add_argument("-f", "--force", type=bool,
+                        help="Boolean to create charts whose data has not changed since they were last created.")
+
+    # parse the arguments and return the result
+    opt = parser.parse_args()
+
+    if opt.output:
+        statistics_path = os.path.join(opt.output, "")
+    elif len(opt.path) == 1:
+        statistics_path = os.path.join(opt.path[0], "stats/")
+    else:
+        parser.error("-o/--output is required when statistics of multiple runs are combined")
+
+    if not os.path.exists(statistics_path):
+        os.makedirs(statistics_path)
+
+    simulation_paths = [os.path.join(run_path, simulation_folder)
+                        for run_path in opt.path
+                        for simulation_folder in sorted(os.listdir(run_path))
+                        if simulation_folder != "stats"]
+
+    stats = Stats(statistics_path)
+
+    # the statistics of each scenario are calculated in parallel, or read from their cache, and then merged
+    print("Reading summary data...")
+    with Pool(opt.jobs or os.cpu_count()) as pool:
+        for state in tqdm(pool.imap(get_summary_state, simulation_paths), total=len(simulation_paths)):
+            stats.merge(state)
+
+    print("Generating charts...")
+    stats.generate_charts(opt.charts, opt.jobs, opt.force)
@@ -1,146 +1,99 @@
 import argparse
 import os
-import yaml
-from omegaconf import OmegaConf
+import time
+from multiprocessing import Pool
 from tqdm import tqdm
+from Dataset.Scripts.utils.summary import (get_ego_id, get_pov_ids, get_scenario_summary, get_yaml_frames,
+                                           is_summary_up_to_date, load_yaml, save_summary, summarize_frame)
 
 
-def split_weather_and_time_of_day(weather_config):
+def start_summary(path, pool, processes):
     """
-    Splits the weather_config string into weather and time of day
+    Starts generating the summary yaml for the scenario located at the given path. The summary file contains all
+    necessary information to generate plots and speeds up their generation afterwards. Frames are summarized
+    asynchronously by the process pool
 
-    :param weather_config: str
-    :return: str, str
+    :param path: os.path
+        Path to the scenario folder whose summary is being generated
+    :param pool: multiprocessing.Pool
+    :param processes: int
+        Number of processes of the pool
+    :return: dict, multiprocessing.pool.AsyncResult
+        Scenario information of the summary and the pending list of (frame number, frame summary) tuples
     """
-    time_of_day = weather_config.split("_")[-1]
-    weather = weather_config[:-(len(time_of_day) + 1)]
-    return weather, time_of_day
+    data_protocol = load_yaml(os.path.join(path, "data_protocol.yaml"))
+    pov_ids = get_pov_ids(path)
+    yaml_frames = get_yaml_frames(path, get_ego_id(pov_ids, data_protocol))
 
+    summary = get_scenario_summary(path, data_protocol, len(yaml_frames))
 
-def generate_summary(path):
-    """
-    Generates the summary yaml for the scenario located at the given path. The summary file contains all necessary
-    information to generate plots and speeds up their generation afterwards
+    frame_args = [(path, pov_ids, yaml_frame) for yaml_frame in yaml_frames]
+    chunksize = max(1, len(frame_args) // (4 * processes))
+    frames = pool.starmap_async(summarize_frame, frame_args, chunksize=chunksize)
 
-    :param path: os.path
-        Path to the scenario folder whose summary is being generated
+    return summary, frames
+
+
+def generate_summaries(paths, processes=None, force=False):
+    """
+    Generates the summaries of multiple scenarios. All frames of all scenarios are summarized by the same process
+    pool, so that scenarios are also processed in parallel. Scenarios whose summary was built from their current frames
+    are skipped
+
+    :param paths: list
+        Paths to the scenario folders whose summaries are being generated
+    :param processes: int
+        Number of processes. If None, the number of CPUs is used
+    :param force: boolean
+        Regenerates all summaries, even if they are up to date
     """
-    scenario_label = path.split("/")[-1]
-    folders = os.listdir(path)
-    folders.sort()
-    data_protocol_path = os.path.join(path, "data_protocol.yaml")
-    data_protocol = OmegaConf.load(data_protocol_path)
-
-    pov_ids = folders[:5]
-
-    folder_path = os.path.join(path, pov_ids[2])
-    yaml_frames = [file
-                   for file in os.listdir(folder_path)
-                   if (file.endswith("yaml") and ("_" not in file))]
-    yaml_frames.sort()
-
-    weather, time_of_day = split_weather_and_time_of_day(data_protocol["dataset_config"]["weather"])
-    num_spawn_points = len(data_protocol["scenario"]["rsu_list"]) + 2 * len(
-        data_protocol["scenario"]["single_cav_list"])
-
-    # scenario information to be save in the summary file
-    summary = {
-        "simulation": scenario_label,
-        "scenario": data_protocol["dataset_config"]["scenario"],
-        "weather": weather,
-        "time_of_day": time_of_day,
-        "density": data_protocol["dataset_config"]["density"],
-        "num_frames": len(yaml_frames),
-        "num_vehicles": round(data_protocol["scenario"]["num_vehicles"] * num_spawn_points *
-                              data_protocol["density"]["vehicle_multiplier"]),
-        "num_walkers": round(data_protocol["scenario"]["num_walkers"] * data_protocol["density"]["walker_multiplier"])
-    }
-
-    frames_dict = {}
-    for yaml_frame in tqdm(yaml_frames):
-        # iterate through the frames in the scenario
-        frame_number = yaml_frame.split(".")[0]
-        pov_frame_paths = [os.path.join(path, pov_id, yaml_frame) for pov_id in pov_ids]
-        pov_yamls = [OmegaConf.load(pov_frame_path) for pov_frame_path in pov_frame_paths]
-        pov_speeds = [pov_yaml["ego_speed"] for pov_yaml in pov_yamls]
-
-        # index 2 is ego, so it goes last in merge list so that it can override values
-        merged_yamls = OmegaConf.merge(pov_yamls[0], pov_yamls[1], pov_yamls[3], pov_yamls[4], pov_yamls[2])
-
-        # Number of walkers might be 0, so key might not exist on dictionary
-        if "walkers" in pov_yamls[2]:
-            num_walkers = len(merged_yamls["walkers"])
-            objs = ["vehicles", "walkers"]
-            ego_objs = OmegaConf.merge(pov_yamls[2]["vehicles"], pov_yamls[2]["walkers"])
-        else:
-            num_walkers = 0
-            objs = ["vehicles"]
-            ego_objs = pov_yamls[2]["vehicles"]
-
-        # information on the current frame to be save to the summary: speeds of cavs and total number of ground truths
-        frame_dict = {
-            "cav_speeds": {
-                "ego": pov_speeds[2],
-                "cav1": pov_speeds[3],
-                "cav2": pov_speeds[4]
-            },
-            "num_annotations": len(merged_yamls["vehicles"]) + num_walkers
-        }
-
-        for obj in objs:
-            # iterates through detected objects, saving their ground truths to the summary
-            for obj_id in merged_yamls[obj]:
-                if str(obj_id) in pov_ids:
-                    # ignore cavs
-                    continue
-                elif obj_id in ego_objs:
-                    # Vehicle/walker detected by ego
-                    classe = merged_yamls[obj][obj_id]["class"] if "class" in merged_yamls[obj][obj_id] else "walker"
-                    frame_dict.update({obj_id: {
-                        "class": classe,
-                        "speed": merged_yamls[obj][obj_id]["speed"],
-                        "distance_to_ego": merged_yamls[obj][obj_id]["dist"],
-                        "angle_to_ego": merged_yamls[obj][obj_id]["relative_angle"]
-                    }})
-                else:
-                    # Vehicle/walker out of range from ego
-                    classe = merged_yamls[obj][obj_id]["class"] if "class" in merged_yamls[obj][obj_id] else "walker"
-                    frame_dict.update({obj_id: {
-                        "class": classe,
-                        "speed": merged_yamls[obj][obj_id]["speed"]
-                    }})
-
-        frames_dict.update({int(frame_number): frame_dict})
-    summary.update({"frames": frames_dict})
-
-    summary_path = os.path.join(path, "summary.yaml")
-    with open(summary_path, "w") as outfile:
-        yaml.dump(summary, outfile, default_flow_style=False, sort_keys=False)
-
-
-# create an argument parser
-parser = argparse.ArgumentParser(description="Adver-City dataset scenario summary generator.")
-
-# add arguments to the parser
-parser.add_argument('-p', "--path", type=str,
-                    help='Path of scenario. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s')
-parser.add_argument("-a", "--all", type=bool,
-                    help="Boolean to generate summary of all simulations in a folder.")
-
-# parse the arguments and return the result
-opt = parser.parse_args()
-
-arg_path = opt.path
-if opt.all:
-    # if "all" flag is active, lists scenario folders within path and generates summaries for all of them
-    simulation_paths = os.listdir(arg_path)
-    simulation_paths.sort()
-    for simulation_path in simulation_paths:
-        # iterates through simulation folders
-        print(f"Generating {simulation_path} summary...")
-        path = os.path.join(arg_path, simulation_path)
-        generate_summary(path)
-else:
-    # otherwise, just generate the summary for the folder in the given path
-    print("Generating summary...")
-    generate_summary(arg_path)
+    if not force:
+        stale_paths = [path for path in paths if not is_summary_up_to_date(path)]
+        if len(stale_paths) < len(paths):
+            print(f"Skipping {len(paths) - len(stale_paths)} up to date summaries")
+        paths = stale_paths
+
+    if not paths:
+        return
+
+    processes = processes or os.cpu_count()
+    with Pool(processes) as pool:
+        jobs = [(path, *start_summary(path, pool, processes)) for path in paths]
+
+        for path, summary, frames in tqdm(jobs):
+            summary.update({"frames": dict(frames.get())})
+            save_summary(path, summary)
+
+
+if __name__ == "__main__":
+    # create an argument parser
+    parser = argparse.ArgumentParser(description="Adver-City dataset scenario summary generator.")
+
+    # add arguments to the parser
+    parser.add_argument('-p', "--path", type=str,
+                        help='Path of scenario. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s')
+    parser.add_argument("-a", "--all", type=bool,
+                        help="Boolean to generate summary of all simulations in a folder.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of processes used to read the frames. Defaults to the number of CPUs.")
+    parser.add_argument("-f", "--force", type=bool,
+                        help="Boolean to regenerate summaries that are up to date with their frames.")
+
+    # parse the arguments and return the result
+    opt = parser.parse_args()
+
+    arg_path = opt.path
+    t0 = time.time()
+    if opt.all:
+        # if "all" flag is active, lists scenario folders within path and generates summaries for all of them
+        simulation_paths = [os.path.join(arg_path, simulation_path)
+                            for simulation_path in sorted(os.listdir(arg_path))
+                            if simulation_path != "stats"]
+        print(f"Generating {len(simulation_paths)} summaries...")
+        generate_summaries(simulation_paths, opt.jobs, opt.force)
+    else:
+        # otherwise, just generate the summary for the folder in the given path
+        print("Generating summary...")
+        generate_summaries([arg_path], opt.jobs, opt.force)
+
+    print(f"Summaries generated in {time.time() - t0:.2f}s")
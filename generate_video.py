@@ -1,64 +1,244 @@
 import argparse
 import cv2
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+import numpy as np
+from Dataset.Scripts.utils.manifest import get_manifest_files, load_manifest
+from Dataset.Scripts.utils.summary import get_cav_ids, get_pov_ids, get_yaml_frames, load_yaml
+from Dataset.Scripts.utils.top_down import draw_top_down
 
 
-parser = argparse.ArgumentParser(description="Video generator.")
-parser.add_argument('-p', "--path", required=True, type=str,
-                    help='Path to pov object from current folder, or, if "all" is used, to the parent folder containing'
-                         ' the folders of all objects. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s/109 or, if "all" '
-                         'is used, data_dumping/2024_06_14_12_47_41/ui_cd_s')
-parser.add_argument('-a', "--all", type=bool, help='Boolean to record the videos of all POVs at once.')
-parser.add_argument('-c', "--camera", type=str,
-                    help='Camera 0 (front view) is standard, but if needed, this can be changed here. Eg: 2')
-opt = parser.parse_args()
-
-folder = opt.path
-if not os.path.exists(folder):
-    print("Path not found.")
-    exit(1)
-
-if opt.all:
-    # if all flag is active, lists all folders in the path given, generating videos for all povs
-    image_folder_list = [folder[0] for folder in os.walk(folder)]
-    image_folder_list.pop(0)
-else:
-    # else, considers just the folder in the path given (the pov folder)
-    image_folder_list = [folder]
-
-for image_folder in image_folder_list:
-    # iterates through pov folders
-    folder_names = image_folder.split("/")
+def read_frame(image_path, scale):
+    """
+    Decodes an image, downscaling it if needed
+
+    :param image_path: os.path
+    :param scale: float
+        Scale factor applied to the image. Eg: 0.5 for half resolution
+    :return: ndarray
+    """
+    frame = cv2.imread(image_path)
+    if scale != 1:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def prefetch(function, args_list, threads):
+    """
+    Calls the function with each set of arguments in a thread pool, ahead of the consumer. Results wait in a bounded
+    queue, so that at most 2 * threads results are kept in memory. Used to decode images ahead of the encoder
+
+    :param function: callable
+    :param args_list: list
+        Arguments of each call
+    :param threads: int
+        Number of threads
+    :return: generator
+        Results, in the same order as args_list
+    """
+    with ThreadPoolExecutor(threads) as executor:
+        pending_results = deque()
+        for args in args_list:
+            pending_results.append(executor.submit(function, *args))
+            if len(pending_results) >= 2 * threads:
+                yield pending_results.popleft().result()
+
+        while pending_results:
+            yield pending_results.popleft().result()
+
+
+def read_tile(image_path, tile_size):
+    """
+    Decodes an image and resizes it to the size of a mosaic tile. Missing images are replaced by black tiles
+
+    :param image_path: os.path
+    :param tile_size: tuple
+        (width, height) of the tile
+    :return: ndarray
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        return np.zeros((tile_size[1], tile_size[0], 3), dtype=np.uint8)
+    return cv2.resize(image, tile_size, interpolation=cv2.INTER_AREA)
+
+
+def read_mosaic_frame(image_folder, frame, tile_size, semantic, cav_ids):
+    """
+    Builds the mosaic of a frame: the four RGB cameras side by side, the four semantic cameras below them if semantic
+    is True, and the top-down view of the annotations on the right
+
+    :param image_folder: os.path
+        Path to the pov folder
+    :param frame: str
+        Frame number. Eg: 000060
+    :param tile_size: tuple
+        (width, height) of each camera tile
+    :param semantic: boolean
+    :param cav_ids: list
+        Ids of the CAVs, highlighted in the top-down view
+    :return: ndarray
+    """
+    image_types = ["camera", "semantic"] if semantic else ["camera"]
+    rows = [np.hstack([read_tile(os.path.join(image_folder, f"{frame}_{image_type}{i}.png"), tile_size)
+                       for i in range(4)])
+            for image_type in image_types]
+    cameras = np.vstack(rows)
+
+    pov_yaml = load_yaml(os.path.join(image_folder, f"{frame}.yaml"))
+    return np.hstack([cameras, draw_top_down(pov_yaml, cameras.shape[0], cav_ids=cav_ids)])
+
+
+def generate_video(image_folder, camera, scale=1, threads=4):
+    """
+    Generates the video of a camera of a POV
+
+    :param image_folder: os.path
+        Path to the pov folder. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s/109
+    :param camera: str
+        Index of the camera. Eg: 0 (front view)
+    :param scale: float
+        Scale factor applied to the frames
+    :param threads: int
+        Number of threads decoding the images
+    :return: str, int, float
+        Path of the video, number of frames and time taken to generate it
+    """
+    t0 = time.time()
+    folder_names = image_folder.rstrip("/").split("/")
     parent_folder = f"videos/{folder_names[-3]}"
-    if not os.path.exists(parent_folder):
-        os.makedirs(parent_folder)
+    os.makedirs(parent_folder, exist_ok=True)
+
+    video_name = f"{parent_folder}/{folder_names[-2]}_{folder_names[-1]}_cam{camera}.mp4"
+    image_file_suffix = f"_camera{camera}.png"
 
-    if opt.camera is not None:
-        # if camera argument has been given, considers the images for the chosen camera
-        video_name = f"{parent_folder}/{folder_names[-2]}_{folder_names[-1]}_cam{str(opt.camera)}.mp4"
-        image_file_suffix = f"_camera{str(opt.camera)}.png"
+    # all images within the current folder that relate to the chosen camera, from the manifest of the pov if it has one
+    manifest = load_manifest(image_folder)
+    if manifest is not None:
+        images = get_manifest_files(manifest, image_file_suffix)
     else:
-        # otherwise, considers only the images for the frontal camera (cam0)
-        video_name = f"{parent_folder}/{folder_names[-2]}_{folder_names[-1]}_cam0.mp4"
-        image_file_suffix = "_camera0.png"
+        images = sorted(img for img in os.listdir(image_folder) if img.endswith(image_file_suffix))
+    if not images:
+        return video_name, 0, time.time() - t0
 
-    print(f"Generating {video_name}...")
-    file_list = os.listdir(image_folder)
-    file_list.sort()
+    video = None
+    for frame in prefetch(read_frame, [(os.path.join(image_folder, image), scale) for image in images], threads):
+        if video is None:
+            height, width, layers = frame.shape
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # mp4 videos have lower file size without compromising on quality
+            video = cv2.VideoWriter(video_name, fourcc, 10, (width, height))  # video created at 10 fps
+        video.write(frame)
 
-    # list comprehension for all images within the current folder that relate to the chosen camera
-    images = [img for img in file_list if img.endswith(image_file_suffix)]
-    frame = cv2.imread(os.path.join(image_folder, images[0]))
-    height, width, layers = frame.shape
+    video.release()
+    return video_name, len(images), time.time() - t0
+
+
+def generate_mosaic_video(image_folder, scale=0.25, threads=4, semantic=False):
+    """
+    Generates the mosaic video of a POV, with all its cameras and the top-down view of its annotations, in a single
+    pass over the frames
+
+    :param image_folder: os.path
+        Path to the pov folder. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s/109
+    :param scale: float
+        Scale factor applied to each camera
+    :param threads: int
+        Number of threads building the frames of the mosaic
+    :param semantic: boolean
+        Adds the semantic cameras to the mosaic
+    :return: str, int, float
+        Path of the video, number of frames and time taken to generate it
+    """
+    t0 = time.time()
+    folder_names = image_folder.rstrip("/").split("/")
+    parent_folder = f"videos/{folder_names[-3]}"
+    os.makedirs(parent_folder, exist_ok=True)
+    video_name = f"{parent_folder}/{folder_names[-2]}_{folder_names[-1]}_mosaic.mp4"
+
+    scenario_path = os.path.dirname(image_folder.rstrip("/"))
+    frames = [yaml_frame.split(".")[0] for yaml_frame in get_yaml_frames(scenario_path, folder_names[-1])]
+    if not frames:
+        return video_name, 0, time.time() - t0
 
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # mp4 videos have lower file size without compromising on quality
-    video = cv2.VideoWriter(video_name, fourcc, 10, (width, height))  # video created at 10 fps
+    # tiles keep the aspect ratio of the cameras
+    height, width = cv2.imread(os.path.join(image_folder, f"{frames[0]}_camera0.png")).shape[:2]
+    tile_size = (round(width * scale), round(height * scale))
+    data_protocol = load_yaml(os.path.join(scenario_path, "data_protocol.yaml"))
+    cav_ids = get_cav_ids(get_pov_ids(scenario_path), data_protocol)
 
-    # iterate through images, writing the frames to the video
-    for image in images:
-        video.write(cv2.imread(os.path.join(image_folder, image)))
+    video = None
+    for mosaic in prefetch(read_mosaic_frame, [(image_folder, frame, tile_size, semantic, cav_ids) for frame in frames],
+                           threads):
+        if video is None:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            video = cv2.VideoWriter(video_name, fourcc, 10, (mosaic.shape[1], mosaic.shape[0]))  # 10 fps
+        video.write(mosaic)
 
-    cv2.destroyAllWindows()
     video.release()
+    return video_name, len(frames), time.time() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Video generator.")
+    parser.add_argument('-p', "--path", required=True, type=str,
+                        help='Path to pov object from current folder, or, if "all" is used, to the parent folder '
+                             'containing the folders of all objects. Eg: data_dumping/2024_06_14_12_47_41/ui_cd_s/109 '
+                             'or, if "all" is used, data_dumping/2024_06_14_12_47_41/ui_cd_s')
+    parser.add_argument('-a', "--all", type=bool, help='Boolean to record the videos of all POVs at once.')
+    parser.add_argument('-c', "--camera", type=str, nargs="+", default=["0"],
+                        help='Camera 0 (front view) is standard, but if needed, this can be changed here. Multiple '
+                             'cameras may be given. Eg: 2 or 0 1 2 3')
+    parser.add_argument('-s', "--scale", type=float,
+                        help='Scale factor applied to the frames, for quicker previews. Eg: 0.5 for half resolution. '
+                             'Defaults to 1, or to 0.25 for the cameras of mosaic videos')
+    parser.add_argument('-m', "--mosaic", type=bool,
+                        help='Boolean to generate a single mosaic video per POV, with its four RGB cameras and the '
+                             'top-down view of its annotations, instead of one video per camera.')
+    parser.add_argument("--semantic", type=bool,
+                        help='Boolean to add the semantic cameras to mosaic videos.')
+    parser.add_argument('-j', "--jobs", type=int,
+                        help='Number of videos generated in parallel. Defaults to the number of CPUs.')
+    parser.add_argument('-t', "--threads", type=int, default=4,
+                        help='Number of threads decoding the images of each video.')
+    opt = parser.parse_args()
+
+    folder = opt.path
+    if not os.path.exists(folder):
+        print("Path not found.")
+        exit(1)
+
+    if opt.all:
+        # if all flag is active, lists all folders in the path given, generating videos for all povs
+        image_folder_list = [folder[0] for folder in os.walk(folder)]
+        image_folder_list.pop(0)
+    else:
+        # else, considers just the folder in the path given (the pov folder)
+        image_folder_list = [folder]
+
+    if opt.mosaic:
+        # one job per pov
+        video_function = generate_mosaic_video
+        jobs = [(image_folder, opt.scale or 0.25, opt.threads, bool(opt.semantic))
+                for image_folder in image_folder_list]
+    else:
+        # one job per pov and camera
+        video_function = generate_video
+        jobs = [(image_folder, camera, opt.scale or 1, opt.threads)
+                for image_folder in image_folder_list
+                for camera in opt.camera]
+
+    if not jobs:
+        print("No POV folders or cameras found in the path given.")
+        exit(1)
+
+    t0 = time.time()
+    print(f"Generating {len(jobs)} videos...")
+    with Pool(min(opt.jobs or os.cpu_count(), len(jobs))) as pool:
+        results = [pool.apply_async(video_function, job) for job in jobs]
+        for result in results:
+            video_name, num_frames, video_time = result.get()
+            print(f"{video_name}: {num_frames} frames in {video_time:.2f}s")
 
-print("All videos generated.")
+    print(f"All videos generated in {time.time() - t0:.2f}s.")
@@ -12,6 +12,7 @@ from Dataset.Configs.enums.weather import Weather, WeatherAbbreviations
 from Dataset.Configs.enums.scenarios import Scenarios, ScenarioAbbreviations
 from Dataset.Configs.enums.density import Density, DensityAbbreviations
 from Dataset.Scripts.utils.getters import get_label_from_config
+from Dataset.Scripts.utils.summary import is_summary_up_to_date
 
 
 def arg_parse():
@@ -43,6 +44,13 @@ def arg_parse():
                              "of the simulation. Y/N.")
     parser.add_argument("-m", "--summary", type=bool,
                         help="Generate summary of simulation right after its run. Y/N.")
+    parser.add_argument("-p", "--preview", type=bool,
+                        help="Encode a downscaled preview video of each POV\'s main camera during the simulation, "
+                             "saved to the videos folder. Y/N.")
+    parser.add_argument("-r", "--replay", type=bool,
+                        help="Record the traffic of the first weather condition simulated for each road configuration "
+                             "and density, replaying it on the other weather conditions instead of simulating it "
+                             "again. Y/N.")
 
     # parse the arguments and return the result
     opt = parser.parse_args()
@@ -131,6 +139,8 @@ def load_simulation_configs(arg):
 
         simulation_configs.extend(simulation_config)
 
+    # simulations are already grouped by town by the order of the Scenarios enum, so that consecutive simulations may
+    # reuse the world loaded by the server
     simulation_configs[0] = add_current_time(simulation_configs[0])
 
     return simulation_configs
@@ -264,7 +274,9 @@ if __name__ == "__main__":
     # initialize variables
     starting_time = simulation_configs[0]["current_time"]
     times = []
+    # simulations run since Carla was last started, and the town of the last one
     counter = 0
+    previous_town = None
 
     # initialize carla and get the user info
     carla12_user = init_carla()
@@ -272,10 +284,20 @@ if __name__ == "__main__":
     # iterates through simulations
     for simulation_config in simulation_configs:
         counter += 1
-        if counter % 8 == 0:  # restarts carla every 8 simulations
+        # restarts carla every restart_every simulations, waiting for the town to change so that simulations of the
+        # same town reuse the loaded world, but never reuses it for more than max_simulations simulations
+        server_config = simulation_config["carla_server"]
+        if (counter > server_config["restart_every"] and simulation_config["town"] != previous_town) or \
+                counter > server_config["max_simulations"]:
             restart_carla(carla12_user)
+            counter = 1
+        previous_town = simulation_config["town"]
 
         simulation_config["current_time"] = starting_time
+        if arg.replay:
+            simulation_config["replay"]["enabled"] = True
+        if arg.preview:
+            simulation_config["preview"]["enabled"] = True
         # saves current config as a temporary file so that yaml address is always the same
         save_yaml(simulation_config, "temp_config.yaml")
         label = get_label_from_config(simulation_config)
@@ -295,11 +317,14 @@ if __name__ == "__main__":
                 if time.time() - t0 > 60:
                     break
                 else:
-                    # if walker spawning error occurs, restarts Carla and try again, up to 5 times
+                    # if walker spawning error occurs, tries again, up to 5 times. The first retry reuses the loaded
+                    # world, which is cleared by the scenario runner, and the next ones restart Carla
                     attempts += 1
                     print(f"Error spawning walkers on {label} scenario. Attempt #{attempts}")
                     print("-"*50)
-                    restart_carla(carla12_user)
+                    if attempts > 1:
+                        restart_carla(carla12_user)
+                        counter = 1
 
             path_opt = "-p" + "data_dumping/" + starting_time + "/" + label
 
@@ -307,7 +332,9 @@ if __name__ == "__main__":
                 print("#####")
                 p = subprocess.run(["python", "generate_video.py", path_opt, "-a y"], env=os.environ)
 
-            if arg.summary:
+            # the summary is saved by the scenario runner, so it is only generated here if the run did not save it
+            scenario_path = os.path.join("data_dumping", starting_time, label)
+            if arg.summary and not is_summary_up_to_date(scenario_path):
                 print("#####")
                 p = subprocess.run(["python", "generate_summary.py", path_opt], env=os.environ)
 
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from Dataset.Scripts.utils.projection import get_2d_boxes, get_box_corners_3d, project_to_cameras
+
+WIDTH, HEIGHT = 1920, 1080
+# CARLA's intrinsic matrix of a 1920x1080 camera with a 90 degree field of view
+INTRINSIC = np.array([[960.0, 0.0, 960.0], [0.0, 960.0, 540.0], [0.0, 0.0, 1.0]])
+
+
+def get_boxes(locations):
+    """
+    2D boxes of cars at the given locations, seen from a front camera at the origin of the world
+    """
+    objects = {i: {"location": location, "angle": [0.0, 0.0, 0.0], "extent": [2.4, 1.0, 0.75]}
+               for i, location in enumerate(locations)}
+    corners = get_box_corners_3d(objects)
+    pixels, depth = project_to_cameras(corners.reshape(-1, 3), np.eye(4)[None], INTRINSIC[None])
+    return corners, get_2d_boxes(pixels.reshape(1, -1, 8, 2), depth.reshape(1, -1, 8), WIDTH, HEIGHT)
+
+
+def test_box_in_front_of_camera():
+    corners, (boxes, in_frustum, truncation) = get_boxes([[20.0, 1.0, 0.0]])
+
+    # all corners are in front of the camera, the box is their bounding rectangle
+    u = 960 + 960 * corners[0, :, 1] / corners[0, :, 0]
+    v = 540 - 960 * corners[0, :, 2] / corners[0, :, 0]
+    assert boxes[0, 0] == pytest.approx([u.min(), v.min(), u.max(), v.max()])
+    assert in_frustum[0, 0] and truncation[0, 0] == pytest.approx(0.0)
+
+
+def test_box_crossing_camera_plane():
+    _, (boxes, in_frustum, truncation) = get_boxes([[0.5, 3.0, 0.0]])
+
+    # the car is alongside the camera, so its box reaches the right border and spans the whole image height
+    assert boxes[0, 0] == pytest.approx([960 + 960 * 2.0 / 2.9, 0.0, WIDTH, HEIGHT])
+    assert in_frustum[0, 0] and truncation[0, 0] > 0.9
+
+
+def test_box_behind_camera():
+    _, (boxes, in_frustum, truncation) = get_boxes([[-10.0, 0.0, 0.0]])
+
+    assert not in_frustum[0, 0]
+    assert boxes[0, 0] == pytest.approx([0.0, 0.0, 0.0, 0.0]) and truncation[0, 0] == 1.0
@@ -0,0 +1,251 @@
+import enum
+import importlib
+import pickle
+import sys
+import types
+import pytest
+
+
+def make_fake_carla():
+    """
+    Stand-in for the parts of the carla module used by ReplayManager, whose commands only hold their arguments
+    """
+    carla = types.ModuleType("carla")
+
+    class Struct:
+        def __init__(self, *args, **kwargs):
+            self.args = args
+            self.__dict__.update(kwargs)
+
+    class Location(Struct):
+        pass
+
+    class Rotation(Struct):
+        pass
+
+    class Vector3D(Struct):
+        pass
+
+    class WalkerControl(Struct):
+        pass
+
+    class Transform:
+        def __init__(self, location, rotation):
+            self.location = location
+            self.rotation = rotation
+
+    class VehicleLightState(enum.IntFlag):
+        NONE = 0
+        Position = 1
+        LowBeam = 2
+        HighBeam = 4
+        Brake = 8
+        Fog = 64
+
+    class SpawnActor:
+        def __init__(self, blueprint, transform):
+            self.blueprint = blueprint
+            self.transform = transform
+            self.then_commands = []
+
+        def then(self, command):
+            self.then_commands.append(command)
+            return self
+
+    def command(name, *fields):
+        def __init__(self, *args):
+            for field, value in zip(fields, args):
+                setattr(self, field, value)
+        return type(name, (), {"__init__": __init__})
+
+    carla.Location, carla.Rotation, carla.Transform = Location, Rotation, Transform
+    carla.Vector3D, carla.WalkerControl, carla.VehicleLightState = Vector3D, WalkerControl, VehicleLightState
+    carla.TrafficLightState = types.SimpleNamespace(values={0: "Red", 1: "Yellow", 2: "Green"})
+    carla.command = types.SimpleNamespace(
+        SpawnActor=SpawnActor,
+        FutureActor=object(),
+        SetSimulatePhysics=command("SetSimulatePhysics", "actor_id", "enabled"),
+        ApplyTransform=command("ApplyTransform", "actor_id", "transform"),
+        ApplyWalkerControl=command("ApplyWalkerControl", "actor_id", "control"),
+        SetVehicleLightState=command("SetVehicleLightState", "actor_id", "light_state")
+    )
+    return carla
+
+
+class FakeActor:
+    def __init__(self, actor_id, type_id, location=(0.0, 0.0, 0.0)):
+        self.id = actor_id
+        self.type_id = type_id
+        self.location = types.SimpleNamespace(x=location[0], y=location[1], z=location[2])
+        self.physics = True
+        self.frozen = False
+        self.state = None
+
+    def set_simulate_physics(self, enabled):
+        self.physics = enabled
+
+    def get_transform(self):
+        return types.SimpleNamespace(location=self.location)
+
+    def freeze(self, frozen):
+        self.frozen = frozen
+
+    def set_state(self, state):
+        self.state = state
+
+
+class FakeActorList(list):
+    def filter(self, pattern):
+        prefix = pattern.rstrip("*")
+        return FakeActorList(actor for actor in self if actor.type_id.startswith(prefix))
+
+    def find(self, actor_id):
+        return next((actor for actor in self if actor.id == actor_id), None)
+
+
+class FakeBlueprint:
+    def __init__(self, type_id):
+        self.type_id = type_id
+
+    def has_attribute(self, key):
+        return False
+
+
+class FakeWorld:
+    def __init__(self, actors):
+        self.actors = FakeActorList(actors)
+
+    def get_actors(self, actor_ids=None):
+        if actor_ids is None:
+            return self.actors
+        return FakeActorList(actor for actor in self.actors if actor.id in actor_ids)
+
+    def get_blueprint_library(self):
+        return types.SimpleNamespace(find=FakeBlueprint)
+
+
+class FakeClient:
+    """
+    Records the batches sent by the ReplayManager. Spawned actors get new ids, and blueprints listed in failing_types
+    fail to spawn
+    """
+    def __init__(self, world, failing_types=()):
+        self.world = world
+        self.failing_types = failing_types
+        self.batches = []
+        self.next_id = 1000
+
+    def apply_batch_sync(self, batch, do_tick):
+        self.batches.append(batch)
+        responses = []
+        for command in batch:
+            if not hasattr(command, "blueprint"):
+                responses.append(types.SimpleNamespace(error="", actor_id=0))
+            elif command.blueprint.type_id in self.failing_types:
+                responses.append(types.SimpleNamespace(error="Spawn failed because of collision", actor_id=0))
+            else:
+                self.next_id += 1
+                self.world.actors.append(FakeActor(self.next_id, command.blueprint.type_id))
+                responses.append(types.SimpleNamespace(error="", actor_id=self.next_id))
+        return responses
+
+
+@pytest.fixture
+def carla(monkeypatch):
+    try:
+        import carla as carla_module
+    except ImportError:
+        carla_module = make_fake_carla()
+        monkeypatch.setitem(sys.modules, "carla", carla_module)
+    return carla_module
+
+
+@pytest.fixture
+def replay_manager_module(carla):
+    return importlib.reload(importlib.import_module("Dataset.Scripts.managers.ReplayManager"))
+
+
+def make_trace(carla):
+    brake = int(carla.VehicleLightState.Brake)
+    low_beam = int(carla.VehicleLightState.LowBeam)
+    actors = {
+        10: {"type_id": "vehicle.tesla.model3", "attributes": {}, "walker": False, "cav_index": 0},
+        11: {"type_id": "vehicle.audi.a2", "attributes": {}, "walker": False, "cav_index": None},
+        12: {"type_id": "walker.pedestrian.0001", "attributes": {}, "walker": True, "cav_index": None},
+        13: {"type_id": "vehicle.broken.car", "attributes": {}, "walker": False, "cav_index": None}
+    }
+    ticks = []
+    for tick in range(2):
+        ticks.append({
+            "actors": {
+                10: [1.0 + tick, 2.0, 0.0, 0.0, 90.0, 0.0, 3.0, 4.0, 0.0, low_beam],
+                # brakes on the second tick only
+                11: [5.0, 6.0 + tick, 0.0, 0.0, 0.0, 0.0, 0.0, 10.0, 0.0, low_beam | (brake if tick else 0)],
+                12: [7.0, 8.0, 0.0, 0.0, 0.0, 0.0, 0.6, 0.8, 0.0, -1],
+                13: [9.0, 9.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
+            },
+            "traffic_lights": {"100.0_200.0": 2 - tick},
+            "povs": [{"plan_trajectory": [[tick, 0, 0]], "gnss_imu": {"tick": tick}}]
+        })
+    return {"actors": actors, "ticks": ticks}
+
+
+def test_replay_trace(tmp_path, carla, replay_manager_module):
+    trace_path = tmp_path / "trace.pkl"
+    with open(trace_path, "wb") as outfile:
+        pickle.dump(make_trace(carla), outfile)
+
+    cav = FakeActor(1, "vehicle.tesla.model3")
+    traffic_light = FakeActor(2, "traffic.traffic_light", (100.0, 200.0, 0.0))
+    world = FakeWorld([cav, traffic_light])
+    client = FakeClient(world, failing_types=("vehicle.broken.car",))
+
+    replay_manager = replay_manager_module.ReplayManager(str(trace_path), world, client)
+    assert replay_manager.replaying
+    replay_manager.start_replay([types.SimpleNamespace(vehicle=cav)])
+    assert not cav.physics and traffic_light.frozen
+
+    fog = carla.VehicleLightState.LowBeam | carla.VehicleLightState.Brake | carla.VehicleLightState.Fog
+    replays, traffic_light_states = [], []
+    while not replay_manager.finished:
+        replays.append(replay_manager.replay_step(carla.VehicleLightState(fog)))
+        traffic_light_states.append(traffic_light.state)
+
+    # the spawn batch, then one command batch per tick. Actors that fail to spawn are only attempted once
+    spawn_batch = client.batches[0]
+    assert [command.blueprint.type_id for command in spawn_batch] == \
+        ["vehicle.audi.a2", "walker.pedestrian.0001", "vehicle.broken.car"]
+    # walkers are teleported as vehicles are, so all actors are spawned without physics
+    for command in spawn_batch:
+        assert [(type(then).__name__, then.enabled) for then in command.then_commands] == \
+            [("SetSimulatePhysics", False)]
+    assert len(client.batches) == 3
+    background_id, walker_id = world.actors[2].id, world.actors[3].id
+
+    for tick, (povs, speeds) in enumerate(replays):
+        batch = client.batches[tick + 1]
+        transforms = {command.actor_id: command.transform for command in batch if hasattr(command, "transform")}
+        assert set(transforms) == {cav.id, background_id, walker_id}
+        assert transforms[cav.id].location.x == 1.0 + tick
+        assert transforms[background_id].location.y == 6.0 + tick
+        assert (transforms[walker_id].location.x, transforms[walker_id].location.y) == (7.0, 8.0)
+
+        # the walker control only drives the animation, and is applied before the recorded transform
+        walker_commands = [command for command in batch if command.actor_id == walker_id]
+        assert [type(command).__name__ for command in walker_commands] == ["ApplyWalkerControl", "ApplyTransform"]
+        control = walker_commands[0].control
+        assert control.speed == pytest.approx(1.0)
+        assert (control.direction.x, control.direction.y) == (pytest.approx(0.6), pytest.approx(0.8))
+
+        lights = {command.actor_id: int(command.light_state) for command in batch
+                  if hasattr(command, "light_state")}
+        weather_lights = int(carla.VehicleLightState.LowBeam | carla.VehicleLightState.Fog)
+        assert lights[cav.id] == weather_lights
+        # recorded brake lights are kept, and not turned on by the weather
+        expected_brake = int(carla.VehicleLightState.Brake) if tick else 0
+        assert lights[background_id] == weather_lights | expected_brake
+
+        assert speeds == {cav.id: pytest.approx(18.0), background_id: pytest.approx(36.0),
+                          walker_id: pytest.approx(3.6)}
+        assert povs == [{"plan_trajectory": [[tick, 0, 0]], "gnss_imu": {"tick": tick}, "speeds": speeds}]
+        assert traffic_light_states[tick] == carla.TrafficLightState.values[2 - tick]
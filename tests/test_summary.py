@@ -0,0 +1,81 @@
+import os
+import yaml
+from generate_summary import generate_summaries
+from Dataset.Scripts.utils.summary import SummaryAggregator, is_summary_up_to_date, load_yaml
+
+EXPECTED_SUMMARY = os.path.join(os.path.dirname(__file__), "data", "summary.yaml")
+
+# two RSUs and three CAVs, the one with the lowest id being the ego
+RSU_IDS = [-1, -2]
+CAV_IDS = [100, 105, 110]
+
+
+def make_data_protocol():
+    return {
+        "dataset_config": {"scenario": "ui_cd_s", "weather": "heavy_fog_night", "density": "dense"},
+        "scenario": {"rsu_list": [{"id": rsu_id} for rsu_id in RSU_IDS],
+                     "single_cav_list": [{"id": i} for i in range(len(CAV_IDS))],
+                     "num_vehicles": 3, "num_walkers": 10},
+        "density": {"vehicle_multiplier": 1.5, "walker_multiplier": 2.0}
+    }
+
+
+def make_pov_yaml(pov_id, frame):
+    """
+    Ground truths of a POV for a frame. POVs see overlapping sets of objects, whose values differ between POVs so that
+    the merge order shows in the summary. The other CAVs are annotated as vehicles, and the ego sees no walkers on odd
+    frames
+    """
+    is_rsu = pov_id < 0
+    step = frame - 60
+    vehicles = {cav_id: {"class": "car", "speed": 20.0 + step, "dist": 5.0, "relative_angle": 10.0}
+                for cav_id in CAV_IDS if cav_id != pov_id}
+    first_vehicle = 200 + abs(pov_id) % 3
+    for vehicle_id in range(first_vehicle, first_vehicle + 3):
+        vehicles[vehicle_id] = {"class": ["car", "van", "truck"][vehicle_id % 3],
+                                "speed": float(vehicle_id % 7 + pov_id % 5 + step),
+                                "dist": float(vehicle_id - 190 + abs(pov_id) % 4),
+                                "relative_angle": float(pov_id + vehicle_id)}
+    pov_yaml = {"RSU": is_rsu, "ego_speed": 0.0 if is_rsu else float(pov_id % 50 + step), "vehicles": vehicles}
+    if is_rsu or pov_id != CAV_IDS[0] or frame % 2 == 0:
+        pov_yaml["walkers"] = {300 + abs(pov_id) % 2 + i: {"speed": 1.0 + i + step, "dist": 30.0 + i,
+                                                            "relative_angle": -45.0 + i}
+                               for i in range(2)}
+    return pov_yaml
+
+
+def make_scenario(path, frames=(60, 61, 62)):
+    os.makedirs(path)
+    with open(os.path.join(path, "data_protocol.yaml"), "w") as outfile:
+        yaml.dump(make_data_protocol(), outfile)
+    for pov_id in RSU_IDS + CAV_IDS:
+        os.makedirs(os.path.join(path, str(pov_id)))
+        for frame in frames:
+            with open(os.path.join(path, str(pov_id), "%06d.yaml" % frame), "w") as outfile:
+                yaml.dump(make_pov_yaml(pov_id, frame), outfile)
+
+
+def test_generate_summaries(tmp_path):
+    path = str(tmp_path / "ui_cd_s")
+    make_scenario(path)
+
+    generate_summaries([path], processes=1)
+
+    assert load_yaml(os.path.join(path, "summary.yaml")) == load_yaml(EXPECTED_SUMMARY)
+    assert is_summary_up_to_date(path)
+
+
+def test_summary_aggregator(tmp_path):
+    path = str(tmp_path / "ui_cd_s")
+    make_scenario(path)
+
+    aggregator = SummaryAggregator(path, make_data_protocol())
+    aggregator.pov_ids = sorted(str(pov_id) for pov_id in RSU_IDS + CAV_IDS)
+    # POVs dump their frames in any order, and frames not dumped by all POVs are left out
+    for frame in [60, 61, 62, 63]:
+        for pov_id in reversed(CAV_IDS + RSU_IDS[:1 if frame == 63 else None]):
+            aggregator.add(pov_id, frame, make_pov_yaml(pov_id, frame))
+    aggregator.save()
+
+    assert load_yaml(os.path.join(path, "summary.yaml")) == load_yaml(EXPECTED_SUMMARY)
+    assert is_summary_up_to_date(path)